@@ -22,16 +22,37 @@ Usage:
 4. Start Flask app: python cds-api-service.py
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import cdsapi
+import requests
 import os
+import sys
 import json
+import time
+import base64
+import sqlite3
 import uuid
+import shutil
+import calendar
+import hashlib
+import heapq
+import itertools
+import threading
+import importlib.util
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import Future, as_completed
 from celery import Celery
+from celery.signals import task_postrun
 import logging
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -51,8 +72,606 @@ app.config['CELERY_RESULT_BACKEND'] = os.environ.get('REDIS_URL', 'redis://local
 celery = Celery(app.name, broker=app.config['CELERY_BROKER_URL'])
 celery.conf.update(app.config)
 
-# In-memory job storage (use Redis/database in production)
-jobs = {}
+# Completed downloads cached by canonical request key, evicted least recently used
+ERA5_CACHE_DIR = os.environ.get('ERA5_CACHE_DIR', '/tmp/era5_cache')
+ERA5_CACHE_MAX_BYTES = int(os.environ.get('ERA5_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+_era5_cache_lock = threading.Lock()
+
+# Downloads: optional offload to nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile)
+ERA5_ACCEL_REDIRECT_PREFIX = os.environ.get('ERA5_ACCEL_REDIRECT_PREFIX')
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+SUBSET_FORMATS = {'netcdf': ('.nc', 'application/x-netcdf'), 'binary': ('.bin', 'application/octet-stream')}
+
+# Large requests are split into sub-requests ("chunks") by month and/or variable;
+# each worker process retrieves up to ERA5_CHUNK_CONCURRENCY chunks at once across all jobs
+# (per Celery process: prefork children each get their own scheduler)
+ERA5_CHUNK_BY = os.environ.get('ERA5_CHUNK_BY', 'month,variable')
+ERA5_CHUNK_CONCURRENCY = int(os.environ.get('ERA5_CHUNK_CONCURRENCY', 4))
+ERA5_CHUNK_RETRIES = int(os.environ.get('ERA5_CHUNK_RETRIES', 3))
+ERA5_CHUNK_RETRY_DELAY = float(os.environ.get('ERA5_CHUNK_RETRY_DELAY', 30))
+
+# CDS access: credentials (cdsapi falls back to CDSAPI_URL/CDSAPI_KEY and ~/.cdsapirc),
+# the transport used for retrievals and how long a /api/cds/status probe is reused
+CDS_API_URL = os.environ.get('CDS_API_URL')
+CDS_API_KEY = os.environ.get('CDS_API_KEY')
+CDS_TRANSPORT = os.environ.get('CDS_TRANSPORT', 'cdsapi')
+CDS_STATUS_TTL = float(os.environ.get('CDS_STATUS_TTL', 60))
+CDS_PROBE_TIMEOUT = float(os.environ.get('CDS_PROBE_TIMEOUT', 10))
+
+# Shared job store: SQLite by default, or Redis when JOB_STORE_URL is redis://...
+JOB_STORE_URL = os.environ.get('JOB_STORE_URL', 'sqlite:////tmp/era5_jobs.db')
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 30 * 24 * 3600))
+JOB_CLEANUP_INTERVAL = int(os.environ.get('JOB_CLEANUP_INTERVAL', 3600))
+JOB_PAGE_SIZE = 50
+JOB_MAX_PAGE_SIZE = 500
+ACTIVE_STATUSES = ('queued', 'running')
+TERMINAL_STATUSES = ('completed', 'failed')
+
+def _created_ts(job):
+    return datetime.fromisoformat(job['createdAt']).timestamp()
+
+def encode_job_cursor(created_ts, job_id):
+    """Opaque pagination cursor pointing just past a job"""
+    return base64.urlsafe_b64encode(f"{created_ts!r}|{job_id}".encode()).decode()
+
+def decode_job_cursor(cursor):
+    try:
+        created_ts, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return float(created_ts), job_id
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+class JobStore:
+    """
+    Job records shared between the Flask and Celery processes
+    
+    Jobs are JSON-serializable dicts keyed by 'id'. Backends must make update(),
+    add_follower() and claim_inflight() atomic across processes.
+    """
+    
+    def create(self, job):
+        raise NotImplementedError
+    
+    def get(self, job_id):
+        raise NotImplementedError
+    
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+    
+    def add_follower(self, primary_id, follower_id):
+        raise NotImplementedError
+    
+    def list(self, status=None, user_id=None, created_after=None, created_before=None,
+             cursor=None, limit=JOB_PAGE_SIZE):
+        raise NotImplementedError
+    
+    def claim_inflight(self, request_key, job_id):
+        raise NotImplementedError
+    
+    def release_inflight(self, request_key, job_id):
+        raise NotImplementedError
+    
+    def cleanup(self, ttl_seconds=None):
+        raise NotImplementedError
+    
+    def count_by_status(self):
+        """Return {status: number of stored jobs}"""
+        raise NotImplementedError
+    
+    def maybe_cleanup(self):
+        """Run cleanup at most once per JOB_CLEANUP_INTERVAL in this process"""
+        now = time.time()
+        if now - getattr(self, '_last_cleanup', 0) < JOB_CLEANUP_INTERVAL:
+            return 0
+        self._last_cleanup = now
+        return self.cleanup()
+
+class SQLiteJobStore(JobStore):
+    """Job store in a single SQLite file (WAL mode, one connection per thread)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                user_id TEXT,
+                created_ts REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_ts, id);
+            CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_ts, id);
+            CREATE INDEX IF NOT EXISTS jobs_user_created ON jobs (user_id, created_ts, id);
+            CREATE TABLE IF NOT EXISTS inflight (
+                request_key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL
+            );
+        """)
+    
+    def _conn(self):
+        # Connections can't cross threads or forked worker processes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    def create(self, job):
+        self._conn().execute(
+            'INSERT INTO jobs (id, status, user_id, created_ts, data) VALUES (?, ?, ?, ?, ?)',
+            (job['id'], job['status'], job.get('userId'), _created_ts(job), json.dumps(job))
+        )
+        return job
+    
+    def get(self, job_id):
+        row = self._conn().execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def _modify(self, job_id, change):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            change(job)
+            conn.execute(
+                'UPDATE jobs SET status = ?, data = ? WHERE id = ?',
+                (job['status'], json.dumps(job), job_id)
+            )
+        return job
+    
+    def update(self, job_id, **fields):
+        return self._modify(job_id, lambda job: job.update(fields))
+    
+    def add_follower(self, primary_id, follower_id):
+        return self._modify(primary_id, lambda job: job.setdefault('followers', []).append(follower_id))
+    
+    def list(self, status=None, user_id=None, created_after=None, created_before=None,
+             cursor=None, limit=JOB_PAGE_SIZE):
+        clauses, params = [], []
+        if status:
+            clauses.append(f"status IN ({', '.join('?' * len(status))})")
+            params.extend(status)
+        if user_id:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        if created_after is not None:
+            clauses.append('created_ts >= ?')
+            params.append(created_after)
+        if created_before is not None:
+            clauses.append('created_ts < ?')
+            params.append(created_before)
+        if cursor:
+            clauses.append('(created_ts, id) < (?, ?)')
+            params.extend(decode_job_cursor(cursor))
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT data, created_ts, id FROM jobs {where} ORDER BY created_ts DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        
+        next_cursor = encode_job_cursor(rows[limit - 1][1], rows[limit - 1][2]) if len(rows) > limit else None
+        return [json.loads(row[0]) for row in rows[:limit]], next_cursor
+    
+    def claim_inflight(self, request_key, job_id):
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT i.job_id, j.status FROM inflight i LEFT JOIN jobs j ON j.id = i.job_id '
+                'WHERE i.request_key = ?', (request_key,)
+            ).fetchone()
+            if row and row[1] in ACTIVE_STATUSES:
+                return row[0]
+            conn.execute(
+                'INSERT OR REPLACE INTO inflight (request_key, job_id) VALUES (?, ?)',
+                (request_key, job_id)
+            )
+        return job_id
+    
+    def release_inflight(self, request_key, job_id):
+        self._conn().execute(
+            'DELETE FROM inflight WHERE request_key = ? AND job_id = ?', (request_key, job_id)
+        )
+    
+    def cleanup(self, ttl_seconds=None):
+        ttl_seconds = JOB_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        cutoff = (datetime.utcnow() - timedelta(seconds=ttl_seconds)).timestamp()
+        placeholders = ', '.join('?' * len(TERMINAL_STATUSES))
+        deleted = self._conn().execute(
+            f'DELETE FROM jobs WHERE created_ts < ? AND status IN ({placeholders})',
+            (cutoff,) + TERMINAL_STATUSES
+        ).rowcount
+        if deleted:
+            logger.info(f"Removed {deleted} jobs older than {ttl_seconds}s")
+        return deleted
+    
+    def count_by_status(self):
+        rows = self._conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+class RedisJobStore(JobStore):
+    """
+    Job store in Redis: one JSON string per job plus sorted-set indexes
+    (score = createdAt) over all jobs, each status and each user
+    """
+    
+    def __init__(self, url, prefix='era5'):
+        if redis is None:
+            raise RuntimeError('redis package is required for a redis:// JOB_STORE_URL')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+    
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+    
+    def _index_keys(self, job):
+        keys = [self._key('jobs', 'created'), self._key('jobs', 'status', job['status'])]
+        if job.get('userId'):
+            keys.append(self._key('jobs', 'user', job['userId']))
+        return keys
+    
+    def create(self, job):
+        score = _created_ts(job)
+        pipe = self.client.pipeline()
+        pipe.set(self._key('job', job['id']), json.dumps(job))
+        for key in self._index_keys(job):
+            pipe.zadd(key, {job['id']: score})
+        pipe.execute()
+        return job
+    
+    def get(self, job_id):
+        raw = self.client.get(self._key('job', job_id))
+        return json.loads(raw) if raw else None
+    
+    def _modify(self, job_id, change):
+        job_key = self._key('job', job_id)
+        result = {}
+        
+        def apply(pipe):
+            raw = pipe.get(job_key)
+            if raw is None:
+                result['job'] = None
+                return
+            job = json.loads(raw)
+            old_status = job['status']
+            change(job)
+            pipe.multi()
+            pipe.set(job_key, json.dumps(job))
+            if job['status'] != old_status:
+                pipe.zrem(self._key('jobs', 'status', old_status), job_id)
+                pipe.zadd(self._key('jobs', 'status', job['status']), {job_id: _created_ts(job)})
+            result['job'] = job
+        
+        # Optimistic transaction: retried if another process changes the job
+        self.client.transaction(apply, job_key)
+        return result['job']
+    
+    def update(self, job_id, **fields):
+        return self._modify(job_id, lambda job: job.update(fields))
+    
+    def add_follower(self, primary_id, follower_id):
+        return self._modify(primary_id, lambda job: job.setdefault('followers', []).append(follower_id))
+    
+    def list(self, status=None, user_id=None, created_after=None, created_before=None,
+             cursor=None, limit=JOB_PAGE_SIZE):
+        # Walk the most selective index newest first, filtering the rest here
+        if user_id:
+            index = self._key('jobs', 'user', user_id)
+        elif status and len(status) == 1:
+            index = self._key('jobs', 'status', status[0])
+        else:
+            index = self._key('jobs', 'created')
+        
+        high = f"({created_before!r}" if created_before is not None else '+inf'
+        low = repr(created_after) if created_after is not None else '-inf'
+        after = decode_job_cursor(cursor) if cursor else None
+        if after:
+            high = repr(after[0])
+        
+        jobs_page, offset, batch = [], 0, max(limit * 2, 100)
+        while len(jobs_page) <= limit:
+            members = self.client.zrevrangebyscore(index, high, low, start=offset, num=batch, withscores=True)
+            if not members:
+                break
+            offset += len(members)
+            
+            # Skip entries at or before the cursor (ties are ordered by id)
+            ids = [
+                (m.decode(), score) for m, score in members
+                if not after or (score, m.decode()) < after
+            ]
+            raws = self.client.mget([self._key('job', job_id) for job_id, _ in ids]) if ids else []
+            for (job_id, score), raw in zip(ids, raws):
+                if raw is None:
+                    continue
+                job = json.loads(raw)
+                if status and job['status'] not in status:
+                    continue
+                if user_id and job.get('userId') != user_id:
+                    continue
+                jobs_page.append((score, job))
+        
+        next_cursor = None
+        if len(jobs_page) > limit:
+            score, job = jobs_page[limit - 1]
+            next_cursor = encode_job_cursor(score, job['id'])
+        return [job for _, job in jobs_page[:limit]], next_cursor
+    
+    def claim_inflight(self, request_key, job_id):
+        inflight_key = self._key('inflight', request_key)
+        result = {}
+        
+        def claim(pipe):
+            current = pipe.get(inflight_key)
+            if current is not None:
+                raw = pipe.get(self._key('job', current.decode()))
+                if raw is not None and json.loads(raw)['status'] in ACTIVE_STATUSES:
+                    result['job_id'] = current.decode()
+                    return
+            pipe.multi()
+            pipe.set(inflight_key, job_id)
+            result['job_id'] = job_id
+        
+        self.client.transaction(claim, inflight_key)
+        return result['job_id']
+    
+    def release_inflight(self, request_key, job_id):
+        inflight_key = self._key('inflight', request_key)
+        
+        def release(pipe):
+            current = pipe.get(inflight_key)
+            pipe.multi()
+            if current is not None and current.decode() == job_id:
+                pipe.delete(inflight_key)
+        
+        self.client.transaction(release, inflight_key)
+    
+    def cleanup(self, ttl_seconds=None):
+        ttl_seconds = JOB_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        cutoff = (datetime.utcnow() - timedelta(seconds=ttl_seconds)).timestamp()
+        deleted = 0
+        for status in TERMINAL_STATUSES:
+            status_key = self._key('jobs', 'status', status)
+            expired = [m.decode() for m in self.client.zrangebyscore(status_key, '-inf', f"({cutoff!r}")]
+            for job_id in expired:
+                job = self.get(job_id)
+                pipe = self.client.pipeline()
+                pipe.delete(self._key('job', job_id))
+                pipe.zrem(status_key, job_id)
+                pipe.zrem(self._key('jobs', 'created'), job_id)
+                if job and job.get('userId'):
+                    pipe.zrem(self._key('jobs', 'user', job['userId']), job_id)
+                pipe.execute()
+                deleted += 1
+        if deleted:
+            logger.info(f"Removed {deleted} jobs older than {ttl_seconds}s")
+        return deleted
+    
+    def count_by_status(self):
+        statuses = ACTIVE_STATUSES + TERMINAL_STATUSES
+        pipe = self.client.pipeline()
+        for status in statuses:
+            pipe.zcard(self._key('jobs', 'status', status))
+        return dict(zip(statuses, pipe.execute()))
+
+def create_job_store(url=None):
+    """Build the job store for a sqlite:///path or redis://host URL"""
+    url = url or JOB_STORE_URL
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteJobStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported JOB_STORE_URL: {url}")
+
+job_store = create_job_store()
+
+# Job progress events for Server-Sent Events streams
+JOB_EVENTS_URL = os.environ.get('JOB_EVENTS_URL', app.config['CELERY_BROKER_URL'])
+JOB_EVENTS_HISTORY = int(os.environ.get('JOB_EVENTS_HISTORY', 500))
+JOB_EVENTS_HEARTBEAT = float(os.environ.get('JOB_EVENTS_HEARTBEAT', 15))
+
+class LocalJobEventBroker:
+    """
+    In-process event broadcaster, used when the worker runs in the API
+    process (eager Celery, development) or Redis is unavailable
+    
+    Each stream keeps its last JOB_EVENTS_HISTORY events so clients can
+    resume from a Last-Event-ID. Ids are global, increasing integers.
+    """
+    
+    def __init__(self, history=JOB_EVENTS_HISTORY, max_streams=10000):
+        self.history = history
+        self.max_streams = max_streams
+        self._streams = OrderedDict()
+        self._last_id = 0
+        self._cond = threading.Condition()
+    
+    def publish(self, streams, event):
+        with self._cond:
+            self._last_id += 1
+            for stream in streams:
+                entries = self._streams.pop(stream, None) or deque(maxlen=self.history)
+                entries.append((self._last_id, event))
+                self._streams[stream] = entries
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+            self._cond.notify_all()
+    
+    def latest_id(self, stream):
+        with self._cond:
+            entries = self._streams.get(stream)
+            return str(entries[-1][0]) if entries else '0'
+    
+    def read(self, stream, last_id, timeout):
+        """Wait up to timeout seconds for events after last_id; returns [(id, event)]"""
+        last_id = int(last_id)
+        
+        def pending():
+            entries = self._streams.get(stream, ())
+            return [(str(i), e) for i, e in entries if i > last_id]
+        
+        with self._cond:
+            events = pending()
+            if not events:
+                self._cond.wait(timeout)
+                events = pending()
+        return events
+
+class RedisJobEventBroker:
+    """
+    Event broadcaster over Redis streams, shared by the API and worker
+    processes; XREAD from the client's last id gives resumable delivery
+    """
+    
+    def __init__(self, url, prefix='era5:events', history=JOB_EVENTS_HISTORY):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.history = history
+    
+    def _key(self, stream):
+        return f"{self.prefix}:{stream}"
+    
+    def publish(self, streams, event):
+        payload = json.dumps(event)
+        pipe = self.client.pipeline(transaction=False)
+        for stream in streams:
+            pipe.xadd(self._key(stream), {'data': payload}, maxlen=self.history, approximate=True)
+            pipe.expire(self._key(stream), JOB_TTL_SECONDS)
+        pipe.execute()
+    
+    def latest_id(self, stream):
+        entries = self.client.xrevrange(self._key(stream), count=1)
+        return entries[0][0].decode() if entries else '0-0'
+    
+    def read(self, stream, last_id, timeout):
+        response = self.client.xread({self._key(stream): last_id}, block=int(timeout * 1000))
+        events = []
+        for _, entries in response or ():
+            for entry_id, fields in entries:
+                events.append((entry_id.decode(), json.loads(fields[b'data'])))
+        return events
+
+def create_job_event_broker(url=None):
+    """Build the event broker for a redis:// URL, or 'local' for in-process delivery"""
+    url = url or JOB_EVENTS_URL
+    if url != 'local' and redis is not None:
+        return RedisJobEventBroker(url)
+    if url != 'local':
+        logger.warning('redis package not installed, job events are only delivered in-process')
+    return LocalJobEventBroker()
+
+job_events = create_job_event_broker()
+
+def publish_job_event(job):
+    """Send a job's current state to its own stream and its user's stream"""
+    streams = [f"job:{job['id']}"]
+    if job.get('userId'):
+        streams.append(f"user:{job['userId']}")
+    try:
+        job_events.publish(streams, job)
+    except Exception as e:
+        # Progress events are best effort; the job store stays authoritative
+        logger.warning(f"Could not publish event for job {job['id']}: {e}")
+
+def _sse_message(data, event_id=None, event='job'):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def job_event_stream(stream, snapshot, last_event_id=None, until_done=False):
+    """
+    Generate an SSE stream: the current state (unless resuming), then events
+    as they are published, with comment heartbeats while idle
+    
+    Args:
+        stream (str): Broker stream name ('job:<id>' or 'user:<id>')
+        snapshot (callable): Returns the jobs to send before live events
+        last_event_id (str): Resume after this event id instead of sending a snapshot
+        until_done (bool): Close once a job reaches a terminal status
+    """
+    # Ask browsers to reconnect quickly; they resend the last id they saw
+    yield 'retry: 3000\n\n'
+    
+    cursor = last_event_id
+    if cursor is None:
+        # Take the position first so nothing published meanwhile is missed
+        cursor = job_events.latest_id(stream)
+        for job in snapshot():
+            yield _sse_message(job, cursor)
+            if until_done and job['status'] in TERMINAL_STATUSES:
+                return
+    
+    while True:
+        events = job_events.read(stream, cursor, JOB_EVENTS_HEARTBEAT)
+        if not events:
+            yield ': heartbeat\n\n'
+            continue
+        
+        for event_id, job in events:
+            cursor = event_id
+            yield _sse_message(job, event_id)
+            if until_done and job['status'] in TERMINAL_STATUSES:
+                return
+
+def sse_response(generator):
+    return Response(
+        stream_with_context(generator),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _load_grib_parser():
+    """Load grib-parser.py, which can't be imported by name because of the hyphen"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grib-parser.py')
+    spec = importlib.util.spec_from_file_location('grib_parser', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['grib_parser'] = module
+    spec.loader.exec_module(module)
+    return module
+
+# GRIB parsing, array stores and the /api/grib/* endpoints
+grib_parser = _load_grib_parser()
+grib_parser.create_grib_api_endpoint(app)
+
+# Shared with grib_parser, so /api/metrics reports GRIB and ERA5 series together
+metrics = grib_parser.metrics
+metrics.describe('era5_jobs', 'gauge', 'Stored ERA5 jobs by status')
+metrics.describe('era5_jobs_finished_total', 'counter', 'ERA5 download tasks finished by status')
+metrics.describe('era5_job_seconds', 'histogram', 'ERA5 download task duration by status')
+metrics.describe('era5_chunk_retries_total', 'counter', 'Failed CDS chunk attempts that were retried')
+metrics.describe('era5_transfer_bytes_total', 'counter', 'Bytes downloaded from CDS')
+metrics.describe('cds_probes_total', 'counter', 'CDS connectivity probes by result')
+metrics.describe('era5_served_bytes_total', 'counter', 'Bytes of ERA5 files and subsets served to clients')
+metrics.add_collector(
+    lambda: [('era5_jobs', {'status': status}, count) for status, count in job_store.count_by_status().items()]
+)
+
+@task_postrun.connect
+def flush_task_metrics(**kwargs):
+    """Publish a worker's metrics as each task ends instead of waiting for the next flush interval"""
+    metrics.flush()
 
 # ERA5 variable definitions
 ERA5_VARIABLES = {
@@ -86,80 +705,710 @@ ERA5_VARIABLES = {
     ]
 }
 
+def canonical_request_key(request_data):
+    """
+    Normalize an ERA5 request so equivalent requests share one key
+    (variable/time order, date formatting and area precision don't matter)
+    """
+    area = request_data['area']
+    canonical = {
+        'dataset': str(request_data['dataset']).strip().lower(),
+        'productType': str(request_data['productType']).strip().lower(),
+        'variables': sorted({str(v).strip() for v in request_data['variables']}),
+        'dateStart': datetime.fromisoformat(str(request_data['dateStart'])).date().isoformat(),
+        'dateEnd': datetime.fromisoformat(str(request_data['dateEnd'])).date().isoformat(),
+        'timeRange': sorted({str(t).strip() for t in request_data.get('timeRange', ['00:00'])}),
+        'area': [round(float(area[k]), 4) for k in ('north', 'west', 'south', 'east')],
+        'format': str(request_data['format']).strip().lower()
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+def _cache_path(request_key, file_format):
+    return os.path.join(ERA5_CACHE_DIR, f"{request_key}.{file_format}")
+
+def lookup_cached_download(request_key, file_format):
+    """Return the cached file for a request key (marking it recently used), or None"""
+    path = _cache_path(request_key, file_format)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+def evict_era5_cache(keep=()):
+    """
+    Remove least recently used cached downloads until the cache fits its quota
+    
+    Args:
+        keep (iterable): Paths that must not be evicted (e.g. chunks being merged)
+    """
+    keep = {os.path.basename(path) for path in keep}
+    with _era5_cache_lock:
+        try:
+            names = [n for n in os.listdir(ERA5_CACHE_DIR) if not n.startswith('.')]
+        except OSError:
+            return
+        
+        entries = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(ERA5_CACHE_DIR, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= ERA5_CACHE_MAX_BYTES:
+                break
+            if name in keep:
+                continue
+            try:
+                os.remove(os.path.join(ERA5_CACHE_DIR, name))
+            except OSError:
+                continue
+            total -= size
+            logger.info(f"Evicted cached download {name}")
+
+def build_cds_request(request_data):
+    """Translate a frontend request into the CDS API request body"""
+    return {
+        'product_type': [request_data['productType']],
+        'variable': request_data['variables'],
+        'date': f"{request_data['dateStart']}/{request_data['dateEnd']}",
+        'time': request_data.get('timeRange', ['00:00']),
+        'area': [
+            request_data['area']['north'],
+            request_data['area']['west'], 
+            request_data['area']['south'],
+            request_data['area']['east']
+        ],
+        'format': request_data['format'],
+        'download_format': 'unarchived'
+    }
+
+def _month_ranges(date_start, date_end):
+    """Split an inclusive date range at month boundaries"""
+    start = datetime.fromisoformat(str(date_start)).date()
+    end = datetime.fromisoformat(str(date_end)).date()
+    
+    ranges = []
+    while start <= end:
+        month_end = start.replace(day=calendar.monthrange(start.year, start.month)[1])
+        ranges.append((start, min(month_end, end)))
+        start = month_end + timedelta(days=1)
+    return ranges
+
+def plan_request_chunks(request_data, split_by=None):
+    """
+    Split an ERA5 request into independent sub-requests
+    
+    Args:
+        request_data (dict): Validated frontend request
+        split_by (str): Comma-separated subset of 'month' and 'variable'
+        
+    Returns:
+        list: Sub-requests in merge order (months outer, variables inner)
+    """
+    split_by = {s.strip() for s in (split_by or ERA5_CHUNK_BY).split(',') if s.strip()}
+    
+    if 'month' in split_by:
+        months = _month_ranges(request_data['dateStart'], request_data['dateEnd'])
+    else:
+        months = [(request_data['dateStart'], request_data['dateEnd'])]
+    
+    if 'variable' in split_by:
+        variable_groups = [[v] for v in sorted(set(request_data['variables']))]
+    else:
+        variable_groups = [list(request_data['variables'])]
+    
+    chunks = []
+    for date_start, date_end in months:
+        for variables in variable_groups:
+            chunk = dict(request_data)
+            chunk.update({
+                'dateStart': str(date_start),
+                'dateEnd': str(date_end),
+                'variables': variables
+            })
+            chunks.append(chunk)
+    return chunks
+
+class CDSTransport:
+    """
+    How retrievals and status probes reach CDS
+    
+    Set CDS_TRANSPORT to 'fake' (FakeCDSTransport) or 'module:factory', or
+    call set_cds_transport, to run without CDS or with another client library.
+    """
+    
+    def retrieve(self, dataset, request, target):
+        """Run one retrieval and write the result to target"""
+        raise NotImplementedError
+    
+    def probe(self, timeout=CDS_PROBE_TIMEOUT):
+        """
+        Check that CDS is reachable
+        
+        Returns:
+            tuple: (api_key_status, message); raises if CDS can't be reached
+        """
+        raise NotImplementedError
+
+class CdsapiTransport(CDSTransport):
+    """
+    cdsapi clients pooled per worker process
+    
+    Clients are reused rather than built per call and share one requests
+    session, so connections to CDS stay alive between polls, downloads and
+    chunks. A client is lent to one thread at a time.
+    """
+    
+    def __init__(self, url=CDS_API_URL, key=CDS_API_KEY, pool_size=ERA5_CHUNK_CONCURRENCY):
+        self.url = url
+        self.key = key
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(1, pool_size) + 1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def client(self):
+        """Borrow a client for the duration of a with-block"""
+        with self._lock:
+            client = self._idle.pop() if self._idle else None
+        if client is None:
+            # Backoff is the scheduler's job: cdsapi's own retry loop would hold
+            # a slot for up to retry_max * sleep_max seconds
+            client = cdsapi.Client(url=self.url, key=self.key, session=self.session, retry_max=1)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._idle.append(client)
+    
+    def retrieve(self, dataset, request, target):
+        with self.client() as client:
+            # retrieve() without a target returns once CDS has the result ready
+            with grib_parser.span('cds_queue'):
+                result = client.retrieve(dataset, request)
+            with grib_parser.span('cds_transfer'):
+                result.download(target)
+    
+    def probe(self, timeout=CDS_PROBE_TIMEOUT):
+        with self.client() as client:
+            # Clients for the current CDS (ecmwf-datastores) can verify the key itself
+            datastores_client = getattr(client, 'client', None)
+            if hasattr(datastores_client, 'check_authentication'):
+                datastores_client.check_authentication()
+                return 'valid', 'CDS API connection successful'
+            
+            # The legacy API only offers an unauthenticated status document
+            response = self.session.get(f"{client.url}/status.json", timeout=timeout, verify=client.verify)
+            response.raise_for_status()
+            return 'unverified', 'CDS API reachable (key not verified by the legacy API)'
+
+class FakeCDSTransport(CDSTransport):
+    """
+    Stand-in for CDS inside the worker process, for tests and offline runs
+    
+    Retrievals write a small NetCDF file with every requested variable over
+    the requested dates, hours and area. Calls are recorded in order, and
+    latency and failures can be injected.
+    """
+    
+    def __init__(self, latency=0.0, failures=0, resolution=1.0):
+        """
+        Args:
+            latency (float): Seconds each retrieval takes
+            failures (int): Attempts of each distinct request that fail before one succeeds
+            resolution (float): Grid spacing of the generated data in degrees
+        """
+        self.latency = latency
+        self.failures = failures
+        self.resolution = resolution
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+    
+    def retrieve(self, dataset, request, target):
+        if request['format'] != 'netcdf':
+            raise ValueError('The fake CDS transport only produces NetCDF')
+        key = json.dumps(request, sort_keys=True)
+        with self._lock:
+            self.calls.append((dataset, request))
+            self._attempts[key] = attempt = self._attempts.get(key, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            if attempt <= self.failures:
+                raise RuntimeError(f"Fake CDS failure ({attempt} of {self.failures})")
+            self._dataset(request).to_netcdf(target)
+        finally:
+            with self._lock:
+                self.active -= 1
+    
+    def _dataset(self, request):
+        np, xr = grib_parser.np, grib_parser.xr
+        start, _, end = request['date'].partition('/')
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end or start, 'D') + 1)
+        hours = np.array([np.timedelta64(int(t.split(':')[0]), 'h') for t in request['time']])
+        times = (days[:, None] + hours[None, :]).ravel().astype('datetime64[ns]')
+        north, west, south, east = request['area']
+        lats = np.arange(north, south - 1e-9, -self.resolution)
+        lons = np.arange(west, east + 1e-9, self.resolution)
+        # Smooth, deterministic fields so merged chunks can be checked
+        base = np.cos(np.deg2rad(lats))[:, None] * np.cos(np.deg2rad(lons))[None, :]
+        hour_of_year = (times - times.astype('datetime64[Y]')) / np.timedelta64(1, 'h')
+        return xr.Dataset(
+            {
+                name: (('valid_time', 'latitude', 'longitude'),
+                       (base[None] + i + hour_of_year[:, None, None] / 8760).astype(np.float32))
+                for i, name in enumerate(request['variable'])
+            },
+            coords={'valid_time': times, 'latitude': lats, 'longitude': lons}
+        )
+    
+    def probe(self, timeout=CDS_PROBE_TIMEOUT):
+        return 'valid', 'Fake CDS transport'
+
+def create_cds_transport(spec=CDS_TRANSPORT):
+    """
+    Build the transport named by CDS_TRANSPORT
+    
+    Args:
+        spec (str): 'cdsapi', 'fake', or 'module:factory' for a custom transport
+    """
+    if spec == 'cdsapi':
+        return CdsapiTransport()
+    if spec == 'fake':
+        return FakeCDSTransport()
+    module_name, _, factory = spec.partition(':')
+    if not factory:
+        raise ValueError(f"CDS_TRANSPORT must be 'cdsapi', 'fake' or 'module:factory', got {spec!r}")
+    return getattr(importlib.import_module(module_name), factory)()
+
+_cds_transport = None
+_cds_transport_lock = threading.Lock()
+
+def get_cds_transport():
+    """Return this process's transport (rebuilt after a fork so connections aren't shared)"""
+    global _cds_transport
+    with _cds_transport_lock:
+        if _cds_transport is None or _cds_transport[0] != os.getpid():
+            _cds_transport = (os.getpid(), create_cds_transport())
+        return _cds_transport[1]
+
+def set_cds_transport(transport):
+    """Replace this process's transport, e.g. with one for a local fake CDS server"""
+    global _cds_transport
+    with _cds_transport_lock:
+        _cds_transport = (os.getpid(), transport)
+    reset_cds_status()
+
+_cds_status = {}
+_cds_status_lock = threading.Lock()
+
+def check_cds_connection(refresh=False):
+    """
+    Probe CDS, reusing the last answer for CDS_STATUS_TTL seconds
+    
+    Concurrent callers wait for a single probe instead of each starting one.
+    
+    Args:
+        refresh (bool): Probe even if the cached answer is still fresh
+        
+    Returns:
+        dict: connected, api_key_status, message, latencyMs, checkedAt and cached
+    """
+    with _cds_status_lock:
+        if not refresh and _cds_status and time.monotonic() - _cds_status['probedAt'] < CDS_STATUS_TTL:
+            return dict(_cds_status['result'], cached=True)
+        
+        started = time.monotonic()
+        try:
+            api_key_status, message = get_cds_transport().probe()
+            result = {'connected': True, 'api_key_status': api_key_status, 'message': message}
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            rejected = response is not None and response.status_code in (401, 403)
+            result = {
+                'connected': False,
+                'api_key_status': 'invalid' if rejected else 'unknown',
+                'message': str(e)
+            }
+        finished = time.monotonic()
+        result.update(latencyMs=round((finished - started) * 1000, 1), checkedAt=datetime.utcnow().isoformat())
+        metrics.inc('cds_probes_total', result='connected' if result['connected'] else 'failed')
+        
+        _cds_status.update(result=result, probedAt=finished)
+        return dict(result, cached=False)
+
+def reset_cds_status():
+    """Forget the cached probe result"""
+    with _cds_status_lock:
+        _cds_status.clear()
+
+class RetrievalScheduler:
+    """
+    Bounded pool of CDS retrievals shared by every download in a worker process
+    
+    Waiting retrievals are queued per user and free slots go to users in
+    turn, so one user's bulk request can't starve everyone else. A failed
+    attempt is retried with exponential backoff without holding a slot.
+    """
+    
+    def __init__(self, max_concurrency=ERA5_CHUNK_CONCURRENCY, retries=ERA5_CHUNK_RETRIES,
+                 retry_delay=ERA5_CHUNK_RETRY_DELAY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = max(1, retries)
+        self.retry_delay = retry_delay
+        self._cond = threading.Condition()
+        # user -> deque of waiting tasks; iteration order is the serving order
+        self._queues = OrderedDict()
+        # (ready time, sequence, task) for attempts backing off
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._workers = []
+        self._pid = None
+        self.running = 0
+    
+    def submit(self, fn, user=None, on_attempt=None, label=None):
+        """
+        Queue a retrieval
+        
+        Args:
+            fn (callable): Makes one attempt; its return value resolves the future
+            user (str): Fairness key (requests without a user share one queue)
+            on_attempt (callable): Called with the attempt number before each try
+            label (str): Name used in retry log messages
+            
+        Returns:
+            Future: Resolves to fn's result, or its last error once retries run out
+        """
+        task = {'fn': fn, 'user': user, 'on_attempt': on_attempt, 'label': label or 'retrieval',
+                'attempt': 0, 'future': Future()}
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(task)
+            self._start_workers()
+            self._cond.notify()
+        return task['future']
+    
+    def _start_workers(self):
+        # Threads don't survive a fork; start a fresh set in each process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._workers = []
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, name=f"cds-retrieval-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+    
+    def _next_task(self):
+        """Take the next task, rotating between users; called with the lock held"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self._delayed)
+            # A retry goes back to the front of its user's queue
+            self._queues.setdefault(task['user'], deque()).appendleft(task)
+        
+        while self._queues:
+            user, queue = next(iter(self._queues.items()))
+            task = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            # Skip tasks cancelled before their first attempt
+            if task['attempt'] > 0 or task['future'].set_running_or_notify_cancel():
+                return task
+        return None
+    
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    timeout = max(0.0, self._delayed[0][0] - time.monotonic()) if self._delayed else None
+                    self._cond.wait(timeout)
+                    task = self._next_task()
+                self.running += 1
+            try:
+                self._attempt(task)
+            finally:
+                with self._cond:
+                    self.running -= 1
+    
+    def _attempt(self, task):
+        task['attempt'] += 1
+        if task['on_attempt']:
+            # A progress reporting error mustn't cost the retrieval an attempt
+            try:
+                task['on_attempt'](task['attempt'])
+            except Exception as e:
+                logger.warning(f"{task['label']} progress callback failed: {e}")
+        try:
+            result = task['fn']()
+        except Exception as e:
+            if task['attempt'] >= self.retries:
+                task['future'].set_exception(e)
+                return
+            delay = self.retry_delay * 2 ** (task['attempt'] - 1)
+            logger.warning(f"{task['label']} attempt {task['attempt']} failed ({e}), retrying in {delay:.0f}s")
+            metrics.inc('era5_chunk_retries_total')
+            with self._cond:
+                heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+                self._cond.notify()
+            return
+        task['future'].set_result(result)
+
+retrieval_scheduler = RetrievalScheduler()
+
+def submit_chunk(chunk, user_id=None, on_attempt=None):
+    """
+    Queue one sub-request for download into the content cache
+    
+    Chunks are cached under their own request key, so a later request that
+    overlaps by month and variable reuses them instead of asking CDS again.
+    
+    Args:
+        chunk (dict): Sub-request from plan_request_chunks
+        user_id (str): User the download is for (scheduling fairness)
+        on_attempt (callable): Called with the attempt number before each try
+        
+    Returns:
+        Future: Resolves to (path to the chunk file, whether it came from the cache)
+    """
+    chunk_key = canonical_request_key(chunk)
+    cached_path = lookup_cached_download(chunk_key, chunk['format'])
+    grib_parser.count_cache('era5_chunk', cached_path is not None)
+    if cached_path is not None:
+        future = Future()
+        future.set_result((cached_path, True))
+        return future
+    
+    os.makedirs(ERA5_CACHE_DIR, exist_ok=True)
+    filepath = _cache_path(chunk_key, chunk['format'])
+    
+    def attempt():
+        partial_path = os.path.join(ERA5_CACHE_DIR, f".{uuid.uuid4().hex}.part")
+        try:
+            get_cds_transport().retrieve(chunk['dataset'], build_cds_request(chunk), partial_path)
+            metrics.inc('era5_transfer_bytes_total', os.path.getsize(partial_path))
+            os.replace(partial_path, filepath)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return filepath, False
+    
+    return retrieval_scheduler.submit(attempt, user_id, on_attempt, label=f"Chunk {chunk_key[:12]}")
+
+def merge_chunk_files(chunk_paths, file_format, output_path):
+    """
+    Merge downloaded chunks into one file along time (and across variables)
+    
+    GRIB messages are self-contained, so GRIB chunks are concatenated as
+    bytes; NetCDF chunks are combined by their coordinates with xarray.
+    """
+    if len(chunk_paths) == 1:
+        shutil.copyfile(chunk_paths[0], output_path)
+        return
+    
+    if file_format == 'grib':
+        with open(output_path, 'wb') as out:
+            for path in chunk_paths:
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+        return
+    
+    xr = grib_parser.xr
+    datasets = [xr.open_dataset(path) for path in chunk_paths]
+    try:
+        merged = xr.combine_by_coords(datasets, combine_attrs='override')
+        merged.to_netcdf(output_path)
+    finally:
+        for ds in datasets:
+            ds.close()
+
+def _update_job(job_id, **fields):
+    """Update a job and every identical request coalesced onto it"""
+    def fields_for(target_id):
+        if fields.get('status') != 'completed':
+            return fields
+        return dict(fields, downloadUrl=f"/api/download/{target_id}")
+    
+    job = job_store.update(job_id, **fields_for(job_id))
+    if job is None:
+        return
+    publish_job_event(job)
+    
+    for follower_id in job.get('followers', []):
+        follower = job_store.update(follower_id, **fields_for(follower_id))
+        if follower is not None:
+            publish_job_event(follower)
+
 @celery.task(bind=True)
 def download_era5_data(self, job_id, request_data):
     """
     Background task to download ERA5 data from CDS
     """
+    request_key = canonical_request_key(request_data)
+    started = time.monotonic()
+    status = 'failed'
     try:
-        jobs[job_id]['status'] = 'running'
-        jobs[job_id]['progress'] = 0
+        _update_job(job_id, status='running', progress=0)
         
-        # Initialize CDS API client
-        c = cdsapi.Client()
+        # Split into sub-requests so large requests stay under CDS limits
+        chunks = plan_request_chunks(request_data)
+        chunk_status = [
+            {
+                'index': i,
+                'dateStart': chunk['dateStart'],
+                'dateEnd': chunk['dateEnd'],
+                'variables': chunk['variables'],
+                'status': 'queued',
+                'attempts': 0
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+        progress_lock = threading.Lock()
+        # self.request is thread-local; chunk attempts report from scheduler threads
+        task_id = self.request.id
         
-        # Update progress
-        self.update_state(state='PROGRESS', meta={'current': 10, 'total': 100})
-        jobs[job_id]['progress'] = 10
-        
-        # Prepare CDS request
-        dataset = request_data['dataset']
-        cds_request = {
-            'product_type': [request_data['productType']],
-            'variable': request_data['variables'],
-            'date': f"{request_data['dateStart']}/{request_data['dateEnd']}",
-            'time': request_data.get('timeRange', ['00:00']),
-            'area': [
-                request_data['area']['north'],
-                request_data['area']['west'], 
-                request_data['area']['south'],
-                request_data['area']['east']
-            ],
-            'format': request_data['format'],
-            'download_format': 'unarchived'
-        }
+        def report_progress():
+            done = sum(1 for c in chunk_status if c['status'] == 'completed')
+            progress = 10 + int(80 * done / len(chunks))
+            self.update_state(task_id=task_id, state='PROGRESS', meta={'current': progress, 'total': 100})
+            _update_job(job_id, progress=progress, chunks=[dict(c) for c in chunk_status])
+        
+        def attempt_callback(i):
+            def on_attempt(attempt):
+                with progress_lock:
+                    chunk_status[i].update(status='running', attempts=attempt)
+                    report_progress()
+            return on_attempt
         
         # Update progress
-        self.update_state(state='PROGRESS', meta={'current': 20, 'total': 100})
-        jobs[job_id]['progress'] = 20
+        with progress_lock:
+            report_progress()
         
-        # Generate filename
-        filename = f"era5_{job_id}.{request_data['format']}"
-        filepath = f"/tmp/{filename}"
+        # Download data from CDS through the shared, per-user fair scheduler
+        logger.info(f"Starting CDS download for job {job_id} in {len(chunks)} chunk(s)")
+        user_id = (job_store.get(job_id) or {}).get('userId')
+        futures = {submit_chunk(chunk, user_id, attempt_callback(i)): i for i, chunk in enumerate(chunks)}
+        chunk_paths = [None] * len(chunks)
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                chunk_paths[i], cached = future.result()
+            except Exception as e:
+                # Chunks that haven't started yet aren't needed any more
+                for pending in futures:
+                    pending.cancel()
+                with progress_lock:
+                    chunk_status[i].update(status='failed', error=str(e))
+                    report_progress()
+                raise
+            
+            with progress_lock:
+                chunk_status[i].update(status='completed', cached=cached)
+                report_progress()
         
-        # Download data from CDS
-        logger.info(f"Starting CDS download for job {job_id}")
-        c.retrieve(dataset, cds_request, filepath)
+        # Merge chunks along time into the content cache
+        filepath = _cache_path(request_key, request_data['format'])
+        if chunk_paths != [filepath]:
+            partial_path = os.path.join(ERA5_CACHE_DIR, f".{job_id}.part")
+            with grib_parser.span('merge'):
+                merge_chunk_files(chunk_paths, request_data['format'], partial_path)
+            os.replace(partial_path, filepath)
+        evict_era5_cache(keep=chunk_paths + [filepath])
         
         # Update progress
-        self.update_state(state='PROGRESS', meta={'current': 90, 'total': 100})
-        jobs[job_id]['progress'] = 90
+        self.update_state(state='PROGRESS', meta={'current': 95, 'total': 100})
+        _update_job(job_id, progress=95)
         
         # Get file size
         file_size = os.path.getsize(filepath)
         file_size_mb = file_size / (1024 * 1024)
         
         # Complete job
-        jobs[job_id].update({
-            'status': 'completed',
-            'progress': 100,
-            'completedAt': datetime.utcnow().isoformat(),
-            'downloadUrl': f"/api/download/{job_id}",
-            'fileSize': f"{file_size_mb:.1f} MB",
-            'filepath': filepath
-        })
+        _update_job(
+            job_id,
+            status='completed',
+            progress=100,
+            completedAt=datetime.utcnow().isoformat(),
+            fileSize=f"{file_size_mb:.1f} MB",
+            filepath=filepath
+        )
         
         logger.info(f"Job {job_id} completed successfully")
+        status = 'completed'
+        
+        # Convert to a memory-mappable array store in the background
+        convert_era5_to_store.delay(job_id, filepath)
+        
         return {'status': 'completed', 'file_size': file_size_mb}
         
     except Exception as e:
         logger.error(f"Job {job_id} failed: {str(e)}")
-        jobs[job_id].update({
-            'status': 'failed',
-            'error': str(e),
-            'completedAt': datetime.utcnow().isoformat()
-        })
+        _update_job(
+            job_id,
+            status='failed',
+            error=str(e),
+            completedAt=datetime.utcnow().isoformat()
+        )
         raise
+    
+    finally:
+        job_store.release_inflight(request_key, job_id)
+        metrics.inc('era5_jobs_finished_total', status=status)
+        metrics.observe('era5_job_seconds', time.monotonic() - started, status=status)
+
+@celery.task
+def convert_era5_to_store(job_id, filepath):
+    """
+    Background task to convert a downloaded ERA5 file into a chunked array store
+    so extract, stats and point queries never re-decode GRIB/NetCDF
+    """
+    # Stores are keyed by the cached file, so identical requests share one
+    store_id = f"era5_{os.path.splitext(os.path.basename(filepath))[0]}"
+    store_dir = os.path.join(grib_parser.GRIB_STORE_DIR, store_id)
+    
+    logger.info(f"Converting {filepath} to array store {store_id}")
+    result = grib_parser.convert_to_array_store(filepath, store_dir)
+    
+    if not result['success']:
+        logger.error(f"Store conversion for job {job_id} failed: {result['error']}")
+        return {'status': 'failed', 'error': result['error']}
+    
+    # Precompute map tile pyramids while the data is hot
+    with grib_parser.span('pyramid'):
+        for variable in result['metadata']['variables']:
+            grib_parser.build_store_pyramid(store_dir, variable)
+    
+    # Make the file visible to cross-job catalog queries
+    grib_parser.get_catalog().add(filepath, store_dir)
+    
+    # Fold the new time steps into the climatology baselines used for anomalies
+    for variable, var_info in result['metadata']['variables'].items():
+        # Directions are angles, which a mean baseline can't represent
+        if 'time' not in (var_info['roles'] or {}) or var_info.get('circular'):
+            continue
+        for by in grib_parser.GRIB_BASELINE_GROUPS:
+            with grib_parser.span('baseline'):
+                baseline = grib_parser.update_baseline(store_dir, variable, by)
+            if not baseline['success']:
+                logger.warning(f"Baseline update for {variable} failed: {baseline['error']}")
+    
+    _update_job(job_id, storeId=store_id)
+    
+    logger.info(f"Job {job_id} converted to array store {store_id}")
+    return {'status': 'completed', 'storeId': store_id}
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -168,24 +1417,14 @@ def health_check():
 
 @app.route('/api/cds/status', methods=['GET'])
 def cds_status():
-    """Check CDS API connection status"""
-    try:
-        # Try to initialize CDS client
-        c = cdsapi.Client()
-        
-        # Test connection with a simple request (don't actually download)
-        # This would check if credentials are valid
-        return jsonify({
-            'connected': True,
-            'api_key_status': 'valid',
-            'message': 'CDS API connection successful'
-        })
-    except Exception as e:
-        return jsonify({
-            'connected': False,
-            'api_key_status': 'invalid',
-            'message': str(e)
-        }), 400
+    """
+    Check CDS API connection status
+    
+    The probe result is cached for CDS_STATUS_TTL seconds; ?refresh=1 forces a new probe.
+    """
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    status = check_cds_connection(refresh)
+    return jsonify(status), 200 if status['connected'] else 503
 
 @app.route('/api/era5/variables', methods=['GET'])
 def get_era5_variables():
@@ -206,6 +1445,7 @@ def submit_era5_request():
         
         # Generate job ID
         job_id = str(uuid.uuid4())
+        request_key = canonical_request_key(request_data)
         
         # Create job record
         job = {
@@ -213,10 +1453,49 @@ def submit_era5_request():
             'status': 'queued',
             'progress': 0,
             'request': request_data,
+            'requestKey': request_key,
+            'userId': request.headers.get('X-User-Id') or request_data.get('userId'),
             'createdAt': datetime.utcnow().isoformat()
         }
+        job_store.maybe_cleanup()
+        
+        # Serve identical completed requests straight from the content cache
+        cached_path = lookup_cached_download(request_key, request_data['format'])
+        grib_parser.count_cache('era5_request', cached_path is not None)
+        if cached_path is not None:
+            job.update({
+                'status': 'completed',
+                'progress': 100,
+                'completedAt': datetime.utcnow().isoformat(),
+                'downloadUrl': f"/api/download/{job_id}",
+                'fileSize': f"{os.path.getsize(cached_path) / (1024 * 1024):.1f} MB",
+                'filepath': cached_path,
+                'cached': True
+            })
+            job_store.create(job)
+            publish_job_event(job)
+            convert_era5_to_store.delay(job_id, cached_path)
+            logger.info(f"Served job {job_id} from cached download {request_key}")
+            return jsonify(job), 201
         
-        jobs[job_id] = job
+        # Attach to an identical request that is already downloading
+        job_store.create(job)
+        primary_id = job_store.claim_inflight(request_key, job_id)
+        if primary_id != job_id:
+            primary = job_store.add_follower(primary_id, job_id)
+            fields = {'status': primary['status'], 'progress': primary['progress'], 'attachedTo': primary_id}
+            
+            # The primary may have finished before this job was attached
+            if primary['status'] not in ACTIVE_STATUSES:
+                fields.update({k: primary[k] for k in ('completedAt', 'fileSize', 'filepath', 'error') if k in primary})
+                if primary['status'] == 'completed':
+                    fields['downloadUrl'] = f"/api/download/{job_id}"
+            job = job_store.update(job_id, **fields)
+            publish_job_event(job)
+            logger.info(f"Attached job {job_id} to in-flight job {primary_id}")
+            return jsonify(job), 201
+        
+        publish_job_event(job)
         
         # Start background download task
         download_era5_data.delay(job_id, request_data)
@@ -230,32 +1509,209 @@ def submit_era5_request():
 
 @app.route('/api/jobs', methods=['GET'])
 def get_jobs():
-    """Get all jobs"""
-    return jsonify(list(jobs.values()))
+    """
+    List jobs newest first, one page at a time
+    
+    Query parameters: status (comma-separated), userId, createdAfter and
+    createdBefore (ISO timestamps), limit and cursor (nextCursor of the
+    previous page).
+    """
+    try:
+        status = [s for s in request.args.get('status', '').split(',') if s]
+        limit = min(int(request.args.get('limit', JOB_PAGE_SIZE)), JOB_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        
+        created_after = request.args.get('createdAfter')
+        created_before = request.args.get('createdBefore')
+        
+        page, next_cursor = job_store.list(
+            status=status or None,
+            user_id=request.args.get('userId'),
+            created_after=datetime.fromisoformat(created_after).timestamp() if created_after else None,
+            created_before=datetime.fromisoformat(created_before).timestamp() if created_before else None,
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'jobs': page, 'nextCursor': next_cursor})
 
 @app.route('/api/jobs/<job_id>', methods=['GET'])
 def get_job(job_id):
     """Get specific job status"""
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events_stream(job_id):
+    """Stream a job's progress as Server-Sent Events until it completes or fails"""
+    job = job_store.get(job_id)
+    if job is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    return jsonify(jobs[job_id])
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    return sse_response(job_event_stream(
+        f"job:{job_id}",
+        lambda: [job_store.get(job_id)],
+        last_event_id,
+        until_done=True
+    ))
+
+@app.route('/api/jobs/events', methods=['GET'])
+def user_job_events_stream():
+    """Stream progress of all of a user's jobs (new ones included) as Server-Sent Events"""
+    # EventSource can't set headers, so the user may also come from the query string
+    user_id = request.args.get('userId') or request.headers.get('X-User-Id')
+    if not user_id:
+        return jsonify({'error': 'userId is required'}), 400
+    
+    def active_jobs():
+        page, _ = job_store.list(status=list(ACTIVE_STATUSES), user_id=user_id, limit=JOB_MAX_PAGE_SIZE)
+        return page
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    return sse_response(job_event_stream(f"user:{user_id}", active_jobs, last_event_id))
+
+def send_download(filepath, download_name, mimetype=None):
+    """
+    Send a cached file with Range/If-Range support
+    
+    With ERA5_ACCEL_REDIRECT_PREFIX set, nginx serves the file itself
+    (sendfile, ranges); otherwise Werkzeug handles ranges and the WSGI
+    server's file wrapper can use sendfile for full responses.
+    """
+    if ERA5_ACCEL_REDIRECT_PREFIX:
+        relative = os.path.relpath(filepath, ERA5_CACHE_DIR)
+        response = Response(mimetype=mimetype or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = ERA5_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        # Ranges are resolved by nginx, so this counts whole files
+        metrics.inc('era5_served_bytes_total', os.path.getsize(filepath))
+        return response
+    
+    response = send_file(filepath, mimetype=mimetype, as_attachment=True, download_name=download_name, conditional=True)
+    metrics.inc('era5_served_bytes_total', response.content_length or 0)
+    return response
+
+def subset_cache_key(filepath, variables, bbox, time_range, subset_format):
+    """Cache key for a subset of a downloaded file (parameters normalized)"""
+    params = {
+        'file': os.path.basename(filepath),
+        'variables': sorted(variables) if variables else None,
+        'bbox': [round(bbox[k], 4) for k in ('north', 'west', 'south', 'east')] if bbox else None,
+        'time': [str(t) if t is not None else None for t in time_range] if time_range else None,
+        'format': subset_format
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+def _stream_and_cache(chunks, cache_path):
+    """Yield body chunks while writing them to the cache, keeping the file only if complete"""
+    partial_path = os.path.join(ERA5_CACHE_DIR, f".{uuid.uuid4().hex}.part")
+    complete = False
+    try:
+        with open(partial_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                metrics.inc('era5_served_bytes_total', len(chunk))
+                yield chunk
+        complete = True
+    finally:
+        if complete:
+            os.replace(partial_path, cache_path)
+            evict_era5_cache(keep=[cache_path])
+        elif os.path.exists(partial_path):
+            os.remove(partial_path)
 
 @app.route('/api/download/<job_id>', methods=['GET'])
 def download_file(job_id):
-    """Download completed data file"""
-    if job_id not in jobs:
-        return jsonify({'error': 'Job not found'}), 404
+    """
+    Download completed data file, or a subset of it
     
-    job = jobs[job_id]
+    Query parameters: variables (comma-separated), bbox (north,west,south,east),
+    time (ISO 'start/end' or a single time) and format ('netcdf' or 'binary').
+    Whole files and cached subsets support HTTP Range requests.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
     
     if job['status'] != 'completed':
         return jsonify({'error': 'Job not completed'}), 400
     
-    if 'filepath' not in job:
+    # Cached downloads may have been evicted since the job completed
+    if 'filepath' not in job or not os.path.exists(job['filepath']):
         return jsonify({'error': 'File not available'}), 404
     
-    return send_file(job['filepath'], as_attachment=True)
+    filepath = job['filepath']
+    extension = os.path.splitext(filepath)[1]
+    variables = [v for v in request.args.get('variables', '').split(',') if v]
+    bbox_arg = request.args.get('bbox')
+    time_arg = request.args.get('time')
+    subset_format = request.args.get('format')
+    
+    if not (variables or bbox_arg or time_arg or subset_format):
+        return send_download(filepath, f"era5_{job_id}{extension}")
+    
+    try:
+        subset_format = subset_format or 'netcdf'
+        if subset_format not in SUBSET_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(SUBSET_FORMATS)}")
+        bbox = grib_parser.parse_bbox(bbox_arg.split(',')) if bbox_arg else None
+        time_range = grib_parser.parse_time_range(time_arg)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    suffix, mimetype = SUBSET_FORMATS[subset_format]
+    key = subset_cache_key(filepath, variables, bbox, time_range, subset_format)
+    cache_path = os.path.join(ERA5_CACHE_DIR, f"{os.path.splitext(os.path.basename(filepath))[0]}.subset-{key}{suffix}")
+    download_name = f"era5_{job_id}_subset{suffix}"
+    
+    try:
+        os.utime(cache_path)
+    except OSError:
+        grib_parser.count_cache('era5_subset', False)
+    else:
+        grib_parser.count_cache('era5_subset', True)
+        return send_download(cache_path, download_name, mimetype)
+    
+    try:
+        if subset_format == 'binary':
+            # Stream blocks as they are read; the pool handle is held until the body ends
+            def generate():
+                with grib_parser.dataset_pool.dataset(filepath) as ds:
+                    plan = grib_parser.plan_subset(ds, variables, bbox, time_range)
+                    yield from _stream_and_cache(grib_parser.iter_binary_subset(plan), cache_path)
+            
+            # Validate the parameters before the response starts
+            with grib_parser.dataset_pool.dataset(filepath) as ds:
+                grib_parser.plan_subset(ds, variables, bbox, time_range)
+            response = Response(generate(), mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+            return response
+        
+        # NetCDF needs a seekable file, so it is written block by block before sending
+        partial_path = os.path.join(ERA5_CACHE_DIR, f".{uuid.uuid4().hex}.part")
+        try:
+            with grib_parser.dataset_pool.dataset(filepath) as ds:
+                plan = grib_parser.plan_subset(ds, variables, bbox, time_range)
+                grib_parser.write_netcdf_subset(plan, partial_path)
+            os.replace(partial_path, cache_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        evict_era5_cache(keep=[cache_path])
+        return send_download(cache_path, download_name, mimetype)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Subset of job {job_id} failed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/era5/generate-code', methods=['POST'])
 def generate_cds_code():
@@ -297,4 +1753,5 @@ if __name__ == '__main__':
     os.makedirs('/tmp', exist_ok=True)
     
     # Start Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Threaded so long-lived event streams don't block other requests
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the GRIB processing pipeline
+
+Generates synthetic ERA5-shaped GRIB and NetCDF files locally (no CDS access)
+and times parsing, extraction, statistics, rendering and the Flask endpoints,
+recording the peak RSS of every case. Results are written as JSON and can be
+compared against a stored baseline to catch regressions.
+
+Usage:
+python grib-benchmark.py --preset smoke
+python grib-benchmark.py --preset day --output results.json
+python grib-benchmark.py --preset day --baseline baseline.json --threshold 0.2
+
+Requirements:
+- everything grib-parser.py needs (xarray, cfgrib, eccodes, numpy, matplotlib)
+- flask (endpoint cases)
+- netCDF4 (optional, for the NetCDF cases)
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import eccodes
+except ImportError:
+    eccodes = None
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+GRIB_PARSER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grib-parser.py')
+BENCHMARK_DIR = os.environ.get('GRIB_BENCHMARK_DIR', '/tmp/grib_benchmark')
+
+# Dataset sizes: grid spacing (degrees) and hourly steps from 2024-01-01
+PRESETS = {
+    'smoke': {'grid': 2.5, 'hours': 24},
+    'day': {'grid': 0.25, 'hours': 24},
+    'week': {'grid': 0.25, 'hours': 24 * 7},
+    'month': {'grid': 0.25, 'hours': 24 * 31}
+}
+
+# ERA5 single-level and pressure-level variables (GRIB1 table 128 paramIds)
+SURFACE_PARAMS = OrderedDict([('t2m', 167), ('msl', 151), ('u10', 165), ('v10', 166)])
+PRESSURE_PARAMS = OrderedDict([('t', 130), ('u', 131), ('v', 132)])
+DEFAULT_LEVELS = (500, 850, 1000)
+START_TIME = datetime(2024, 1, 1)
+
+def synthetic_field(name, lats, lons, hour, level=None, rng=None):
+    """
+    Smooth, roughly realistic field for one variable and time step
+    
+    Args:
+        name (str): Variable name (see SURFACE_PARAMS / PRESSURE_PARAMS)
+        lats (numpy.ndarray): Latitudes (ny,)
+        lons (numpy.ndarray): Longitudes (nx,)
+        hour (int): Hours since START_TIME
+        level (float): Pressure level in hPa (if applicable)
+        rng (numpy.random.Generator): Noise source
+    
+    Returns:
+        numpy.ndarray: (ny, nx) float32 field
+    """
+    rng = rng or np.random.default_rng(hour)
+    phi = np.radians(lats)[:, None]
+    lam = np.radians(lons)[None, :]
+    # Diurnal cycle follows the sun around the globe
+    sun = np.cos(lam + 2 * np.pi * (hour % 24) / 24)
+    wave = np.sin(3 * lam - 0.2 * hour) * np.cos(2 * phi)
+    noise = rng.standard_normal((1, lons.size)).astype(np.float32)
+    
+    if name in ('t2m', 't'):
+        base = 300.0 - 50.0 * np.sin(phi) ** 2
+        if level is not None:
+            base = base - 0.065 * (1000.0 - level) * 0.8
+        field = base + 4.0 * sun * np.cos(phi) + 2.0 * wave
+    elif name == 'msl':
+        field = 101325.0 + 1500.0 * wave + 300.0 * np.cos(4 * phi)
+    elif name in ('u10', 'u'):
+        scale = 1.0 if level is None else 1.0 + (1000.0 - level) / 250.0
+        field = scale * (8.0 * np.cos(2 * phi) * np.cos(phi) + 3.0 * wave)
+    else:
+        scale = 1.0 if level is None else 1.0 + (1000.0 - level) / 250.0
+        field = scale * 5.0 * np.sin(2 * lam - 0.1 * hour) * np.cos(phi)
+    return (field + 0.1 * noise).astype(np.float32)
+
+def _grid(grid):
+    lats = np.linspace(90.0, -90.0, int(round(180 / grid)) + 1)
+    lons = np.arange(int(round(360 / grid))) * grid
+    return lats, lons
+
+def write_grib_fixture(path, params, grid, hours, levels=None):
+    """
+    Write a synthetic ERA5-style GRIB1 file (16-bit simple packing, as from CDS)
+    
+    Args:
+        path (str): Output path
+        params (OrderedDict): Variable name -> paramId
+        grid (float): Grid spacing in degrees
+        hours (int): Number of hourly steps
+        levels (list): Pressure levels in hPa (None for single-level data)
+    """
+    if eccodes is None:
+        raise RuntimeError('eccodes is required to write GRIB fixtures')
+    
+    lats, lons = _grid(grid)
+    template = eccodes.codes_grib_new_from_samples('regular_ll_pl_grib1' if levels else 'regular_ll_sfc_grib1')
+    try:
+        for key, value in (
+            ('Ni', lons.size), ('Nj', lats.size),
+            ('latitudeOfFirstGridPointInDegrees', 90.0), ('longitudeOfFirstGridPointInDegrees', 0.0),
+            ('latitudeOfLastGridPointInDegrees', -90.0), ('longitudeOfLastGridPointInDegrees', float(lons[-1])),
+            ('iDirectionIncrementInDegrees', grid), ('jDirectionIncrementInDegrees', grid),
+            ('bitsPerValue', 16)
+        ):
+            eccodes.codes_set(template, key, value)
+        
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        rng = np.random.default_rng(0)
+        with open(tmp_path, 'wb') as f:
+            for hour in range(hours):
+                when = START_TIME + timedelta(hours=hour)
+                for name, param in params.items():
+                    for level in (levels or [None]):
+                        message = eccodes.codes_clone(template)
+                        try:
+                            eccodes.codes_set(message, 'paramId', param)
+                            if level is not None:
+                                eccodes.codes_set(message, 'level', int(level))
+                            eccodes.codes_set(message, 'dataDate', int(when.strftime('%Y%m%d')))
+                            eccodes.codes_set(message, 'dataTime', when.hour * 100)
+                            field = synthetic_field(name, lats, lons, hour, level, rng)
+                            eccodes.codes_set_values(message, field.ravel().astype(np.float64))
+                            eccodes.codes_write(message, f)
+                        finally:
+                            eccodes.codes_release(message)
+        os.replace(tmp_path, path)
+    finally:
+        eccodes.codes_release(template)
+
+def write_netcdf_fixture(path, params, grid, hours, levels=None):
+    """
+    Write a synthetic ERA5-style NetCDF file (CDS layout: valid_time,
+    pressure_level, latitude, longitude), one time step at a time
+    """
+    if netCDF4 is None:
+        raise RuntimeError('netCDF4 is required to write NetCDF fixtures')
+    
+    lats, lons = _grid(grid)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    rng = np.random.default_rng(0)
+    with netCDF4.Dataset(tmp_path, 'w') as nc:
+        nc.createDimension('valid_time', hours)
+        nc.createDimension('latitude', lats.size)
+        nc.createDimension('longitude', lons.size)
+        times = nc.createVariable('valid_time', 'i8', ('valid_time',))
+        times.units = 'seconds since 1970-01-01'
+        times.calendar = 'proleptic_gregorian'
+        times[:] = [int((START_TIME + timedelta(hours=h) - datetime(1970, 1, 1)).total_seconds()) for h in range(hours)]
+        nc.createVariable('latitude', 'f8', ('latitude',))[:] = lats
+        nc.createVariable('longitude', 'f8', ('longitude',))[:] = lons
+        dims = ('valid_time', 'latitude', 'longitude')
+        if levels:
+            nc.createDimension('pressure_level', len(levels))
+            nc.createVariable('pressure_level', 'f8', ('pressure_level',))[:] = levels
+            dims = ('valid_time', 'pressure_level', 'latitude', 'longitude')
+        
+        for name in params:
+            var = nc.createVariable(name, 'f4', dims)
+            for hour in range(hours):
+                if levels:
+                    var[hour] = np.stack([synthetic_field(name, lats, lons, hour, level, rng) for level in levels])
+                else:
+                    var[hour] = synthetic_field(name, lats, lons, hour, None, rng)
+    os.replace(tmp_path, path)
+
+def ensure_fixtures(preset, fixtures_dir, levels=DEFAULT_LEVELS, netcdf=True):
+    """
+    Generate (or reuse) the fixtures of a preset
+    
+    Returns:
+        dict: Fixture name ('sfc', 'pl', 'sfc_nc', ...) -> path
+    """
+    spec = PRESETS[preset]
+    os.makedirs(fixtures_dir, exist_ok=True)
+    fixtures = OrderedDict()
+    level_tag = '-'.join(str(v) for v in levels)
+    for kind, params, fixture_levels in (('sfc', SURFACE_PARAMS, None), ('pl', PRESSURE_PARAMS, list(levels))):
+        name = f"{preset}-{kind}" if fixture_levels is None else f"{preset}-{kind}-{level_tag}"
+        path = os.path.join(fixtures_dir, f"{name}.grib")
+        if not os.path.exists(path):
+            print(f"Generating {path}...")
+            write_grib_fixture(path, params, spec['grid'], spec['hours'], fixture_levels)
+        fixtures[kind] = path
+        
+        if netcdf and netCDF4 is not None:
+            path = os.path.join(fixtures_dir, f"{name}.nc")
+            if not os.path.exists(path):
+                print(f"Generating {path}...")
+                write_netcdf_fixture(path, params, spec['grid'], spec['hours'], fixture_levels)
+            fixtures[f"{kind}_nc"] = path
+    return fixtures
+
+def load_grib_parser():
+    """Import grib-parser.py (hyphenated, so not importable by name)"""
+    spec = importlib.util.spec_from_file_location('grib_parser', GRIB_PARSER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['grib_parser'] = module
+    spec.loader.exec_module(module)
+    return module
+
+def _remove_indexes(path):
+    """Drop cfgrib/message indexes so parse cases measure a cold open"""
+    directory = os.path.dirname(path)
+    for name in os.listdir(directory):
+        if name.startswith(os.path.basename(path) + '.') and name.endswith(('.idx', '.json')):
+            os.remove(os.path.join(directory, name))
+
+# Each case takes a context dict and returns (run, reset): run is timed,
+# reset (or None) runs untimed before every repetition
+def case_parse(ctx, key):
+    gp = ctx['gp']
+    path = ctx['fixtures'][key]
+    
+    def run():
+        if not path.endswith('.grib'):
+            # parse_grib_file is cfgrib-only; NetCDF goes through the store reader's open + stats
+            ds = gp.open_source_dataset(path, cache=False)
+            for var_data in ds.data_vars.values():
+                gp.compute_variable_stats(var_data, gp.DEFAULT_CHUNK_STEPS)
+            ds.close()
+            return
+        result = gp.parse_grib_file(path, lazy=True)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        result['dataset'].close()
+    
+    return run, (lambda: _remove_indexes(path))
+
+def case_stats(ctx, key):
+    gp = ctx['gp']
+    ds = gp.open_source_dataset(ctx['fixtures'][key], cache=False)
+    
+    def run():
+        for var_data in ds.data_vars.values():
+            gp.compute_variable_stats(var_data, gp.DEFAULT_CHUNK_STEPS)
+    
+    return run, None
+
+def _middle_step(ctx):
+    return PRESETS[ctx['preset']]['hours'] // 2
+
+def case_extract(ctx, key):
+    gp = ctx['gp']
+    ds = gp.open_source_dataset(ctx['fixtures'][key])
+    variable = next(iter(ds.data_vars))
+    level = 850 if key.startswith('pl') else None
+    
+    def run():
+        result = gp.extract_data_for_visualization(ds, variable, _middle_step(ctx), level)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    
+    return run, None
+
+def case_extract_index(ctx, key):
+    gp = ctx['gp']
+    path = ctx['fixtures'][key]
+    gp.load_message_index(path)
+    variable = 't2m' if key == 'sfc' else 't'
+    level = 850 if key == 'pl' else None
+    
+    def run():
+        result = gp.extract_slice_from_index(path, variable, _middle_step(ctx), level)
+        if result is None or not result['success']:
+            raise RuntimeError('Index extract failed')
+    
+    return run, None
+
+def _store_dir(ctx, key):
+    return os.path.join(ctx['work_dir'], 'stores', key)
+
+def _ensure_store(ctx, key):
+    gp = ctx['gp']
+    store_dir = _store_dir(ctx, key)
+    result = gp.convert_to_array_store(ctx['fixtures'][key], store_dir)
+    if not result['success']:
+        raise RuntimeError(result['error'])
+    return store_dir
+
+def case_convert(ctx, key):
+    gp = ctx['gp']
+    store_dir = _store_dir(ctx, key) + '-convert'
+    
+    def run():
+        result = gp.convert_to_array_store(ctx['fixtures'][key], store_dir)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    
+    return run, (lambda: shutil.rmtree(store_dir, ignore_errors=True))
+
+def case_extract_store(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    variable = 't2m' if key == 'sfc' else 't'
+    level = 850 if key == 'pl' else None
+    
+    def run():
+        result = gp.extract_from_store(store_dir, variable, _middle_step(ctx), level)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    
+    return run, None
+
+def case_timeseries(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    variable = 't2m' if key == 'sfc' else 't'
+    gp.ensure_location_layout(store_dir, variable)
+    points = [{'lat': lat, 'lon': lon} for lat in (-60, -20, 20, 60) for lon in (-120, 0, 120)]
+    
+    def run():
+        result = gp.extract_point_timeseries(store_dir, variable, points, method='bilinear', level=850 if key == 'pl' else None)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    
+    return run, None
+
+def case_render(ctx, key):
+    gp = ctx['gp']
+    ds = gp.open_source_dataset(ctx['fixtures'][key])
+    data_dict = gp.extract_data_for_visualization(ds, 't2m', 0)
+    output_path = os.path.join(ctx['work_dir'], 'render.png')
+    
+    def run():
+        saved = gp.create_visualization(data_dict, output_path, show=False)
+        if saved is None:
+            raise RuntimeError('Render failed')
+    
+    return run, None
+
+def case_tiles(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    gp.build_store_pyramid(store_dir, 't2m')
+    tiles = [(2, x, y) for x in range(4) for y in range(4)]
+    
+    def run():
+        for z, x, y in tiles:
+            gp.render_tile(store_dir, 't2m', 0, z, x, y)
+    
+    return run, None
+
+def case_contours(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    field = gp.extract_from_store(store_dir, 'msl', 0)
+    levels = np.linspace(np.nanmin(field['data']), np.nanmax(field['data']), 12)[1:-1]
+    
+    def run():
+        for level in levels:
+            gp.contour_lines(field['data'], field['lats'], field['lons'], level, gp.contour_tolerance(3))
+    
+    return run, None
+
+def _client(ctx):
+    from flask import Flask
+    app = Flask('grib-benchmark')
+    ctx['gp'].create_grib_api_endpoint(app)
+    return app.test_client()
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+def case_endpoint_parse(ctx, key):
+    gp = ctx['gp']
+    client = _client(ctx)
+    with open(ctx['fixtures'][key], 'rb') as f:
+        body = f.read()
+    
+    def reset():
+        # Every repetition is a first upload: no ingest, parse cache or indexes
+        shutil.rmtree(gp.GRIB_INGEST_DIR, ignore_errors=True)
+        shutil.rmtree(gp.GRIB_CACHE_DIR, ignore_errors=True)
+    
+    def run():
+        _check(client.post('/api/grib/parse', data={'file': (io.BytesIO(body), 'upload.grib')},
+                           content_type='multipart/form-data'))
+    
+    return run, reset
+
+def case_endpoint_extract(ctx, key):
+    client = _client(ctx)
+    payload = {'filepath': ctx['fixtures'][key], 'variable': 't2m', 'timeStep': _middle_step(ctx)}
+    _check(client.post('/api/grib/extract', json=payload))
+    
+    def run():
+        _check(client.post('/api/grib/extract', json=payload))
+    
+    return run, None
+
+def case_endpoint_extract_binary(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    gp.GRIB_STORE_DIR = os.path.dirname(store_dir)
+    client = _client(ctx)
+    payload = {'storeId': key, 'variable': 't2m', 'timeStep': _middle_step(ctx), 'format': 'binary', 'dtype': 'uint16'}
+    
+    def run():
+        _check(client.post('/api/grib/extract', json=payload))
+    
+    return run, None
+
+def case_endpoint_tile(ctx, key):
+    gp = ctx['gp']
+    store_dir = _ensure_store(ctx, key)
+    gp.GRIB_STORE_DIR = os.path.dirname(store_dir)
+    gp.build_store_pyramid(store_dir, 't2m')
+    client = _client(ctx)
+    
+    def reset():
+        shutil.rmtree(os.path.join(store_dir, 'tiles'), ignore_errors=True)
+    
+    def run():
+        _check(client.get(f'/api/grib/tiles/{key}/t2m/0/3/4/2.png'))
+    
+    return run, reset
+
+# Case name -> (function, fixture key)
+CASES = OrderedDict([
+    ('parse.sfc', (case_parse, 'sfc')),
+    ('parse.pl', (case_parse, 'pl')),
+    ('parse.sfc_nc', (case_parse, 'sfc_nc')),
+    ('stats.sfc', (case_stats, 'sfc')),
+    ('stats.pl_nc', (case_stats, 'pl_nc')),
+    ('extract.sfc', (case_extract, 'sfc')),
+    ('extract.pl', (case_extract, 'pl')),
+    ('extract.sfc_nc', (case_extract, 'sfc_nc')),
+    ('extract_index.sfc', (case_extract_index, 'sfc')),
+    ('extract_index.pl', (case_extract_index, 'pl')),
+    ('convert.sfc', (case_convert, 'sfc')),
+    ('extract_store.sfc', (case_extract_store, 'sfc')),
+    ('extract_store.pl', (case_extract_store, 'pl')),
+    ('timeseries.pl', (case_timeseries, 'pl')),
+    ('render.sfc', (case_render, 'sfc')),
+    ('tiles.sfc', (case_tiles, 'sfc')),
+    ('contours.sfc', (case_contours, 'sfc')),
+    ('endpoint.parse.sfc', (case_endpoint_parse, 'sfc')),
+    ('endpoint.extract.sfc', (case_endpoint_extract, 'sfc')),
+    ('endpoint.extract_binary.sfc', (case_endpoint_extract_binary, 'sfc')),
+    ('endpoint.tile.sfc', (case_endpoint_tile, 'sfc'))
+])
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _run_case(name, ctx, repeat, conn):
+    """Child process body: set up, time the case and report through the pipe"""
+    try:
+        func, key = CASES[name]
+        ctx['gp'] = load_grib_parser()
+        start_rss = _current_rss_mb()
+        run, reset = func(ctx, key)
+        times = []
+        for _ in range(repeat):
+            if reset is not None:
+                reset()
+            started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - started)
+        conn.send({
+            'seconds': {
+                'min': min(times),
+                'median': statistics.median(times),
+                'mean': statistics.fmean(times),
+                'runs': times
+            },
+            'startRssMb': start_rss,
+            'peakRssMb': _peak_rss_mb()
+        })
+    except Exception as e:
+        conn.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        conn.close()
+
+def run_case(name, ctx, repeat):
+    """
+    Run one case in a fresh process so its peak RSS is its own
+    
+    Returns:
+        dict: Timings (seconds min/median/mean/runs) and RSS, or {'error': ...}
+    """
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case, args=(name, ctx, repeat, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {'error': f'Case process exited with code {process.exitcode}'}
+    process.join()
+    return result
+
+def run_benchmarks(preset, cases=None, repeat=3, fixtures_dir=None, levels=DEFAULT_LEVELS):
+    """
+    Generate fixtures and run benchmark cases
+    
+    Args:
+        preset (str): Key of PRESETS
+        cases (list): Case names or prefixes (default: all)
+        repeat (int): Timed repetitions per case
+        fixtures_dir (str): Where fixtures are generated and reused
+        levels (tuple): Pressure levels of the pressure-level fixtures
+    
+    Returns:
+        dict: JSON-serializable results
+    """
+    fixtures_dir = fixtures_dir or os.path.join(BENCHMARK_DIR, 'fixtures')
+    fixtures = ensure_fixtures(preset, fixtures_dir, levels)
+    
+    selected = [
+        name for name in CASES
+        if cases is None or any(name == c or name.startswith(c + '.') for c in cases)
+    ]
+    work_dir = tempfile.mkdtemp(prefix=f'{preset}-', dir=BENCHMARK_DIR)
+    # Point every grib-parser cache at the scratch directory before it is imported
+    for var, sub in (('GRIB_CACHE_DIR', 'cache'), ('GRIB_STORE_DIR', 'stores'), ('GRIB_INGEST_DIR', 'ingest'),
+                     ('GRIB_CATALOG_DIR', 'catalog'), ('GRIB_BASELINE_DIR', 'baselines')):
+        os.environ[var] = os.path.join(work_dir, sub)
+    
+    results = OrderedDict()
+    try:
+        ctx = {'preset': preset, 'fixtures': fixtures, 'work_dir': work_dir}
+        for name in selected:
+            if CASES[name][1] not in fixtures:
+                results[name] = {'skipped': f'No {CASES[name][1]} fixture'}
+                continue
+            print(f"  {name}...", end=' ', flush=True)
+            results[name] = run_case(name, ctx, repeat)
+            if 'error' in results[name]:
+                print(f"error: {results[name]['error']}")
+            else:
+                print(f"{results[name]['seconds']['median'] * 1000:.1f} ms, peak {results[name]['peakRssMb']:.0f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return {
+        'createdAt': datetime.utcnow().isoformat(),
+        'preset': preset,
+        'dataset': {
+            **PRESETS[preset],
+            'levels': list(levels),
+            'fixtures': {key: {'path': path, 'bytes': os.path.getsize(path)} for key, path in fixtures.items()}
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'repeat': repeat,
+        'results': results
+    }
+
+def compare_results(current, baseline, threshold=0.2, rss_threshold=0.2, min_delta=0.005, min_rss_delta=64):
+    """
+    Compare two result files case by case
+    
+    Args:
+        current (dict): Results from run_benchmarks
+        baseline (dict): Stored results to compare against
+        threshold (float): Allowed relative slowdown of the median time
+        rss_threshold (float): Allowed relative growth of the peak RSS
+        min_delta (float): Slowdowns smaller than this many seconds are noise
+        min_rss_delta (float): Peak RSS growth below this many MB is noise
+            (the peak includes interpreter, imports and case setup)
+    
+    Returns:
+        list: Regressions as dicts (case, metric, baseline, current, ratio)
+    """
+    if current.get('preset') != baseline.get('preset'):
+        raise ValueError(f"Baseline preset {baseline.get('preset')} does not match {current.get('preset')}")
+    
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base or 'seconds' not in base or 'seconds' not in result:
+            continue
+        
+        now, before = result['seconds']['median'], base['seconds']['median']
+        if before > 0 and now > before * (1 + threshold) and now - before > min_delta:
+            regressions.append({'case': name, 'metric': 'seconds', 'baseline': before, 'current': now, 'ratio': now / before})
+        
+        now, before = result.get('peakRssMb'), base.get('peakRssMb')
+        if now and before and now > before * (1 + rss_threshold) and now - before > min_rss_delta:
+            regressions.append({'case': name, 'metric': 'peakRssMb', 'baseline': before, 'current': now, 'ratio': now / before})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the GRIB pipeline on synthetic ERA5-shaped data')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='smoke')
+    parser.add_argument('--cases', help='Comma-separated case names or prefixes (e.g. parse,endpoint)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--levels', default=','.join(str(v) for v in DEFAULT_LEVELS), help='Pressure levels (hPa)')
+    parser.add_argument('--fixtures-dir', help='Where fixtures are generated and reused')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown')
+    parser.add_argument('--rss-threshold', type=float, default=0.2, help='Allowed relative peak RSS growth')
+    parser.add_argument('--list', action='store_true', help='List cases and exit')
+    args = parser.parse_args(argv)
+    
+    if args.list:
+        for name in CASES:
+            print(name)
+        return 0
+    
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    print(f"Running {args.preset} benchmarks ({PRESETS[args.preset]['grid']}°, {PRESETS[args.preset]['hours']} hours)")
+    results = run_benchmarks(
+        args.preset,
+        cases=args.cases.split(',') if args.cases else None,
+        repeat=max(1, args.repeat),
+        fixtures_dir=args.fixtures_dir,
+        levels=tuple(int(v) for v in args.levels.split(','))
+    )
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.output}")
+    
+    failed = [name for name, result in results['results'].items() if 'error' in result]
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold, args.rss_threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['ratio']:.2f}x)")
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
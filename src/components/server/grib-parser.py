@@ -23,20 +23,424 @@ import matplotlib.pyplot as plt
 import json
 from datetime import datetime
 import os
+import re
+import sys
+import time
+import multiprocessing
+import gzip
+import math
+import zlib
+import base64
+import bisect
+import struct
+import shutil
+import fcntl
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def parse_grib_file(filepath):
+try:
+    import eccodes  # installed alongside cfgrib; used for message-level random access
+except ImportError:
+    eccodes = None
+
+try:
+    import netCDF4  # optional, for block-wise NetCDF subset downloads
+except ImportError:
+    netCDF4 = None
+
+try:
+    import zstandard  # optional, for zstd-compressed binary responses
+except ImportError:
+    zstandard = None
+
+try:
+    import scipy.sparse  # optional, for regridding weights
+except ImportError:
+    scipy = None
+
+# Content-addressed cache of parsed GRIB results (persists across restarts)
+GRIB_CACHE_DIR = os.environ.get('GRIB_CACHE_DIR', '/tmp/grib_cache')
+GRIB_CACHE_MAX_BYTES = int(os.environ.get('GRIB_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+HASH_CHUNK_SIZE = 1024 * 1024
+_cache_lock = threading.Lock()
+
+# Maximum number of open datasets kept by the /api/grib/extract handle pool
+GRIB_POOL_SIZE = int(os.environ.get('GRIB_POOL_SIZE', 8))
+
+# Leading-dimension steps (e.g. hours) decoded per chunk in lazy mode
+DEFAULT_CHUNK_STEPS = int(os.environ.get('GRIB_CHUNK_STEPS', 4))
+
+# Chunked, memory-mappable array stores converted from GRIB/NetCDF files
+GRIB_STORE_DIR = os.environ.get('GRIB_STORE_DIR', '/tmp/grib_store')
+GRIB_STORE_LAYOUTS = tuple(os.environ.get('GRIB_STORE_LAYOUTS', 'time,location').split(','))
+STORE_METADATA = 'store.json'
+
+# Coordinate names used by cfgrib and by CDS NetCDF output
+TIME_DIMS = ('time', 'valid_time')
+LEVEL_DIMS = ('isobaricInhPa', 'pressure_level', 'level')
+LAT_NAMES = ('latitude', 'lat')
+LON_NAMES = ('longitude', 'lon')
+
+# Process metrics: counters, latency histograms and per-stage timing spans.
+# With METRICS_DIR set, every process (web workers, Celery) periodically dumps
+# its values to <METRICS_DIR>/<pid>.json and /api/metrics merges them all.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+# Request header that opts a single request into a Server-Timing stage breakdown
+PROFILE_HEADER = 'X-Profile'
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms rendered in Prometheus text format
+    
+    Series are keyed by metric name and label set. Gauges are not stored;
+    collectors registered with add_collector compute them at scrape time.
+    """
+    
+    def __init__(self, metrics_dir=METRICS_DIR, buckets=METRIC_BUCKETS):
+        self.metrics_dir = metrics_dir
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+    
+    def describe(self, name, kind, text):
+        """Set the TYPE and HELP lines emitted for a metric"""
+        self._help[name] = (kind, text)
+    
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+        self._maybe_flush()
+    
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram"""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][index] += 1
+            hist[1] += value
+            self._dirty = True
+        self._maybe_flush()
+    
+    def add_collector(self, collector):
+        """
+        Register a scrape-time gauge source
+        
+        Args:
+            collector: Callable returning (name, labels dict, value) tuples
+        """
+        self._collectors.append(collector)
+    
+    def snapshot(self):
+        """Return counters and histograms as JSON-serializable lists"""
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, dict(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items()]
+            }
+    
+    def _maybe_flush(self):
+        if self.metrics_dir and time.monotonic() - self._flushed_at >= METRICS_FLUSH_SECONDS:
+            self.flush()
+    
+    def flush(self):
+        """Write this process's values to METRICS_DIR (no-op when unset or unchanged)"""
+        if not self.metrics_dir or not self._dirty:
+            return
+        self._flushed_at = time.monotonic()
+        self._dirty = False
+        path = os.path.join(self.metrics_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Metrics must never fail the work they measure
+            print(f"Error flushing metrics: {e}")
+    
+    def _merged(self):
+        snapshots = [self.snapshot()]
+        if self.metrics_dir and os.path.isdir(self.metrics_dir):
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(self.metrics_dir):
+                if not name.endswith('.json') or name == own:
+                    continue
+                try:
+                    with open(os.path.join(self.metrics_dir, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            if snap.get('buckets') != list(self.buckets):
+                continue
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(sorted(labels.items())))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in snap['histograms']:
+                key = (name, tuple(sorted(labels.items())))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms
+    
+    def render(self):
+        """Render all series (merged across processes) in Prometheus text format"""
+        counters, histograms = self._merged()
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        
+        lines = []
+        described = set()
+        
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, text = self._help.get(name, (kind, None))
+            if text:
+                lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+        
+        for kind, series in (('counter', counters), ('gauge', gauges)):
+            for name, labels in sorted(series):
+                header(name, kind)
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(series[(name, labels)])}")
+        
+        for name, labels in sorted(histograms):
+            header(name, 'histogram')
+            counts, total = histograms[(name, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+metrics = MetricsRegistry()
+metrics.describe('pipeline_stage_seconds', 'histogram', 'Time spent in each processing stage')
+metrics.describe('cache_requests_total', 'counter', 'Cache lookups by cache and result (hit/miss)')
+metrics.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by route, method and status')
+metrics.describe('http_response_bytes_total', 'counter', 'Response body bytes sent by route')
+
+# Stage timings of the request being profiled on this thread (None when not profiling)
+_profile = threading.local()
+
+@contextmanager
+def span(stage):
+    """
+    Time a processing stage into pipeline_stage_seconds
+    
+    Args:
+        stage (str): Stage name (e.g. 'open', 'decode', 'serialize')
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe('pipeline_stage_seconds', elapsed, stage=stage)
+        stages = getattr(_profile, 'stages', None)
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+def count_cache(cache, hit):
+    """Count one lookup in the named cache"""
+    metrics.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+def server_timing(stages, total=None):
+    """
+    Format stage timings as a Server-Timing header value
+    
+    Repeated stages are summed and keep their first position.
+    
+    Args:
+        stages (list): (stage, seconds) pairs in completion order
+        total (float): Whole-request seconds, appended as 'total'
+    """
+    summed = OrderedDict()
+    for stage, elapsed in stages:
+        count, seconds = summed.get(stage, (0, 0.0))
+        summed[stage] = (count + 1, seconds + elapsed)
+    
+    entries = []
+    for stage, (count, seconds) in summed.items():
+        entry = f"{stage};dur={seconds * 1000:.2f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
+
+def install_request_metrics(app):
+    """
+    Record latency/bytes for every request, honour the profiling header and serve /api/metrics
+    
+    Args:
+        app: Flask application instance
+    """
+    from flask import request, g, Response
+    
+    if app.config.get('REQUEST_METRICS_INSTALLED'):
+        return
+    app.config['REQUEST_METRICS_INSTALLED'] = True
+    
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        _profile.stages = [] if request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes') else None
+    
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # Route templates keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('http_request_duration_seconds', elapsed,
+                        route=route, method=request.method, status=response.status_code)
+        size = response.content_length
+        if size is None:
+            size = response.calculate_content_length()
+        if size:
+            metrics.inc('http_response_bytes_total', size, route=route)
+        
+        stages = getattr(_profile, 'stages', None)
+        if stages is not None:
+            response.headers['Server-Timing'] = server_timing(stages, elapsed)
+        return response
+    
+    @app.teardown_request
+    def stop_request_profile(exc=None):
+        _profile.stages = None
+    
+    @app.route('/api/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Prometheus scrape endpoint"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def _iter_blocks(var_data, chunk_steps=None):
+    """Yield numpy blocks of a variable along its leading dimension"""
+    if chunk_steps is None or var_data.ndim == 0:
+        yield np.asarray(var_data.values)
+        return
+    
+    lead_dim = var_data.dims[0]
+    for start in range(0, var_data.shape[0], chunk_steps):
+        yield np.asarray(var_data.isel({lead_dim: slice(start, start + chunk_steps)}).values)
+
+def compute_variable_stats(var_data, chunk_steps=None):
+    """
+    Compute min/max/mean/count/NaN count in a single pass over the data
+    
+    Args:
+        var_data: xarray DataArray
+        chunk_steps (int): Leading-dimension steps per chunk (None loads the whole variable)
+        
+    Returns:
+        dict: Summary statistics (min/max/mean are None if every value is NaN)
+    """
+    acc = _new_stats()
+    with span('stats'):
+        for block in _iter_blocks(var_data, chunk_steps):
+            _accumulate_stats(acc, block)
+    return _finish_stats(acc)
+
+def _new_stats():
+    return {'min': np.inf, 'max': -np.inf, 'sum': 0.0, 'count': 0, 'nanCount': 0}
+
+def _accumulate_stats(acc, block):
+    """Fold one block into running min/max/sum/count/NaN count"""
+    if np.issubdtype(block.dtype, np.floating):
+        valid = ~np.isnan(block)
+        n_valid = int(np.count_nonzero(valid))
+        acc['nanCount'] += block.size - n_valid
+        if n_valid < block.size:
+            block = block[valid]
+    else:
+        n_valid = block.size
+    
+    if n_valid == 0:
+        return
+    
+    acc['min'] = min(acc['min'], float(block.min()))
+    acc['max'] = max(acc['max'], float(block.max()))
+    acc['sum'] += float(block.sum(dtype=np.float64))
+    acc['count'] += n_valid
+
+def _finish_stats(acc):
+    count = acc['count']
+    return {
+        'min': acc['min'] if count else None,
+        'max': acc['max'] if count else None,
+        'mean': acc['sum'] / count if count else None,
+        'count': count,
+        'nanCount': acc['nanCount']
+    }
+
+def parse_grib_file(filepath, lazy=False, load_raw=None, chunk_steps=DEFAULT_CHUNK_STEPS):
     """
     Parse a GRIB file and extract metadata and data arrays
     
     Args:
         filepath (str): Path to the GRIB file
+        lazy (bool): Decode variables chunk by chunk instead of loading them whole,
+            so peak memory scales with chunk_steps rather than file size
+        load_raw (bool): Include fully loaded arrays in 'raw_data' (default: not lazy)
+        chunk_steps (int): Leading-dimension steps decoded per chunk in lazy mode
         
     Returns:
         dict: Parsed data with metadata and arrays
     """
+    if load_raw is None:
+        load_raw = not lazy
+    
     try:
-        # Open GRIB file with xarray and cfgrib
-        ds = xr.open_dataset(filepath, engine='cfgrib')
+        # Open GRIB file with xarray and cfgrib (without caching decoded values in lazy mode)
+        with span('open'):
+            ds = xr.open_dataset(filepath, engine='cfgrib', cache=not lazy)
         
         # Extract metadata
         metadata = {
@@ -80,6 +484,7 @@ def parse_grib_file(filepath):
         
         # Process each variable
         for var_name, var_data in ds.data_vars.items():
+            stats = compute_variable_stats(var_data, chunk_steps if lazy else None)
             var_info = {
                 'name': var_name,
                 'description': var_data.attrs.get('long_name', var_name),
@@ -87,20 +492,63 @@ def parse_grib_file(filepath):
                 'levels': list(var_data.coords.get('isobaricInhPa', [1000]).values) if 'isobaricInhPa' in var_data.coords else [1000],
                 'timeSteps': len(times_array) if times is not None else 1,
                 'dataRange': {
-                    'min': float(var_data.min().values),
-                    'max': float(var_data.max().values)
+                    'min': stats['min'],
+                    'max': stats['max']
+                },
+                'stats': {
+                    'mean': stats['mean'],
+                    'count': stats['count'],
+                    'nanCount': stats['nanCount']
                 },
                 'shape': list(var_data.shape),
                 'data': var_data.values.tolist() if var_data.size < 10000 else 'too_large'  # Only include small arrays
             }
             metadata['variables'].append(var_info)
         
-        return {
+        # Wind speed/direction from each u/v pair, one pass over both components
+        derived = {}
+        for u_name, v_name, speed_name, dir_name in wind_pairs(ds.data_vars):
+            names = [n for n in (speed_name, dir_name) if n not in ds.data_vars]
+            accs = {name: _new_stats() for name in names}
+            keep = ds[u_name].size < 10000
+            blocks = {name: [] for name in names}
+            for u_block, v_block in zip(
+                _iter_blocks(ds[u_name], chunk_steps if lazy else None),
+                _iter_blocks(ds[v_name], chunk_steps if lazy else None)
+            ):
+                speed, direction = wind_speed_direction(u_block, v_block)
+                for name, block in ((speed_name, speed), (dir_name, direction)):
+                    if name in accs:
+                        _accumulate_stats(accs[name], block)
+                        if keep or load_raw:
+                            blocks[name].append(block)
+            
+            u_info = next(v for v in metadata['variables'] if v['name'] == u_name)
+            for name in names:
+                stats = _finish_stats(accs[name])
+                units, description = _derived_wind_info('speed' if name == speed_name else 'direction', u_info['units'])
+                values = np.concatenate([np.atleast_1d(b) for b in blocks[name]]).reshape(ds[u_name].shape) if blocks[name] else None
+                metadata['variables'].append({
+                    **u_info,
+                    'name': name,
+                    'description': description,
+                    'units': units,
+                    'dataRange': {'min': stats['min'], 'max': stats['max']},
+                    'stats': {'mean': stats['mean'], 'count': stats['count'], 'nanCount': stats['nanCount']},
+                    'data': values.tolist() if keep else 'too_large',
+                    'derivedFrom': [u_name, v_name]
+                })
+                derived[name] = values
+        
+        result = {
             'success': True,
             'metadata': metadata,
-            'dataset': ds,
-            'raw_data': {var: ds[var].values for var in ds.data_vars}
+            'dataset': ds
         }
+        if load_raw:
+            result['raw_data'] = {var: ds[var].values for var in ds.data_vars}
+            result['raw_data'].update(derived)
+        return result
         
     except Exception as e:
         return {
@@ -109,7 +557,128 @@ def parse_grib_file(filepath):
             'metadata': None
         }
 
-def extract_data_for_visualization(ds, variable, time_step=0, level=None):
+def parse_bbox(bbox):
+    """
+    Normalize a bounding box given as a dict or in CDS order [north, west, south, east]
+    
+    Returns:
+        dict: {'north', 'south', 'east', 'west'} floats, or None
+    """
+    if bbox is None:
+        return None
+    if isinstance(bbox, dict):
+        return {key: float(bbox[key]) for key in ('north', 'south', 'east', 'west')}
+    north, west, south, east = (float(v) for v in bbox)
+    return {'north': north, 'south': south, 'east': east, 'west': west}
+
+def _bbox_window(lats, lons, bbox):
+    """
+    Translate a bbox into index slices on the grid
+    
+    Returns:
+        tuple: (lat slice, list of lon slices, subset lats, subset lons). A box
+            crossing the grid's longitude seam yields two lon slices, with one
+            segment shifted by 360 so longitudes stay monotonic in the bbox's
+            own convention.
+    """
+    if bbox is None:
+        return slice(None), [slice(None)], lats, lons
+    
+    lat_idx = np.nonzero((lats >= bbox['south']) & (lats <= bbox['north']))[0]
+    if len(lat_idx) == 0:
+        raise ValueError('Bounding box does not overlap the grid')
+    lat_slice = slice(int(lat_idx[0]), int(lat_idx[-1]) + 1)
+    
+    if bbox['east'] - bbox['west'] >= 360:
+        lon_slices = [slice(None)]
+    else:
+        west, east = _normalize_lons(lons, [bbox['west'], bbox['east']])
+        if west <= east:
+            segments = [np.nonzero((lons >= west) & (lons <= east))[0]]
+        else:
+            segments = [np.nonzero(lons >= west)[0], np.nonzero(lons <= east)[0]]
+        segments = [seg for seg in segments if len(seg)]
+        if not segments:
+            raise ValueError('Bounding box does not overlap the grid')
+        lon_slices = [slice(int(seg[0]), int(seg[-1]) + 1) for seg in segments]
+    
+    sub_lons = [np.asarray(lons[sl], dtype=np.float64) for sl in lon_slices]
+    if len(sub_lons) == 2:
+        if bbox['west'] < 0:
+            sub_lons[0] = sub_lons[0] - 360.0
+        else:
+            sub_lons[1] = sub_lons[1] + 360.0
+    return lat_slice, lon_slices, lats[lat_slice], np.concatenate(sub_lons)
+
+def block_mean(data, factor_y, factor_x):
+    """
+    Downsample the last two axes by block averaging (NaN-aware, ragged edges kept)
+    
+    Args:
+        data (numpy.ndarray): Array with (lat, lon) as its last two axes
+        factor_y (int): Block height
+        factor_x (int): Block width
+        
+    Returns:
+        numpy.ndarray: Block means
+    """
+    data = np.asarray(data)
+    if factor_y <= 1 and factor_x <= 1:
+        return data
+    
+    out_dtype = np.result_type(data.dtype, np.float32)
+    *lead, ny, nx = data.shape
+    pad_y, pad_x = -ny % factor_y, -nx % factor_x
+    padded = np.pad(
+        data.astype(np.float64),
+        [(0, 0)] * len(lead) + [(0, pad_y), (0, pad_x)],
+        constant_values=np.nan
+    )
+    valid = ~np.isnan(padded)
+    blocks = (*lead, (ny + pad_y) // factor_y, factor_y, (nx + pad_x) // factor_x, factor_x)
+    sums = np.where(valid, padded, 0.0).reshape(blocks).sum(axis=(-3, -1))
+    counts = valid.reshape(blocks).sum(axis=(-3, -1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).astype(out_dtype)
+
+def _downsample_factors(shape, stride=None, target_shape=None):
+    factor_y = factor_x = max(int(stride or 1), 1)
+    if target_shape:
+        height, width = (int(v) for v in target_shape)
+        factor_y = max(factor_y, -(-shape[-2] // max(height, 1)))
+        factor_x = max(factor_x, -(-shape[-1] // max(width, 1)))
+    return factor_y, factor_x
+
+def subset_field(read, lats, lons, bbox=None, stride=None, target_shape=None):
+    """
+    Read a bbox window of a field and block-mean downsample it
+    
+    Args:
+        read (callable): read(lat_slice, lon_slice) -> ndarray with (lat, lon)
+            as the last two axes; only the requested window is loaded
+        lats (numpy.ndarray): Grid latitudes
+        lons (numpy.ndarray): Grid longitudes
+        bbox (dict): Optional bounding box (see parse_bbox)
+        stride (int): Optional block size for downsampling
+        target_shape (tuple): Optional (height, width) upper bound on the output
+        
+    Returns:
+        tuple: (data, lats, lons)
+    """
+    lat_slice, lon_slices, sub_lats, sub_lons = _bbox_window(np.asarray(lats), np.asarray(lons), bbox)
+    with span('decode'):
+        parts = [read(lat_slice, lon_slice) for lon_slice in lon_slices]
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=-1)
+    
+    factor_y, factor_x = _downsample_factors(data.shape, stride, target_shape)
+    if factor_y > 1 or factor_x > 1:
+        with span('downsample'):
+            data = block_mean(data, factor_y, factor_x)
+        sub_lats = block_mean(np.asarray(sub_lats, dtype=np.float64)[None, :], 1, factor_y)[0]
+        sub_lons = block_mean(np.asarray(sub_lons, dtype=np.float64)[None, :], 1, factor_x)[0]
+    return data, sub_lats, sub_lons
+
+def extract_data_for_visualization(ds, variable, time_step=0, level=None, bbox=None, stride=None, target_shape=None):
     """
     Extract 2D data array for visualization
     
@@ -118,11 +687,22 @@ def extract_data_for_visualization(ds, variable, time_step=0, level=None):
         variable (str): Variable name
         time_step (int): Time step index
         level (float): Pressure level (if applicable)
+        bbox (dict): Optional bounding box, applied by index before loading
+        stride (int): Optional block-mean downsampling factor
+        target_shape (tuple): Optional (height, width) upper bound on the output
         
     Returns:
         dict: Data array and coordinates for visualization
     """
     try:
+        if variable not in ds.data_vars:
+            derived = extract_wind_field(
+                lambda name: extract_data_for_visualization(ds, name, time_step, level, bbox, stride, target_shape),
+                variable, ds.data_vars
+            )
+            if derived is not None:
+                return derived
+        
         var_data = ds[variable]
         
         # Select time step
@@ -132,18 +712,32 @@ def extract_data_for_visualization(ds, variable, time_step=0, level=None):
             var_data = var_data.isel(valid_time=time_step)
         
         # Select level if applicable
-        if level is not None and 'isobaricInhPa' in var_data.dims:
-            var_data = var_data.sel(isobaricInhPa=level, method='nearest')
+        level_dim = next((d for d in var_data.dims if d in LEVEL_DIMS), None)
+        if level is not None and level_dim is not None:
+            var_data = var_data.sel({level_dim: level}, method='nearest')
         
         # Get coordinates
         lats = var_data.coords.get('latitude', var_data.coords.get('lat'))
         lons = var_data.coords.get('longitude', var_data.coords.get('lon'))
+        lat_dim = next((d for d in var_data.dims if d in LAT_NAMES), None)
+        lon_dim = next((d for d in var_data.dims if d in LON_NAMES), None)
+        
+        if lat_dim is not None and lon_dim is not None:
+            # Slice the window by index before any values are decoded
+            data, lat_values, lon_values = subset_field(
+                lambda ys, xs: var_data.isel({lat_dim: ys, lon_dim: xs}).transpose(..., lat_dim, lon_dim).values,
+                lats.values, lons.values, bbox, stride, target_shape
+            )
+        else:
+            data = var_data.values
+            lat_values = lats.values if lats is not None else None
+            lon_values = lons.values if lons is not None else None
         
         return {
             'success': True,
-            'data': var_data.values,
-            'lats': lats.values if lats is not None else None,
-            'lons': lons.values if lons is not None else None,
+            'data': data,
+            'lats': lat_values,
+            'lons': lon_values,
             'units': var_data.attrs.get('units', ''),
             'description': var_data.attrs.get('long_name', variable)
         }
@@ -154,7 +748,7 @@ def extract_data_for_visualization(ds, variable, time_step=0, level=None):
             'error': str(e)
         }
 
-def create_visualization(data_dict, output_path=None, colormap='viridis'):
+def create_visualization(data_dict, output_path=None, colormap='viridis', dpi=300, show=True):
     """
     Create a matplotlib visualization of the data
     
@@ -162,6 +756,8 @@ def create_visualization(data_dict, output_path=None, colormap='viridis'):
         data_dict (dict): Data dictionary from extract_data_for_visualization
         output_path (str): Path to save the image (optional)
         colormap (str): Matplotlib colormap name
+        dpi (int): Resolution of the saved image
+        show (bool): Display the figure (blocks until closed; disable on headless servers)
         
     Returns:
         str: Path to saved image or None
@@ -170,6 +766,7 @@ def create_visualization(data_dict, output_path=None, colormap='viridis'):
         print(f"Error: {data_dict['error']}")
         return None
     
+    fig = None
     try:
         fig, ax = plt.subplots(figsize=(12, 6))
         
@@ -200,22 +797,110 @@ def create_visualization(data_dict, output_path=None, colormap='viridis'):
         
         # Save if output path provided
         if output_path:
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Visualization saved to: {output_path}")
+            fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
         
-        plt.show()
+        if show:
+            plt.show()
         return output_path
         
     except Exception as e:
         print(f"Error creating visualization: {e}")
         return None
+    
+    finally:
+        # Release the figure so repeated renders don't accumulate memory
+        if fig is not None:
+            plt.close(fig)
+
+# Per-process state for render_frames_batch workers
+_render_worker = {}
+
+def _init_render_worker(filepath):
+    """Process pool initializer: headless backend and one preloaded dataset per worker"""
+    plt.switch_backend('Agg')
+    _render_worker['ds'] = open_source_dataset(filepath)
 
-def analyze_grib_file(filepath):
+def _render_frame(task):
+    variable, time_step, level, output_path, colormap, dpi = task
+    data_dict = extract_data_for_visualization(_render_worker['ds'], variable, time_step, level)
+    return create_visualization(data_dict, output_path, colormap, dpi=dpi, show=False)
+
+def render_frames_batch(filepath, output_dir, variables=None, time_steps=None, levels=None,
+                        colormap='viridis', dpi=100, workers=None):
+    """
+    Render (variable x time step x level) frames in parallel on the Agg backend
+    
+    Args:
+        filepath (str): Path to the GRIB/NetCDF file
+        output_dir (str): Directory for the PNG frames
+        variables (list): Variables to render (default: all)
+        time_steps (list): Time step indices (default: all)
+        levels (list): Pressure levels for multi-level variables (default: all)
+        colormap (str): Matplotlib colormap name
+        dpi (int): Frame resolution
+        workers (int): Worker processes (default: CPU count)
+        
+    Returns:
+        dict: Rendered frame paths, failure count and frames/sec
+    """
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # Enumerate frames from the dataset's shape without loading any values
+        tasks = []
+        ds = open_source_dataset(filepath)
+        try:
+            for var_name in (variables or list(ds.data_vars)):
+                var_data = ds[var_name]
+                time_dim = next((d for d in var_data.dims if d in TIME_DIMS), None)
+                level_dim = next((d for d in var_data.dims if d in LEVEL_DIMS), None)
+                steps = time_steps if time_steps is not None else range(var_data.sizes[time_dim] if time_dim else 1)
+                var_levels = [None]
+                if level_dim is not None:
+                    var_levels = levels if levels is not None else [float(v) for v in var_data[level_dim].values]
+                
+                for step in steps:
+                    for level in var_levels:
+                        suffix = f"_{level:g}" if level is not None else ''
+                        output_path = os.path.join(output_dir, f"{var_name}{suffix}_t{step:04d}.png")
+                        tasks.append((var_name, step, level, output_path, colormap, dpi))
+        finally:
+            ds.close()
+        
+        workers = workers or os.cpu_count() or 1
+        # Fork shares the imported modules with workers; fall back to the platform default
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_render_worker, initargs=(filepath,)) as pool:
+            results = list(pool.map(_render_frame, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        elapsed = time.perf_counter() - start
+        
+        frames = [path for path in results if path]
+        return {
+            'success': True,
+            'frames': frames,
+            'failed': len(tasks) - len(frames),
+            'elapsed': elapsed,
+            'framesPerSecond': len(frames) / elapsed if elapsed > 0 else 0.0
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def analyze_grib_file(filepath, render_all_frames=False, workers=None):
     """
     Complete analysis of a GRIB file
     
     Args:
         filepath (str): Path to GRIB file
+        render_all_frames (bool): Render every time step/level in parallel
+            instead of one figure per variable
+        workers (int): Worker processes for frame rendering
     """
     print(f"Analyzing GRIB file: {filepath}")
     print("=" * 50)
@@ -242,22 +927,38 @@ def analyze_grib_file(filepath):
     print("Variables:")
     for var in metadata['variables']:
         print(f"  - {var['name']}: {var['description']} ({var['units']})")
-        print(f"    Range: {var['dataRange']['min']:.2f} to {var['dataRange']['max']:.2f}")
+        data_range = var['dataRange']
+        if data_range['min'] is None:
+            # All-NaN variables have no range
+            print("    Range: n/a (no valid values)")
+        else:
+            print(f"    Range: {data_range['min']:.2f} to {data_range['max']:.2f}")
         print(f"    Shape: {var['shape']}")
         print()
     
-    # Create visualizations for each variable
-    for var in metadata['variables']:
-        print(f"Creating visualization for {var['name']}...")
-        
-        # Extract data for first time step
-        data_dict = extract_data_for_visualization(ds, var['name'], time_step=0)
-        
-        if data_dict['success']:
-            output_path = f"{var['name']}_visualization.png"
-            create_visualization(data_dict, output_path)
+    if render_all_frames:
+        frames_dir = f"{os.path.splitext(metadata['filename'])[0]}_frames"
+        print(f"Rendering animation frames to {frames_dir}...")
+        batch = render_frames_batch(filepath, frames_dir, workers=workers)
+        if batch['success']:
+            print(f"Rendered {len(batch['frames'])} frames in {batch['elapsed']:.1f}s "
+                  f"({batch['framesPerSecond']:.1f} frames/sec, {batch['failed']} failed)")
         else:
-            print(f"Error extracting data for {var['name']}: {data_dict['error']}")
+            print(f"Error rendering frames: {batch['error']}")
+    else:
+        # Create visualizations for each variable
+        for var in metadata['variables']:
+            print(f"Creating visualization for {var['name']}...")
+            
+            # Extract data for first time step
+            data_dict = extract_data_for_visualization(ds, var['name'], time_step=0)
+            
+            if data_dict['success']:
+                output_path = f"{var['name']}_visualization.png"
+                if create_visualization(data_dict, output_path, show=False):
+                    print(f"Visualization saved to: {output_path}")
+            else:
+                print(f"Error extracting data for {var['name']}: {data_dict['error']}")
     
     # Save metadata as JSON
     metadata_path = f"{os.path.splitext(metadata['filename'])[0]}_metadata.json"
@@ -266,81 +967,4459 @@ def analyze_grib_file(filepath):
     
     print(f"Metadata saved to: {metadata_path}")
 
-if __name__ == "__main__":
-    # Example usage for your specific GRIB file
-    grib_file = "6b909394d57791d45411e9d872774061.grib"
+def _cache_entry_dir(file_hash):
+    return os.path.join(GRIB_CACHE_DIR, file_hash)
+
+def _array_filename(var_name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', var_name) + '.npy'
+
+def get_cached_parse(file_hash):
+    """
+    Look up a parsed result by content hash
     
-    # Check if file exists in current directory
-    if os.path.exists(grib_file):
-        analyze_grib_file(grib_file)
-    else:
-        print(f"GRIB file not found: {grib_file}")
-        print("Please ensure the file is in the current directory or provide the full path.")
+    Args:
+        file_hash (str): SHA-256 hex digest of the GRIB file
         
-        # Example of how to use with a different path
-        print("\nExample usage:")
-        print(f"python {__file__} /path/to/your/grib/file.grib")
+    Returns:
+        dict: Cached metadata, or None on a miss
+    """
+    entry_dir = _cache_entry_dir(file_hash)
+    try:
+        with open(os.path.join(entry_dir, 'metadata.json')) as f:
+            metadata = json.load(f)
+        # Mark as recently used for LRU eviction
+        os.utime(entry_dir)
+    except (OSError, ValueError):
+        count_cache('parse', False)
+        return None
+    count_cache('parse', True)
+    return metadata
 
-# Example API endpoint for Flask integration
-def create_grib_api_endpoint():
+def load_cached_arrays(file_hash, variables=None):
+    """
+    Load cached per-variable arrays as read-only memory maps
+    
+    Args:
+        file_hash (str): SHA-256 hex digest of the GRIB file
+        variables (list): Variable names to load (default: all cached)
+        
+    Returns:
+        dict: Variable name -> numpy memmap, or None on a miss
     """
-    Example Flask endpoint for GRIB file processing
-    Add this to your cds-api-service.py
+    metadata = get_cached_parse(file_hash)
+    if metadata is None:
+        return None
+    
+    arrays = {}
+    for var in metadata['variables']:
+        if variables is not None and var['name'] not in variables:
+            continue
+        path = os.path.join(_cache_entry_dir(file_hash), _array_filename(var['name']))
+        if os.path.exists(path):
+            arrays[var['name']] = np.load(path, mmap_mode='r')
+    return arrays
+
+def cache_parse_result(file_hash, result, chunk_steps=DEFAULT_CHUNK_STEPS):
     """
-    from flask import request, jsonify
+    Store a successful parse_grib_file result under its content hash
     
-    @app.route('/api/grib/parse', methods=['POST'])
-    def parse_grib_endpoint():
+    Args:
+        file_hash (str): SHA-256 hex digest of the GRIB file
+        result (dict): Result from parse_grib_file
+        chunk_steps (int): Leading-dimension steps copied per chunk
+        
+    Returns:
+        bool: True if the entry was written
+    """
+    if not result.get('success'):
+        return False
+    
+    os.makedirs(GRIB_CACHE_DIR, exist_ok=True)
+    entry_dir = _cache_entry_dir(file_hash)
+    if os.path.exists(entry_dir):
+        os.utime(entry_dir)
+        return True
+    
+    # Write into a scratch directory and rename so readers never see partial entries
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=GRIB_CACHE_DIR)
+    try:
+        # Cached entries double as array stores, so extracts can read them by hash
+        write_array_store(result['dataset'], tmp_dir, layouts=('time',), chunk_steps=chunk_steps)
+        
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+            json.dump(result['metadata'], f, default=str)
+        
         try:
-            # Get uploaded file
-            if 'file' not in request.files:
-                return jsonify({'error': 'No file provided'}), 400
-            
-            file = request.files['file']
-            if file.filename == '' or not file.filename.endswith(('.grib', '.grib2')):
-                return jsonify({'error': 'Invalid GRIB file'}), 400
-            
-            # Save uploaded file temporarily
-            filepath = f"/tmp/{file.filename}"
-            file.save(filepath)
-            
-            # Parse the file
-            result = parse_grib_file(filepath)
-            
-            # Clean up
-            os.remove(filepath)
-            
-            if result['success']:
-                return jsonify({
-                    'success': True,
-                    'metadata': result['metadata']
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': result['error']
-                }), 500
-                
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker cached the same content first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
     
-    @app.route('/api/grib/extract', methods=['POST'])
-    def extract_grib_data():
-        """Extract specific variable/time data from GRIB file"""
+    evict_cache(keep=file_hash)
+    return True
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def evict_cache(max_bytes=None, keep=None):
+    """
+    Evict least recently used cache entries until the cache fits its budget
+    
+    Args:
+        max_bytes (int): Size budget (default: GRIB_CACHE_MAX_BYTES)
+        keep (str): Hash of an entry that must not be evicted
+        
+    Returns:
+        int: Number of entries removed
+    """
+    max_bytes = GRIB_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    
+    with _cache_lock:
         try:
-            data = request.json
-            filepath = data.get('filepath')
-            variable = data.get('variable')
-            time_step = data.get('timeStep', 0)
-            level = data.get('level')
-            
-            # Open dataset
-            ds = xr.open_dataset(filepath, engine='cfgrib')
-            
-            # Extract data
-            result = extract_data_for_visualization(ds, variable, time_step, level)
+            names = [n for n in os.listdir(GRIB_CACHE_DIR) if not n.startswith('.')]
+        except OSError:
+            return 0
+        
+        entries = []
+        for name in names:
+            path = os.path.join(GRIB_CACHE_DIR, name)
+            try:
+                entries.append((os.path.getmtime(path), name, _dir_size(path)))
+            except OSError:
+                continue
+        
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        for _, name, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(GRIB_CACHE_DIR, name), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+# Streaming upload ingest into a content-addressed store, parsed in the background
+GRIB_INGEST_DIR = os.environ.get('GRIB_INGEST_DIR', '/tmp/grib_ingest')
+GRIB_INGEST_WORKERS = int(os.environ.get('GRIB_INGEST_WORKERS', 2))
+GRIB_INGEST_MAX_BYTES = int(os.environ.get('GRIB_INGEST_MAX_BYTES', 10 * 1024 ** 3))
+# Size budget for the whole ingest store; least recently used ingests are evicted
+GRIB_INGEST_STORE_MAX_BYTES = int(os.environ.get('GRIB_INGEST_STORE_MAX_BYTES', 50 * 1024 ** 3))
+# Queued/parsing ingests untouched for this long are assumed orphaned and requeued
+GRIB_INGEST_STALE_SECONDS = int(os.environ.get('GRIB_INGEST_STALE_SECONDS', 3600))
+INGEST_METADATA = 'ingest.json'
+INGEST_DATA = 'data.grib'
+
+class GribFramingValidator:
+    """
+    Incrementally check GRIB message framing as bytes arrive
+    
+    The file must start with 'GRIB' and every message's section 0 length
+    must end on '7777'. Padding or other bytes between messages are skipped
+    up to the next 'GRIB', as eccodes does. Otherwise only the headers and
+    end markers are inspected, so feeding a chunk costs O(messages in it),
+    not O(bytes).
+    """
+    
+    def __init__(self):
+        self.offset = 0
+        self.messages = 0
+        self.message_start = 0
+        self.message_end = None
+        self.header = b''
+        self.marker = b''
+        # Tail of the bytes skipped between messages, for a 'GRIB' split across chunks
+        self.gap = b''
+        # Set when a GRIB1 message uses the large-message length encoding,
+        # whose true length needs section 4; framing isn't checked past it
+        self.unchecked = False
+    
+    def feed(self, chunk):
+        """
+        Check the next chunk of the stream
+        
+        Raises:
+            ValueError: If the bytes so far can't be a GRIB file
+        """
+        start = self.offset
+        self.offset += len(chunk)
+        pos = 0
+        while pos < len(chunk) and not self.unchecked:
+            if self.message_end is None and self.messages and not self.header:
+                pos = self._skip_gap(chunk, pos, start)
+                continue
+            if self.message_end is None:
+                take = chunk[pos:pos + 16 - len(self.header)]
+                self.header += take
+                pos += len(take)
+                if not b'GRIB'.startswith(self.header[:4]):
+                    raise ValueError(f'Expected a GRIB message at byte {self.message_start}')
+                if len(self.header) == 16:
+                    self._start_message()
+                continue
             
-            return jsonify(result)
+            # Skip the message body straight to its end marker
+            marker_start = self.message_end - 4
+            if start + pos < marker_start:
+                pos = min(len(chunk), marker_start - start)
+                continue
+            take = chunk[pos:pos + self.message_end - (start + pos)]
+            self.marker += take
+            pos += len(take)
+            if len(self.marker) == 4:
+                if self.marker != b'7777':
+                    raise ValueError(f'GRIB message at byte {self.message_start} does not end with 7777')
+                self.messages += 1
+                self.message_start = self.message_end
+                self.message_end = None
+                self.header = self.marker = b''
+    
+    def _skip_gap(self, chunk, pos, start):
+        """Skip to the next 'GRIB' after a message; returns the chunk position after it"""
+        window = self.gap + chunk[pos:]
+        found = window.find(b'GRIB')
+        if found < 0:
+            self.gap = window[-3:]
+            return len(chunk)
+        self.message_start = start + pos - len(self.gap) + found
+        self.header = b'GRIB'
+        pos += found + 4 - len(self.gap)
+        self.gap = b''
+        return pos
+    
+    def _start_message(self):
+        edition = self.header[7]
+        if edition == 2:
+            length = int.from_bytes(self.header[8:16], 'big')
+        elif edition == 1:
+            length = int.from_bytes(self.header[4:7], 'big')
+            if length & 0x800000:
+                self.unchecked = True
+                return
+        else:
+            raise ValueError(f'Unsupported GRIB edition {edition} at byte {self.message_start}')
+        if length < 20:
+            raise ValueError(f'Invalid GRIB message length at byte {self.message_start}')
+        self.message_end = self.message_start + length
+    
+    def close(self):
+        """
+        Check that the stream ended on a message boundary
+        
+        Returns:
+            int: Number of complete messages seen
+        """
+        if self.unchecked:
+            return self.messages
+        if self.message_end is not None or self.header:
+            raise ValueError('Upload ended in the middle of a GRIB message')
+        if self.messages == 0:
+            raise ValueError('Upload contains no GRIB messages')
+        return self.messages
+
+_ingest_lock = threading.Lock()
+_ingest_futures = {}
+_ingest_executor = None
+
+def ingest_dir_for(file_hash):
+    return os.path.join(GRIB_INGEST_DIR, file_hash)
+
+def load_ingest(file_hash):
+    """
+    Read an ingest record by content hash
+    
+    Returns:
+        dict: Ingest record, or None if unknown
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', file_hash or ''):
+        return None
+    try:
+        with open(os.path.join(ingest_dir_for(file_hash), INGEST_METADATA)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_ingest(entry_dir, record):
+    path = os.path.join(entry_dir, INGEST_METADATA)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, default=str)
+    os.replace(tmp_path, path)
+
+def _update_ingest(file_hash, **fields):
+    with _ingest_lock:
+        record = load_ingest(file_hash) or {}
+        record.update(fields, updatedAt=datetime.utcnow().isoformat())
+        _write_ingest(ingest_dir_for(file_hash), record)
+        return record
+
+def run_ingest(file_hash):
+    """
+    Parse an ingested file and cache the result (runs on the ingest executor)
+    
+    Returns:
+        dict: Final ingest record
+    """
+    _update_ingest(file_hash, status='parsing')
+    try:
+        if get_cached_parse(file_hash) is None:
+            result = parse_grib_file(os.path.join(ingest_dir_for(file_hash), INGEST_DATA), lazy=True)
+            if not result['success']:
+                return _update_ingest(file_hash, status='failed', error=result['error'])
+            try:
+                cache_parse_result(file_hash, result)
+            finally:
+                result['dataset'].close()
+        return _update_ingest(file_hash, status='completed', storeId=file_hash, error=None)
+    except Exception as e:
+        return _update_ingest(file_hash, status='failed', error=str(e))
+    finally:
+        with _ingest_lock:
+            _ingest_futures.pop(file_hash, None)
+
+def queue_ingest(file_hash):
+    """
+    Queue background parsing of an ingest (no-op if already queued here)
+    
+    Returns:
+        concurrent.futures.Future: Future resolving to the final record
+    """
+    global _ingest_executor
+    with _ingest_lock:
+        future = _ingest_futures.get(file_hash)
+        if future is None:
+            if _ingest_executor is None:
+                _ingest_executor = ThreadPoolExecutor(max_workers=max(1, GRIB_INGEST_WORKERS))
+            future = _ingest_futures[file_hash] = _ingest_executor.submit(run_ingest, file_hash)
+    return future
+
+def _resume_ingest(record, retry_failed=False):
+    """
+    Requeue an ingest whose worker disappeared or whose parse was evicted
+    
+    Args:
+        record (dict): Ingest record
+        retry_failed (bool): Also requeue a failed parse (the content was uploaded again)
+        
+    Returns:
+        dict: Current ingest record
+    """
+    evicted = record['status'] == 'completed' and get_cached_parse(record['id']) is None
+    if evicted or (retry_failed and record['status'] == 'failed'):
+        record = _update_ingest(record['id'], status='queued', error=None)
+        queue_ingest(record['id'])
+        return record
+    if record['status'] not in ('queued', 'parsing'):
+        return record
+    with _ingest_lock:
+        if record['id'] in _ingest_futures:
+            return record
+    updated = datetime.fromisoformat(record['updatedAt'])
+    if (datetime.utcnow() - updated).total_seconds() > GRIB_INGEST_STALE_SECONDS:
+        record = _update_ingest(record['id'], status='queued')
+        queue_ingest(record['id'])
+    return record
+
+def evict_ingests(max_bytes=None, keep=None):
+    """
+    Evict least recently used ingests until the ingest store fits its budget
+    
+    Ingests still queued or parsing are kept. Evicted content can simply be
+    uploaded again; parse results live on in the parse cache until evicted there.
+    
+    Args:
+        max_bytes (int): Size budget (default: GRIB_INGEST_STORE_MAX_BYTES)
+        keep (str): Hash of an ingest that must not be evicted
+        
+    Returns:
+        int: Number of ingests removed
+    """
+    max_bytes = GRIB_INGEST_STORE_MAX_BYTES if max_bytes is None else max_bytes
+    
+    with _ingest_lock:
+        try:
+            names = [n for n in os.listdir(GRIB_INGEST_DIR) if not n.startswith('.')]
+        except OSError:
+            return 0
+        
+        entries = []
+        for name in names:
+            path = ingest_dir_for(name)
+            try:
+                entries.append((os.path.getmtime(path), name, _dir_size(path)))
+            except OSError:
+                continue
+        
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        for _, name, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            record = load_ingest(name)
+            if name == keep or name in _ingest_futures or (record or {}).get('status') in ('queued', 'parsing'):
+                continue
+            shutil.rmtree(ingest_dir_for(name), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+def touch_ingest(file_hash):
+    """Mark an ingest as recently used"""
+    try:
+        os.utime(ingest_dir_for(file_hash))
+    except OSError:
+        pass
+
+def ingest_upload(stream, filename=None, chunk_size=HASH_CHUNK_SIZE, max_bytes=None):
+    """
+    Stream an upload into the content-addressed ingest store and queue its parse
+    
+    Bytes are hashed and framing-checked chunk by chunk as they are written,
+    so a non-GRIB stream is rejected after its first bad chunk and memory use
+    doesn't depend on file size. (A multipart upload has already been received
+    and spooled by Werkzeug by the time its stream is read here.) Identical
+    content is stored once; uploading it again returns the existing ingest and
+    retries its parse if that failed.
+    
+    Args:
+        stream: Readable binary stream (e.g. request.stream)
+        filename (str): Client file name, kept for display only
+        chunk_size (int): Bytes read per chunk
+        max_bytes (int): Upload size limit (default: GRIB_INGEST_MAX_BYTES)
+        
+    Returns:
+        tuple: (ingest record, created) where created is False for a duplicate
+        
+    Raises:
+        ValueError: If the upload is not a well-formed GRIB file or is too large
+    """
+    max_bytes = GRIB_INGEST_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(GRIB_INGEST_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=GRIB_INGEST_DIR)
+    try:
+        digest = hashlib.sha256()
+        validator = GribFramingValidator()
+        with open(os.path.join(tmp_dir, INGEST_DATA), 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                validator.feed(chunk)
+                if validator.offset > max_bytes:
+                    raise ValueError(f'Upload exceeds {max_bytes} bytes')
+                digest.update(chunk)
+                out.write(chunk)
+        messages = validator.close()
+        file_hash = digest.hexdigest()
+        
+        existing = load_ingest(file_hash)
+        if existing is not None:
+            touch_ingest(file_hash)
+            return _resume_ingest(existing, retry_failed=True), False
+        
+        now = datetime.utcnow().isoformat()
+        cached = get_cached_parse(file_hash) is not None
+        record = {
+            'id': file_hash,
+            'filename': os.path.basename(filename or INGEST_DATA),
+            'size': validator.offset,
+            'messages': messages,
+            'filepath': os.path.join(ingest_dir_for(file_hash), INGEST_DATA),
+            # Content parsed through the legacy upload path needs no new job
+            'status': 'completed' if cached else 'queued',
+            'storeId': file_hash if cached else None,
+            'error': None,
+            'createdAt': now,
+            'updatedAt': now
+        }
+        _write_ingest(tmp_dir, record)
+        try:
+            os.rename(tmp_dir, ingest_dir_for(file_hash))
+        except OSError:
+            # The same content finished uploading concurrently
+            existing = load_ingest(file_hash)
+            if existing is None:
+                raise
+            return existing, False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    if record['status'] == 'queued':
+        queue_ingest(file_hash)
+    evict_ingests(keep=file_hash)
+    return record, True
+
+# Columns stored for each GRIB message in the byte-offset index
+MESSAGE_INDEX_FIELDS = ['offset', 'length', 'shortName', 'cfVarName', 'typeOfLevel', 'level', 'validTime', 'time', 'step']
+MESSAGE_INDEX_SUFFIX = '.msgidx.json'
+_message_index_cache = OrderedDict()
+_message_index_lock = threading.Lock()
+
+def is_grib_file(filepath):
+    """Check the GRIB magic bytes at the start of a file"""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(4) == b'GRIB'
+    except OSError:
+        return False
+
+def _message_index_path(filepath):
+    filepath = os.path.abspath(filepath)
+    sidecar = filepath + MESSAGE_INDEX_SUFFIX
+    if os.access(os.path.dirname(filepath), os.W_OK):
+        return sidecar
+    # Fall back to the cache directory for read-only data locations
+    path_hash = hashlib.sha256(filepath.encode()).hexdigest()
+    return os.path.join(GRIB_CACHE_DIR, 'index', path_hash + MESSAGE_INDEX_SUFFIX)
+
+def build_message_index(filepath):
+    """
+    Walk the GRIB messages once and record where each one lives
+    
+    Args:
+        filepath (str): Path to the GRIB file
+        
+    Returns:
+        dict: Index with one row per message (see MESSAGE_INDEX_FIELDS)
+    """
+    if eccodes is None:
+        raise RuntimeError('eccodes is required to index GRIB messages')
+    
+    stat = os.stat(filepath)
+    messages = []
+    variables = {}
+    with open(filepath, 'rb') as f:
+        while True:
+            handle = eccodes.codes_grib_new_from_file(f, headers_only=True)
+            if handle is None:
+                break
+            try:
+                short_name = eccodes.codes_get(handle, 'shortName')
+                cf_name = eccodes.codes_get(handle, 'cfVarName')
+                valid_date = eccodes.codes_get(handle, 'validityDate')
+                valid_time = eccodes.codes_get(handle, 'validityTime')
+                data_date = eccodes.codes_get(handle, 'dataDate')
+                data_time = eccodes.codes_get(handle, 'dataTime')
+                messages.append([
+                    int(eccodes.codes_get(handle, 'offset')),
+                    int(eccodes.codes_get(handle, 'totalLength')),
+                    short_name,
+                    cf_name,
+                    eccodes.codes_get(handle, 'typeOfLevel'),
+                    float(eccodes.codes_get(handle, 'level')),
+                    f"{valid_date // 10000:04d}-{valid_date // 100 % 100:02d}-{valid_date % 100:02d}"
+                    f"T{valid_time // 100:02d}:{valid_time % 100:02d}:00",
+                    # Reference time and step: cfgrib's time and step dimensions
+                    f"{data_date // 10000:04d}-{data_date // 100 % 100:02d}-{data_date % 100:02d}"
+                    f"T{data_time // 100:02d}:{data_time % 100:02d}:00",
+                    int(eccodes.codes_get(handle, 'endStep'))
+                ])
+                variables.setdefault(cf_name, {
+                    'units': eccodes.codes_get(handle, 'units'),
+                    'description': eccodes.codes_get(handle, 'name')
+                })
+            finally:
+                eccodes.codes_release(handle)
+    
+    index = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'fields': MESSAGE_INDEX_FIELDS,
+        'variables': variables,
+        'messages': messages
+    }
+    
+    index_path = _message_index_path(filepath)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+    return index
+
+def _read_message_index(index_path, size, mtime):
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Ignore indexes written for a previous version of the file or index layout
+    if index.get('size') != size or index.get('mtime') != mtime or index.get('fields') != MESSAGE_INDEX_FIELDS:
+        return None
+    return index
+
+def load_message_index(filepath, build=True):
+    """
+    Load the byte-offset index for a GRIB file, building it if needed
+    
+    Args:
+        filepath (str): Path to the GRIB file
+        build (bool): Build the index when it is missing or stale
+        
+    Returns:
+        dict: Message index, or None if unavailable
+    """
+    stat = os.stat(filepath)
+    index_path = _message_index_path(filepath)
+    key = (index_path, stat.st_size, stat.st_mtime_ns)
+    
+    with _message_index_lock:
+        index = _message_index_cache.get(key)
+        if index is not None:
+            _message_index_cache.move_to_end(key)
+    count_cache('message_index', index is not None)
+    if index is not None:
+        return index
+    
+    index = _read_message_index(index_path, stat.st_size, stat.st_mtime_ns)
+    if index is None and build:
+        index = build_message_index(filepath)
+    
+    if index is not None:
+        with _message_index_lock:
+            _message_index_cache[key] = index
+            while len(_message_index_cache) > 64:
+                _message_index_cache.popitem(last=False)
+    return index
+
+def _decode_message(filepath, offset, length):
+    """Decode a single GRIB message into a 2D array and its coordinates"""
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        message = f.read(length)
+    
+    handle = eccodes.codes_new_from_message(message)
+    try:
+        if eccodes.codes_get(handle, 'gridType') != 'regular_ll':
+            return None
+        
+        ni = eccodes.codes_get(handle, 'Ni')
+        nj = eccodes.codes_get(handle, 'Nj')
+        values = eccodes.codes_get_values(handle).reshape(nj, ni).astype(np.float32)
+        if eccodes.codes_get(handle, 'bitmapPresent'):
+            values[values == eccodes.codes_get(handle, 'missingValue')] = np.nan
+        
+        lats = np.linspace(
+            eccodes.codes_get(handle, 'latitudeOfFirstGridPointInDegrees'),
+            eccodes.codes_get(handle, 'latitudeOfLastGridPointInDegrees'),
+            nj
+        )
+        lon_first = eccodes.codes_get(handle, 'longitudeOfFirstGridPointInDegrees')
+        lon_last = eccodes.codes_get(handle, 'longitudeOfLastGridPointInDegrees')
+        sign = -1 if eccodes.codes_get(handle, 'iScansNegatively') else 1
+        if eccodes.codes_get(handle, 'iDirectionIncrementGiven'):
+            step = eccodes.codes_get(handle, 'iDirectionIncrementInDegrees')
+        else:
+            step = (sign * (lon_last - lon_first)) % 360 / max(ni - 1, 1)
+        lons = lon_first + sign * step * np.arange(ni)
+        # Areas crossing Greenwich run past 360 (350, 354, ... 390); cfgrib reports -10 ... 30
+        if lons.max() > 360:
+            lons -= 360
+        return values, lats, lons
+    finally:
+        eccodes.codes_release(handle)
+
+def extract_slice_from_index(filepath, variable, time_step=0, level=None, bbox=None, stride=None, target_shape=None):
+    """
+    Extract one 2D field by decoding only the GRIB message that holds it
+    
+    Args:
+        filepath (str): Path to the GRIB file
+        variable (str): Variable name (cfgrib name or GRIB shortName)
+        time_step (int): Time step index
+        level (float): Level (if applicable)
+        bbox (dict): Optional bounding box
+        stride (int): Optional block-mean downsampling factor
+        target_shape (tuple): Optional (height, width) upper bound on the output
+        
+    Returns:
+        dict: Same shape as extract_data_for_visualization, or None if the
+            request can't be served from single messages
+    """
+    if eccodes is None:
+        return None
+    
+    index = load_message_index(filepath)
+    fields = {name: i for i, name in enumerate(index['fields'])}
+    messages = [
+        m for m in index['messages']
+        if variable in (m[fields['cfVarName']], m[fields['shortName']])
+    ]
+    if not messages:
+        return None
+    
+    # Single messages only line up with cfgrib's (time, [level], lat, lon) layout for one
+    # level type and one step; accumulations over steps and mixed levels go through cfgrib
+    if (len({m[fields['typeOfLevel']] for m in messages}) > 1 or
+            len({m[fields['step']] for m in messages}) > 1):
+        return None
+    
+    # Select time step (cfgrib's time dimension is the reference time)
+    times = sorted({m[fields['time']] for m in messages})
+    if not -len(times) <= time_step < len(times):
+        return {'success': False, 'error': f'Time step {time_step} out of range'}
+    messages = [m for m in messages if m[fields['time']] == times[time_step]]
+    
+    # Select level (a level-less request for multi-level data returns the full cube)
+    levels = sorted({m[fields['level']] for m in messages})
+    if level is None:
+        if len(levels) > 1:
+            return None
+        match = messages[0]
+    else:
+        nearest = min(levels, key=lambda lev: abs(lev - float(level)))
+        match = next(m for m in messages if m[fields['level']] == nearest)
+    
+    with span('decode'):
+        decoded = _decode_message(filepath, match[fields['offset']], match[fields['length']])
+    if decoded is None:
+        return None
+    
+    field, lats, lons = decoded
+    data, lats, lons = subset_field(lambda ys, xs: field[ys, xs], lats, lons, bbox, stride, target_shape)
+    var_info = index['variables'].get(match[fields['cfVarName']], {})
+    return {
+        'success': True,
+        'data': data,
+        'lats': lats,
+        'lons': lons,
+        'units': var_info.get('units', ''),
+        'description': var_info.get('description', variable)
+    }
+
+def open_source_dataset(filepath, **kwargs):
+    """Open a GRIB file with cfgrib, or anything else (NetCDF) with xarray's default engine"""
+    engine = 'cfgrib' if is_grib_file(filepath) else None
+    return xr.open_dataset(filepath, engine=engine, **kwargs)
+
+def _find_coord(ds, names):
+    for name in names:
+        if name in ds.coords:
+            return ds.coords[name]
+    return None
+
+def _dim_roles(var_data):
+    """Map a variable's dims to time/level/lat/lon roles, or None if it has others"""
+    roles = {}
+    for dim in var_data.dims:
+        if dim in TIME_DIMS:
+            roles['time'] = dim
+        elif dim in LEVEL_DIMS:
+            roles['level'] = dim
+        elif dim in LAT_NAMES:
+            roles['lat'] = dim
+        elif dim in LON_NAMES:
+            roles['lon'] = dim
+        else:
+            return None
+    if 'lat' not in roles or 'lon' not in roles:
+        return None
+    return roles
+
+def write_array_store(ds, store_dir, layouts=GRIB_STORE_LAYOUTS, chunk_steps=DEFAULT_CHUNK_STEPS, source=None):
+    """
+    Write every variable of a dataset into a directory of .npy files
+    
+    Variables are stored as (time, level, lat, lon). The 'time' layout keeps
+    each time slice contiguous for map reads; the 'location' layout stores
+    (lat, lon, level, time) so a point's whole time series is contiguous.
+    
+    Args:
+        ds: xarray Dataset (opened lazily)
+        store_dir (str): Existing directory to write into
+        layouts (tuple): Any of 'time' and 'location'
+        chunk_steps (int): Time steps decoded per chunk
+        source (str): Source file name recorded in the metadata
+        
+    Returns:
+        dict: Store metadata (also written to store.json)
+    """
+    lats = _find_coord(ds, LAT_NAMES)
+    lons = _find_coord(ds, LON_NAMES)
+    times = _find_coord(ds, TIME_DIMS)
+    levels = _find_coord(ds, LEVEL_DIMS)
+    
+    if lats is not None:
+        np.save(os.path.join(store_dir, 'lats.npy'), lats.values)
+    if lons is not None:
+        np.save(os.path.join(store_dir, 'lons.npy'), lons.values)
+    
+    metadata = {
+        'source': source,
+        'createdAt': datetime.utcnow().isoformat(),
+        'layouts': list(layouts),
+        'times': [str(t) for t in np.datetime_as_string(np.atleast_1d(times.values), unit='s')] if times is not None else [],
+        'levels': [float(v) for v in np.atleast_1d(levels.values)] if levels is not None else [],
+        'variables': {}
+    }
+    
+    for var_name, var_data in ds.data_vars.items():
+        roles = _dim_roles(var_data)
+        if roles is not None:
+            var_data = var_data.transpose(*[roles[r] for r in ('time', 'level', 'lat', 'lon') if r in roles])
+        dims = list(var_data.dims)
+        base = _array_filename(var_name)[:-len('.npy')]
+        files = {}
+        outputs = []
+        
+        if 'time' in layouts:
+            files['time'] = base + '.npy'
+            outputs.append((np.lib.format.open_memmap(
+                os.path.join(store_dir, files['time']), mode='w+', dtype=var_data.dtype, shape=var_data.shape
+            ), None))
+        
+        # Location layout needs a leading time dim to move to the end
+        if 'location' in layouts and roles is not None and 'time' in roles:
+            axes = [dims.index(roles['lat']), dims.index(roles['lon'])]
+            if 'level' in roles:
+                axes.append(dims.index(roles['level']))
+            axes.append(0)
+            files['location'] = base + '.loc.npy'
+            outputs.append((np.lib.format.open_memmap(
+                os.path.join(store_dir, files['location']), mode='w+', dtype=var_data.dtype,
+                shape=tuple(var_data.shape[a] for a in axes)
+            ), axes))
+        
+        # One decode pass per variable feeds every layout and the statistics
+        acc = _new_stats()
+        start = 0
+        for block in _iter_blocks(var_data, chunk_steps):
+            _accumulate_stats(acc, block)
+            if block.ndim == 0:
+                for out, _ in outputs:
+                    out[...] = block
+                continue
+            stop = start + len(block)
+            for out, axes in outputs:
+                if axes is None:
+                    out[start:stop] = block
+                else:
+                    out[..., start:stop] = block.transpose(axes)
+            start = stop
+        
+        for out, _ in outputs:
+            out.flush()
+        del outputs
+        
+        metadata['variables'][var_name] = {
+            'dims': dims,
+            'roles': roles,
+            'shape': list(var_data.shape),
+            'dtype': str(var_data.dtype),
+            'units': var_data.attrs.get('units', ''),
+            'description': var_data.attrs.get('long_name', var_name),
+            'stats': _finish_stats(acc),
+            'files': files
+        }
+    
+    # Derived wind speed/direction are cached next to their u/v components
+    _write_derived_wind(store_dir, metadata, chunk_steps)
+    
+    with open(os.path.join(store_dir, STORE_METADATA), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+def convert_to_array_store(filepath, store_dir, layouts=GRIB_STORE_LAYOUTS, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Convert a GRIB or NetCDF file into a chunked, memory-mappable array store
+    
+    Args:
+        filepath (str): Path to the source file
+        store_dir (str): Directory for the store (created atomically)
+        layouts (tuple): Any of 'time' (map reads) and 'location' (point time series)
+        chunk_steps (int): Time steps decoded per chunk
+        
+    Returns:
+        dict: Result with store directory and metadata
+    """
+    try:
+        if os.path.exists(os.path.join(store_dir, STORE_METADATA)):
+            # Stores written before derived fields existed get them on reuse
+            add_derived_wind(store_dir, chunk_steps)
+            return {'success': True, 'storeDir': store_dir, 'metadata': load_store(store_dir)}
+        
+        parent = os.path.dirname(os.path.abspath(store_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        try:
+            ds = open_source_dataset(filepath, cache=False)
+            try:
+                with span('convert'):
+                    metadata = write_array_store(ds, tmp_dir, layouts, chunk_steps, source=os.path.basename(filepath))
+            finally:
+                ds.close()
+            os.rename(tmp_dir, store_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        return {'success': True, 'storeDir': store_dir, 'metadata': metadata}
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+_store_cache = OrderedDict()
+_store_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on a lock file, shared by every thread and process using it"""
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _store_write_lock(store_dir):
+    """
+    Serialize writers that add files (layouts, pyramids, derived variables) to a store
+    
+    store.json is read, modified and rewritten by both the Celery worker and
+    the API process, so the lock is a file lock in the store itself.
+    """
+    return _file_lock(os.path.join(store_dir, '.lock'))
+
+def load_store(store_dir):
+    """
+    Load store metadata (cached by store.json mtime)
+    
+    Args:
+        store_dir (str): Store directory
+        
+    Returns:
+        dict: Store metadata
+    """
+    path = os.path.join(store_dir, STORE_METADATA)
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    with _store_lock:
+        if key in _store_cache:
+            _store_cache.move_to_end(key)
+            return _store_cache[key]
+    
+    with open(path) as f:
+        metadata = json.load(f)
+    
+    with _store_lock:
+        _store_cache[key] = metadata
+        while len(_store_cache) > 64:
+            _store_cache.popitem(last=False)
+    return metadata
+
+def resolve_store_dir(store_id):
+    """
+    Find the directory of a store by id (ERA5 job store or cached upload hash)
+    
+    Args:
+        store_id (str): Store id
+        
+    Returns:
+        str: Store directory, or None if it doesn't exist
+    """
+    if not store_id or not re.fullmatch(r'[A-Za-z0-9_-][A-Za-z0-9_.-]*', store_id):
+        return None
+    for root in (GRIB_STORE_DIR, GRIB_CACHE_DIR):
+        store_dir = os.path.join(root, store_id)
+        if os.path.exists(os.path.join(store_dir, STORE_METADATA)):
+            return store_dir
+    return None
+
+def open_store_array(store_dir, variable, layout='time'):
+    """
+    Memory-map one variable of a store
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        layout (str): 'time' or 'location'
+        
+    Returns:
+        numpy.memmap: Read-only array, or None if the variable/layout is missing
+    """
+    var_info = load_store(store_dir)['variables'].get(variable)
+    if var_info is None or layout not in var_info['files']:
+        return None
+    return np.load(os.path.join(store_dir, var_info['files'][layout]), mmap_mode='r')
+
+def load_store_coords(store_dir):
+    """Return (lats, lons) arrays of a store (None when missing)"""
+    coords = []
+    for name in ('lats.npy', 'lons.npy'):
+        path = os.path.join(store_dir, name)
+        coords.append(np.load(path) if os.path.exists(path) else None)
+    return tuple(coords)
+
+def _nearest_level_index(levels, level):
+    return int(np.argmin(np.abs(np.asarray(levels) - float(level))))
+
+def extract_from_store(store_dir, variable, time_step=0, level=None, bbox=None, stride=None, target_shape=None):
+    """
+    Extract 2D data from an array store without decoding the source file
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        time_step (int): Time step index
+        level (float): Pressure level (if applicable)
+        bbox (dict): Optional bounding box, applied to the memory map before reading
+        stride (int): Optional block-mean downsampling factor
+        target_shape (tuple): Optional (height, width) upper bound on the output
+        
+    Returns:
+        dict: Same shape as extract_data_for_visualization
+    """
+    try:
+        store = load_store(store_dir)
+        var_info = store['variables'].get(variable)
+        
+        # Downsampled directions come from averaged components, not averaged angles
+        if var_info is None or (var_info.get('circular') and (stride or target_shape)):
+            derived = extract_wind_field(
+                lambda name: extract_from_store(store_dir, name, time_step, level, bbox, stride, target_shape),
+                variable,
+                [name for name, info in store['variables'].items() if 'derivedFrom' not in info]
+            )
+            if derived is not None:
+                return derived
+        if var_info is None:
+            return {'success': False, 'error': f'Unknown variable: {variable}'}
+        
+        array = open_store_array(store_dir, variable, 'time')
+        roles = var_info['roles'] or {}
+        index = []
+        for dim in var_info['dims']:
+            if dim == roles.get('time'):
+                index.append(time_step)
+            elif dim == roles.get('level') and level is not None:
+                index.append(_nearest_level_index(store['levels'], level))
+            elif dim not in (roles.get('lat'), roles.get('lon')):
+                index.append(slice(None))
+        
+        lats, lons = load_store_coords(store_dir)
+        if roles:
+            # Canonical order keeps (lat, lon) last, so the window slices the memmap directly
+            data, lats, lons = subset_field(
+                lambda ys, xs: np.array(array[tuple(index) + (ys, xs)]),
+                lats, lons, bbox, stride, target_shape
+            )
+        else:
+            data = np.array(array[tuple(index) + (slice(None),) * (array.ndim - len(index))])
+        
+        return {
+            'success': True,
+            'data': data,
+            'lats': lats,
+            'lons': lons,
+            'units': var_info['units'],
+            'description': var_info['description']
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def _write_store_metadata(store_dir, metadata):
+    path = os.path.join(store_dir, STORE_METADATA)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+
+def ensure_location_layout(store_dir, variable, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Build the location-major copy of a variable from its time layout if missing
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        chunk_steps (int): Time steps copied per chunk
+        
+    Returns:
+        bool: True if the location layout is available
+    """
+    # Built at ingest, so most calls are a lookup that needs no lock
+    var_info = load_store(store_dir)['variables'].get(variable)
+    if var_info is not None and 'location' in var_info['files']:
+        return True
+    with _store_write_lock(store_dir):
+        return _build_location_layout(store_dir, variable, chunk_steps)
+
+def _build_location_layout(store_dir, variable, chunk_steps):
+    # Copy so the cached metadata isn't mutated before the new file exists
+    metadata = json.loads(json.dumps(load_store(store_dir)))
+    var_info = metadata['variables'].get(variable)
+    if var_info is None:
+        return False
+    if 'location' in var_info['files']:
+        return True
+    
+    roles = var_info['roles'] or {}
+    if 'time' not in roles or 'time' not in var_info['files']:
+        return False
+    
+    dims = var_info['dims']
+    axes = [dims.index(roles['lat']), dims.index(roles['lon'])]
+    if 'level' in roles:
+        axes.append(dims.index(roles['level']))
+    axes.append(0)
+    
+    source = open_store_array(store_dir, variable, 'time')
+    filename = _array_filename(variable)[:-len('.npy')] + '.loc.npy'
+    tmp_path = os.path.join(store_dir, f".{filename}.{os.getpid()}.tmp")
+    out = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=source.dtype, shape=tuple(source.shape[a] for a in axes)
+    )
+    for start in range(0, source.shape[0], chunk_steps):
+        out[..., start:start + chunk_steps] = np.asarray(source[start:start + chunk_steps]).transpose(axes)
+    out.flush()
+    del out
+    os.replace(tmp_path, os.path.join(store_dir, filename))
+    
+    var_info['files']['location'] = filename
+    _write_store_metadata(store_dir, metadata)
+    return True
+
+def _fractional_index(coord, values, wrap=False):
+    """Map coordinate values to fractional array indices (works for descending coords)"""
+    coord = np.asarray(coord, dtype=np.float64)
+    positions = np.arange(len(coord), dtype=np.float64)
+    if wrap:
+        # Close the ring so points between the last and first longitude interpolate
+        step = coord[1] - coord[0]
+        coord = np.append(coord, coord[-1] + step)
+        positions = np.append(positions, len(positions))
+    if coord[0] > coord[-1]:
+        coord, positions = coord[::-1], positions[::-1]
+    return np.interp(values, coord, positions)
+
+def _normalize_lons(lons_grid, lons):
+    """Express longitudes in the grid's convention (0-360 or -180-180)"""
+    lons = np.asarray(lons, dtype=np.float64)
+    if np.min(lons_grid) >= 0:
+        return np.mod(lons, 360.0)
+    return np.mod(lons + 180.0, 360.0) - 180.0
+
+def _is_global_lon(lons_grid):
+    if len(lons_grid) < 2:
+        return False
+    step = abs(float(lons_grid[1] - lons_grid[0]))
+    return abs(step * len(lons_grid) - 360.0) < step / 2
+
+def _outside_grid(lats, lons, point_lats, point_lons):
+    """Mask of points more than half a cell beyond a regional grid (longitudes already normalized)"""
+    def beyond(coord, values):
+        coord = np.asarray(coord, dtype=np.float64)
+        half = abs(float(coord[1] - coord[0])) / 2 if len(coord) > 1 else 0.0
+        return (values < coord.min() - half - 1e-9) | (values > coord.max() + half + 1e-9)
+    outside = beyond(lats, np.asarray(point_lats, dtype=np.float64))
+    if not _is_global_lon(lons):
+        outside |= beyond(lons, np.asarray(point_lons, dtype=np.float64))
+    return outside
+
+def _nan_to_none(values):
+    return [None if v != v else v for v in values.tolist()]
+
+def extract_point_timeseries(store_dir, variable, points, method='nearest', level=None, start=None, end=None):
+    """
+    Sample a variable at one or more lat/lon points across the whole time axis
+    
+    Reads the store's location layout, so each point costs a contiguous read
+    of its time series rather than one full-field decode per time step.
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        points (list): [{'lat': float, 'lon': float}, ...]
+        method (str): 'nearest' or 'bilinear'
+        level (float): Pressure level (if applicable, default: first level)
+        start (str): Optional ISO start time (inclusive)
+        end (str): Optional ISO end time (inclusive)
+        
+    Returns:
+        dict: Times and per-point value series; points off a regional grid
+            get outside=True and all-null values rather than the edge cell's
+    """
+    try:
+        if method not in ('nearest', 'bilinear'):
+            return {'success': False, 'error': f'Unknown method: {method}'}
+        if not ensure_location_layout(store_dir, variable):
+            return {'success': False, 'error': f'No time series available for {variable}'}
+        
+        store = load_store(store_dir)
+        var_info = store['variables'][variable]
+        array = open_store_array(store_dir, variable, 'location')
+        lats, lons = load_store_coords(store_dir)
+        
+        # Select the time window along the last axis
+        times = np.array(store['times'], dtype='datetime64[s]')
+        t0 = 0 if start is None else int(np.searchsorted(times, np.datetime64(start, 's'), side='left'))
+        t1 = len(times) if end is None else int(np.searchsorted(times, np.datetime64(end, 's'), side='right'))
+        
+        # Vectorized index math for every point at once
+        point_lats = np.array([float(p['lat']) for p in points])
+        point_lons = _normalize_lons(lons, [float(p['lon']) for p in points])
+        wrap = _is_global_lon(lons)
+        fy = _fractional_index(lats, point_lats)
+        fx = _fractional_index(lons, point_lons, wrap=wrap)
+        ny, nx = len(lats), len(lons)
+        
+        level_index = None
+        if 'level' in (var_info['roles'] or {}):
+            level_index = 0 if level is None else _nearest_level_index(store['levels'], level)
+        
+        def gather(iy, ix):
+            values = array[iy, ix]
+            if level_index is not None:
+                values = values[:, level_index]
+            return np.asarray(values[..., t0:t1], dtype=np.float64)
+        
+        if method == 'nearest':
+            iy = np.clip(np.rint(fy).astype(int), 0, ny - 1)
+            ix = np.rint(fx).astype(int)
+            ix = np.mod(ix, nx) if wrap else np.clip(ix, 0, nx - 1)
+            values = gather(iy, ix)
+            grid_points = list(zip(lats[iy].tolist(), lons[ix].tolist()))
+        else:
+            y0 = np.clip(np.floor(fy).astype(int), 0, max(ny - 2, 0))
+            y1 = np.minimum(y0 + 1, ny - 1)
+            wy = np.clip(fy - y0, 0.0, 1.0)[:, None]
+            if wrap:
+                x0 = np.floor(fx).astype(int)
+                wx = (fx - x0)[:, None]
+                x0 = np.mod(x0, nx)
+                x1 = np.mod(x0 + 1, nx)
+            else:
+                x0 = np.clip(np.floor(fx).astype(int), 0, max(nx - 2, 0))
+                x1 = np.minimum(x0 + 1, nx - 1)
+                wx = np.clip(fx - x0, 0.0, 1.0)[:, None]
+            values = (
+                gather(y0, x0) * (1 - wy) * (1 - wx) +
+                gather(y0, x1) * (1 - wy) * wx +
+                gather(y1, x0) * wy * (1 - wx) +
+                gather(y1, x1) * wy * wx
+            )
+            grid_points = [(float(lat), float(lon)) for lat, lon in zip(point_lats, point_lons)]
+        
+        outside = _outside_grid(lats, lons, point_lats, point_lons)
+        values[outside] = np.nan
+        grid_points = [(None, None) if off else point for point, off in zip(grid_points, outside)]
+        
+        return {
+            'success': True,
+            'variable': variable,
+            'units': var_info['units'],
+            'description': var_info['description'],
+            'method': method,
+            'times': store['times'][t0:t1],
+            'points': [
+                {
+                    'lat': float(p['lat']),
+                    'lon': float(p['lon']),
+                    'gridLat': grid_lat,
+                    'gridLon': grid_lon,
+                    'outside': bool(off),
+                    'values': _nan_to_none(series)
+                }
+                for p, (grid_lat, grid_lon), series, off in zip(points, grid_points, values, outside)
+            ]
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+# Wind components and the speed/direction fields derived from them:
+# (u, v, speed, direction) using cfgrib/ERA5 short names
+WIND_COMPONENTS = (
+    ('u10', 'v10', 'si10', 'wdir10'),
+    ('u100', 'v100', 'si100', 'wdir100'),
+    ('u', 'v', 'ws', 'wdir')
+)
+DERIVED_DIR = 'derived'
+
+def wind_speed_direction(u, v):
+    """
+    Wind speed and meteorological direction (degrees the wind blows from,
+    clockwise from north) in one vectorized pass
+    
+    Args:
+        u (numpy.ndarray): Eastward component
+        v (numpy.ndarray): Northward component
+        
+    Returns:
+        tuple: (speed, direction) float32 arrays; NaN where either input is NaN
+    """
+    u = np.asarray(u, dtype=np.float32)
+    v = np.asarray(v, dtype=np.float32)
+    speed = np.hypot(u, v)
+    direction = np.degrees(np.arctan2(-u, -v))
+    np.mod(direction, 360.0, out=direction)
+    return speed, direction
+
+def wind_pairs(variables):
+    """Return the WIND_COMPONENTS entries whose u and v are both in variables"""
+    return [pair for pair in WIND_COMPONENTS if pair[0] in variables and pair[1] in variables]
+
+def _derived_wind_source(variable, variables):
+    """Return (u, v, kind) if variable is a wind field derivable from variables"""
+    for u_name, v_name, speed_name, dir_name in wind_pairs(variables):
+        if variable == speed_name:
+            return u_name, v_name, 'speed'
+        if variable == dir_name:
+            return u_name, v_name, 'direction'
+    return None
+
+def _derived_wind_info(kind, u_units):
+    if kind == 'speed':
+        return u_units, 'Wind speed'
+    return 'degrees', 'Wind direction (from, clockwise from north)'
+
+def extract_wind_field(extract, variable, variables):
+    """
+    Derive a wind speed or direction field from extracts of its components
+    
+    Args:
+        extract (callable): extract(name) -> extract result of one component
+        variable (str): Derived variable name (e.g. 'si10', 'wdir10')
+        variables: Names available in the source
+        
+    Returns:
+        dict: Extract result, or None if the variable can't be derived
+    """
+    source = _derived_wind_source(variable, variables)
+    if source is None:
+        return None
+    
+    u_name, v_name, kind = source
+    u = extract(u_name)
+    if not u['success']:
+        return u
+    v = extract(v_name)
+    if not v['success']:
+        return v
+    
+    speed, direction = wind_speed_direction(u['data'], v['data'])
+    units, description = _derived_wind_info(kind, u['units'])
+    return {
+        'success': True,
+        'data': speed if kind == 'speed' else direction,
+        'lats': u['lats'],
+        'lons': u['lons'],
+        'units': units,
+        'description': description
+    }
+
+def _write_derived_wind(store_dir, metadata, chunk_steps):
+    """
+    Write speed/direction arrays for every wind pair of a store in one pass
+    over the u/v memory maps; updates metadata in place
+    
+    Returns:
+        list: Names of the variables written
+    """
+    written = []
+    for u_name, v_name, speed_name, dir_name in wind_pairs(metadata['variables']):
+        u_info = metadata['variables'][u_name]
+        v_info = metadata['variables'][v_name]
+        names = [n for n in (speed_name, dir_name) if n not in metadata['variables']]
+        if not names or u_info['shape'] != v_info['shape'] or 'time' not in u_info['files']:
+            continue
+        
+        u_array = np.load(os.path.join(store_dir, u_info['files']['time']), mmap_mode='r')
+        v_array = np.load(os.path.join(store_dir, v_info['files']['time']), mmap_mode='r')
+        roles = u_info['roles'] or {}
+        dims = u_info['dims']
+        
+        # Location copies are written alongside when the components have them
+        loc_axes = None
+        if 'location' in u_info['files'] and 'time' in roles:
+            loc_axes = [dims.index(roles['lat']), dims.index(roles['lon'])]
+            if 'level' in roles:
+                loc_axes.append(dims.index(roles['level']))
+            loc_axes.append(0)
+        
+        outputs = {}
+        for name in names:
+            base = _array_filename(name)[:-len('.npy')]
+            files = {'time': base + '.npy'}
+            if loc_axes is not None:
+                files['location'] = base + '.loc.npy'
+            arrays = {}
+            for layout, filename in files.items():
+                shape = u_array.shape if layout == 'time' else tuple(u_array.shape[a] for a in loc_axes)
+                tmp_path = os.path.join(store_dir, f".{filename}.{os.getpid()}.tmp")
+                arrays[layout] = (tmp_path, np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape))
+            outputs[name] = (files, arrays, _new_stats())
+        
+        steps = u_array.shape[0] if 'time' in roles else 1
+        step_chunk = chunk_steps if 'time' in roles else 1
+        for start in range(0, steps, step_chunk):
+            window = slice(start, start + step_chunk) if 'time' in roles else Ellipsis
+            speed, direction = wind_speed_direction(u_array[window], v_array[window])
+            for name, block in ((speed_name, speed), (dir_name, direction)):
+                if name not in outputs:
+                    continue
+                files, arrays, acc = outputs[name]
+                _accumulate_stats(acc, block)
+                arrays['time'][1][window] = block
+                if 'location' in arrays:
+                    arrays['location'][1][..., window] = block.transpose(loc_axes)
+        
+        for name, (files, arrays, acc) in outputs.items():
+            for layout, (tmp_path, out) in arrays.items():
+                out.flush()
+                os.replace(tmp_path, os.path.join(store_dir, files[layout]))
+            units, description = _derived_wind_info('speed' if name == speed_name else 'direction', u_info['units'])
+            metadata['variables'][name] = {
+                'dims': dims,
+                'roles': u_info['roles'],
+                'shape': u_info['shape'],
+                'dtype': 'float32',
+                'units': units,
+                'description': description,
+                'stats': _finish_stats(acc),
+                'files': files,
+                'derivedFrom': [u_name, v_name],
+                'circular': name == dir_name
+            }
+            written.append(name)
+    return written
+
+def add_derived_wind(store_dir, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Cache wind speed and direction next to the u/v arrays of an existing store
+    
+    Args:
+        store_dir (str): Store directory
+        chunk_steps (int): Time steps processed per chunk
+        
+    Returns:
+        list: Names of the variables added (empty if already present)
+    """
+    with _store_write_lock(store_dir):
+        metadata = json.loads(json.dumps(load_store(store_dir)))
+        written = _write_derived_wind(store_dir, metadata, chunk_steps)
+        if written:
+            _write_store_metadata(store_dir, metadata)
+        return written
+
+# Quantized encodings for binary field responses (the top code marks NaN)
+BINARY_DTYPES = {
+    'float32': '<f4',
+    'uint16': '<u2',
+    'uint8': 'u1'
+}
+
+def encode_field_binary(data, dtype='float32', compression=None):
+    """
+    Encode a 2D field as little-endian float32 or scale/offset-quantized integers
+    
+    Args:
+        data (numpy.ndarray): Field values
+        dtype (str): 'float32', 'uint16' or 'uint8'
+        compression (str): None, 'gzip' or 'zstd' (payload only)
+        
+    Returns:
+        tuple: (payload bytes, or a memoryview of the array when uncompressed,
+            encoding dict with dtype/shape/scale/offset/nodata/compression)
+    """
+    if dtype not in BINARY_DTYPES:
+        raise ValueError(f'Unsupported dtype: {dtype}')
+    if compression not in (None, 'gzip', 'zstd'):
+        raise ValueError(f'Unsupported compression: {compression}')
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression requires the zstandard package')
+    
+    data = np.asarray(data)
+    encoding = {
+        'dtype': dtype,
+        'shape': list(data.shape),
+        'scale': None,
+        'offset': None,
+        'nodata': None,
+        'compression': compression
+    }
+    
+    if dtype == 'float32':
+        array = np.ascontiguousarray(data, dtype=BINARY_DTYPES[dtype])
+    else:
+        nodata = np.iinfo(BINARY_DTYPES[dtype]).max
+        valid = np.isfinite(data)
+        vmin = float(data[valid].min()) if valid.any() else 0.0
+        vmax = float(data[valid].max()) if valid.any() else 0.0
+        scale = (vmax - vmin) / (nodata - 1) if vmax > vmin else 1.0
+        
+        quantized = np.rint((np.where(valid, data, vmin) - vmin) / scale)
+        array = np.clip(quantized, 0, nodata - 1).astype(BINARY_DTYPES[dtype])
+        array[~valid] = nodata
+        encoding.update({'scale': scale, 'offset': vmin, 'nodata': int(nodata)})
+    
+    buffer = memoryview(array).cast('B')
+    if compression == 'gzip':
+        payload = gzip.compress(buffer, compresslevel=5)
+    elif compression == 'zstd':
+        payload = zstandard.ZstdCompressor(level=3).compress(buffer)
+    else:
+        # Served straight from the array's buffer, without a full-size copy
+        payload = buffer
+    return payload, encoding
+
+def _axis_summary(coord):
+    """Describe a coordinate compactly (first/last/count) when it is evenly spaced"""
+    if coord is None:
+        return None
+    coord = np.asarray(coord, dtype=np.float64)
+    if len(coord) > 2 and not np.allclose(np.diff(coord), coord[1] - coord[0]):
+        return {'values': coord.tolist()}
+    return {'first': float(coord[0]), 'last': float(coord[-1]), 'count': int(len(coord))}
+
+def build_binary_field_body(result, dtype='float32', compression=None):
+    """
+    Build a binary response body for an extract result
+    
+    Layout: uint32 little-endian header length, UTF-8 JSON header
+    (coordinates, units, encoding), then the array payload.
+    
+    Args:
+        result (dict): Successful result from an extract function
+        dtype (str): 'float32', 'uint16' or 'uint8'
+        compression (str): None, 'gzip' or 'zstd'
+        
+    Returns:
+        tuple: (list of body chunks, encoding dict)
+    """
+    payload, encoding = encode_field_binary(result['data'], dtype, compression)
+    header = json.dumps({
+        'lats': _axis_summary(result.get('lats')),
+        'lons': _axis_summary(result.get('lons')),
+        'units': result.get('units', ''),
+        'description': result.get('description', ''),
+        **encoding
+    }, separators=(',', ':')).encode()
+    return [struct.pack('<I', len(header)) + header, payload], encoding
+
+def field_result_to_json(result):
+    """Convert numpy arrays in an extract result to JSON-safe lists (NaN -> null)"""
+    converted = dict(result)
+    for key in ('data', 'lats', 'lons'):
+        value = converted.get(key)
+        if isinstance(value, np.ndarray):
+            array = value.astype(object)
+            if np.issubdtype(value.dtype, np.floating):
+                array[np.isnan(value)] = None
+            converted[key] = array.tolist()
+    return converted
+
+# Variable/bbox/time subsets of whole datasets, written block by block
+def parse_time_range(value):
+    """
+    Parse 'start/end' or a single ISO timestamp into a (start, end) pair of
+    numpy datetime64 values (either end may be None for open ranges)
+    """
+    if not value:
+        return None
+    start, _, end = value.partition('/') if '/' in value else (value, None, value)
+    to_datetime = lambda v: np.datetime64(v.strip()) if v and v.strip() else None
+    return to_datetime(start), to_datetime(end)
+
+def plan_subset(ds, variables=None, bbox=None, time_range=None):
+    """
+    Select variables, a bbox and a time range from a dataset without reading data
+    
+    Args:
+        ds: xarray Dataset (opened lazily)
+        variables (list): Variable names to keep (None keeps all)
+        bbox (dict): Optional bounding box (see parse_bbox)
+        time_range (tuple): Optional (start, end) datetime64 pair
+        
+    Returns:
+        dict: Lazily indexed dataset plus the lon segments to stitch per block
+    """
+    if variables:
+        missing = [v for v in variables if v not in ds.data_vars]
+        if missing:
+            raise ValueError(f"Variables not found: {', '.join(missing)}")
+        ds = ds[list(variables)]
+    
+    selection = {}
+    time_dim = next((d for d in TIME_DIMS if d in ds.dims), None)
+    if time_range and time_dim:
+        times = ds[time_dim].values
+        start, end = time_range
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times <= end
+        idx = np.nonzero(mask)[0]
+        if len(idx) == 0:
+            raise ValueError('Time range does not overlap the data')
+        selection[time_dim] = slice(int(idx[0]), int(idx[-1]) + 1)
+    
+    lats = _find_coord(ds, LAT_NAMES)
+    lons = _find_coord(ds, LON_NAMES)
+    lon_dim = lons.dims[0] if lons is not None else None
+    lon_slices = [slice(None)]
+    sub_lons = lons.values if lons is not None else None
+    if bbox is not None:
+        if lats is None or lons is None:
+            raise ValueError('Dataset has no latitude/longitude grid')
+        lat_slice, lon_slices, _, sub_lons = _bbox_window(lats.values, lons.values, bbox)
+        selection[lats.dims[0]] = lat_slice
+    
+    return {
+        'ds': ds.isel(selection),
+        'lon_dim': lon_dim,
+        'lon_slices': lon_slices,
+        'lons': sub_lons
+    }
+
+def iter_subset_blocks(plan, var_name, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Yield (start, block) pieces of a planned variable along its leading dim,
+    stitching lon segments of seam-crossing boxes per block
+    """
+    var_data = plan['ds'][var_name]
+    lon_dim = plan['lon_dim']
+    segments = [var_data]
+    if lon_dim in var_data.dims and len(plan['lon_slices']) > 1:
+        segments = [var_data.isel({lon_dim: sl}) for sl in plan['lon_slices']]
+    lon_axis = var_data.dims.index(lon_dim) if lon_dim in var_data.dims else None
+    
+    if var_data.ndim == 0 or var_data.dims[0] == lon_dim:
+        blocks = [(0, [np.asarray(seg.values) for seg in segments])]
+    else:
+        lead_dim = var_data.dims[0]
+        blocks = (
+            (start, [np.asarray(seg.isel({lead_dim: slice(start, start + chunk_steps)}).values) for seg in segments])
+            for start in range(0, var_data.shape[0], chunk_steps)
+        )
+    
+    for start, parts in blocks:
+        yield start, parts[0] if len(parts) == 1 else np.concatenate(parts, axis=lon_axis)
+
+def _subset_shape(plan, var_name):
+    var_data = plan['ds'][var_name]
+    return tuple(
+        len(plan['lons']) if dim == plan['lon_dim'] else size
+        for dim, size in zip(var_data.dims, var_data.shape)
+    )
+
+def _netcdf_attrs(attrs):
+    # netCDF attributes can't hold None or bools
+    return {
+        key: int(value) if isinstance(value, (bool, np.bool_)) else value
+        for key, value in attrs.items()
+        if value is not None and not key.startswith('_')
+    }
+
+def write_netcdf_subset(plan, output_path, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Write a planned subset to NetCDF4 one block at a time
+    
+    Coordinates are CF-encoded with xarray; data variables are streamed into
+    the file so memory use is bounded by a single block.
+    """
+    if netCDF4 is None:
+        raise RuntimeError('netCDF4 is required to write NetCDF subsets')
+    
+    ds = plan['ds']
+    lon_dim = plan['lon_dim']
+    coords = {}
+    for name, coord in ds.coords.items():
+        variable = coord.variable.copy(deep=False)
+        if name == lon_dim:
+            variable = xr.Variable((lon_dim,), plan['lons'], coord.attrs)
+        elif lon_dim in coord.dims:
+            continue
+        if variable.dtype.kind in 'OSU':
+            continue
+        variable.encoding = {}
+        coords[name] = variable
+    encoded, global_attrs = xr.conventions.cf_encoder(coords, ds.attrs)
+    
+    with netCDF4.Dataset(output_path, 'w', format='NETCDF4') as nc:
+        nc.setncatts(_netcdf_attrs(global_attrs))
+        for dim, size in ds.sizes.items():
+            nc.createDimension(dim, len(plan['lons']) if dim == lon_dim else size)
+        
+        for name, variable in encoded.items():
+            out = nc.createVariable(name, variable.dtype, variable.dims)
+            out.setncatts(_netcdf_attrs(variable.attrs))
+            out[...] = variable.values
+        
+        extra_coords = ' '.join(name for name in encoded if name not in ds.dims)
+        for var_name, var_data in ds.data_vars.items():
+            fill = np.nan if var_data.dtype.kind == 'f' else None
+            out = nc.createVariable(var_name, var_data.dtype, var_data.dims, zlib=True, complevel=1, fill_value=fill)
+            attrs = _netcdf_attrs(var_data.attrs)
+            if extra_coords:
+                attrs['coordinates'] = extra_coords
+            out.setncatts(attrs)
+            for start, block in iter_subset_blocks(plan, var_name, chunk_steps):
+                if block.ndim == 0:
+                    out.assignValue(block)
+                else:
+                    out[start:start + len(block)] = block
+
+def iter_binary_subset(plan, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Stream a planned subset as a binary body, block by block
+    
+    Layout: uint32 little-endian header length, UTF-8 JSON header (coordinates
+    and per-variable dims/shape/byte offset), then each variable as
+    little-endian float32 in C order.
+    """
+    ds = plan['ds']
+    lats = _find_coord(ds, LAT_NAMES)
+    times = _find_coord(ds, TIME_DIMS)
+    levels = _find_coord(ds, LEVEL_DIMS)
+    
+    variables, offset = [], 0
+    for var_name, var_data in ds.data_vars.items():
+        shape = _subset_shape(plan, var_name)
+        length = int(np.prod(shape, dtype=np.int64)) * 4
+        variables.append({
+            'name': var_name,
+            'dims': list(var_data.dims),
+            'shape': list(shape),
+            'dtype': 'float32',
+            'units': var_data.attrs.get('units', ''),
+            'description': var_data.attrs.get('long_name', var_name),
+            'offset': offset,
+            'length': length
+        })
+        offset += length
+    
+    header = json.dumps({
+        'byteOrder': 'little',
+        'lats': _axis_summary(lats.values) if lats is not None else None,
+        'lons': _axis_summary(plan['lons']) if plan['lons'] is not None else None,
+        'times': [str(t) for t in np.datetime_as_string(np.atleast_1d(times.values), unit='s')] if times is not None else [],
+        'levels': [float(v) for v in np.atleast_1d(levels.values)] if levels is not None else [],
+        'variables': variables
+    }, separators=(',', ':')).encode()
+    yield struct.pack('<I', len(header)) + header
+    
+    for var in variables:
+        for _, block in iter_subset_blocks(plan, var['name'], chunk_steps):
+            yield np.ascontiguousarray(block, dtype='<f4').tobytes()
+
+# Aggregations over array stores: chunked one-pass reductions, memoized on disk
+AGGREGATE_DIR = 'aggregates'
+# Size budget for each aggregates/ memo; least recently used results are evicted
+GRIB_AGGREGATE_MAX_BYTES = int(os.environ.get('GRIB_AGGREGATE_MAX_BYTES', 1024 ** 3))
+AGGREGATE_REDUCERS = ('mean', 'min', 'max', 'sum')
+RESAMPLE_FREQS = {'daily': 'D', 'monthly': 'M'}
+CLIMATOLOGY_GROUPS = ('month', 'dayofyear', 'hour')
+
+def _time_groups(times, freq=None, by=None):
+    """
+    Assign each time step to a resample period or climatology group
+    
+    Returns:
+        tuple: (group index per step, group labels)
+    """
+    if freq is not None:
+        if freq not in RESAMPLE_FREQS:
+            raise ValueError(f"freq must be one of: {', '.join(RESAMPLE_FREQS)}")
+        labels, ids = np.unique(times.astype(f'datetime64[{RESAMPLE_FREQS[freq]}]'), return_inverse=True)
+        return ids, [str(label) for label in labels]
+    
+    if by == 'month':
+        return times.astype('datetime64[M]').astype(np.int64) % 12, list(range(1, 13))
+    if by == 'dayofyear':
+        days = times.astype('datetime64[D]') - times.astype('datetime64[Y]').astype('datetime64[D]')
+        return days.astype(np.int64), list(range(1, 367))
+    if by == 'hour':
+        return times.astype('datetime64[h]').astype(np.int64) % 24, list(range(24))
+    raise ValueError(f"by must be one of: {', '.join(CLIMATOLOGY_GROUPS)}")
+
+def _sort_block_by_group(block, block_ids):
+    """Order a block's steps by group; returns (block, group of each run, run starts) for reduceat"""
+    order = np.argsort(block_ids, kind='stable')
+    block, block_ids = block[order], block_ids[order]
+    starts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+    return block, block_ids[starts], starts
+
+def grouped_reduce(read_block, ids, n_groups, how='mean', chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Reduce an array over groups of its leading (time) axis in one chunked pass
+    
+    Each block is sorted by group and reduced with ufunc.reduceat, so groups
+    need not be contiguous (climatologies) and NaNs are skipped.
+    
+    Args:
+        read_block (callable): read_block(start, stop) -> ndarray with time leading
+        ids (numpy.ndarray): Group index of every time step
+        n_groups (int): Number of groups
+        how (str): 'mean', 'min', 'max' or 'sum'
+        chunk_steps (int): Time steps read per block
+        
+    Returns:
+        tuple: (reduced array of shape (n_groups, ...), valid-value counts)
+    """
+    if how not in AGGREGATE_REDUCERS:
+        raise ValueError(f"how must be one of: {', '.join(AGGREGATE_REDUCERS)}")
+    
+    totals = counts = None
+    for start in range(0, len(ids), chunk_steps):
+        block = np.asarray(read_block(start, start + chunk_steps), dtype=np.float64)
+        block, groups, starts = _sort_block_by_group(block, ids[start:start + len(block)])
+        
+        if totals is None:
+            shape = (n_groups,) + block.shape[1:]
+            totals = np.full(shape, np.nan) if how in ('min', 'max') else np.zeros(shape)
+            counts = np.zeros(shape, dtype=np.int64)
+        
+        valid = ~np.isnan(block)
+        counts[groups] += np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        if how == 'min':
+            totals[groups] = np.fmin(totals[groups], np.fmin.reduceat(block, starts, axis=0))
+        elif how == 'max':
+            totals[groups] = np.fmax(totals[groups], np.fmax.reduceat(block, starts, axis=0))
+        else:
+            totals[groups] += np.add.reduceat(np.where(valid, block, 0.0), starts, axis=0)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'mean':
+            totals = totals / counts
+        elif how == 'sum':
+            totals = np.where(counts > 0, totals, np.nan)
+    return totals, counts
+
+def _store_window_reader(store_dir, store, variable, bbox=None, level=None):
+    """
+    Build a block reader over a bbox window of a store variable
+    
+    Returns:
+        tuple: (read(start, stop), window lats, window lons, levels, window slices)
+    """
+    var_info = store['variables'].get(variable)
+    if var_info is None:
+        raise ValueError(f'Unknown variable: {variable}')
+    roles = var_info['roles'] or {}
+    if 'time' not in roles or 'lat' not in roles:
+        raise ValueError(f'{variable} has no time/lat/lon grid')
+    
+    array = open_store_array(store_dir, variable, 'time')
+    lats, lons = load_store_coords(store_dir)
+    lat_slice, lon_slices, sub_lats, sub_lons = _bbox_window(lats, lons, bbox)
+    
+    levels = store['levels'] if 'level' in roles else []
+    level_index = ()
+    if 'level' in roles:
+        if level is not None:
+            index = _nearest_level_index(store['levels'], level)
+            level_index = (slice(index, index + 1),)
+            levels = [store['levels'][index]]
+        else:
+            level_index = (slice(None),)
+    
+    def read(start, stop):
+        parts = [array[(slice(start, stop),) + level_index + (lat_slice, sl)] for sl in lon_slices]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=-1)
+    
+    return read, sub_lats, sub_lons, levels, (lat_slice, lon_slices)
+
+def _window_mask(mask, window, grid_shape, window_shape):
+    """Accept a mask over the whole grid or over the bbox window"""
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape == tuple(window_shape):
+        return mask
+    if mask.shape == tuple(grid_shape):
+        lat_slice, lon_slices = window
+        return np.concatenate([mask[lat_slice, sl] for sl in lon_slices], axis=-1)
+    raise ValueError(f'mask shape {list(mask.shape)} matches neither the grid nor the bbox window')
+
+def aggregate_cache_key(store, variable, op, params, mask=None):
+    """Memo key from the store's identity, the operation and its normalized parameters"""
+    identity = {
+        'store': [store.get('source'), store.get('createdAt')],
+        'variable': variable,
+        'op': op,
+        'params': params,
+        'mask': hashlib.sha256(np.packbits(np.asarray(mask, dtype=bool)).tobytes()).hexdigest() if mask is not None else None
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+def _load_aggregate(path):
+    with np.load(path) as saved:
+        result = json.loads(str(saved['meta']))
+        for key in ('data', 'lats', 'lons'):
+            result[key] = saved[key] if saved[key].size else None
+    os.utime(path)
+    return result
+
+def _save_aggregate(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {
+        key: np.asarray(result[key]) if result.get(key) is not None else np.empty(0)
+        for key in ('data', 'lats', 'lons')
+    }
+    meta = {key: value for key, value in result.items() if key not in arrays}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+def _cached_aggregate(cache_path):
+    """Load a memoized aggregate, or None if it is missing or was just evicted"""
+    try:
+        result = _load_aggregate(cache_path)
+    except FileNotFoundError:
+        count_cache('aggregate', False)
+        return None
+    count_cache('aggregate', True)
+    result['cached'] = True
+    return result
+
+def evict_aggregates(aggregate_dir, max_bytes=None, keep=None):
+    """
+    Evict least recently used results from an aggregates/ memo until it fits its budget
+    
+    Args:
+        aggregate_dir (str): Memo directory
+        max_bytes (int): Size budget (default: GRIB_AGGREGATE_MAX_BYTES)
+        keep (str): Path of a result that must not be evicted
+        
+    Returns:
+        int: Number of results removed
+    """
+    max_bytes = GRIB_AGGREGATE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        names = [n for n in os.listdir(aggregate_dir) if n.endswith('.npz')]
+    except OSError:
+        return 0
+    
+    entries = []
+    for name in names:
+        path = os.path.join(aggregate_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_size))
+    
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+def _aggregate_params(op, freq, how, by, bbox, level):
+    """Validate an aggregation request and normalize its parameters for memo keys"""
+    if op not in ('resample', 'climatology', 'area_mean'):
+        raise ValueError('op must be one of: resample, climatology, area_mean')
+    if op == 'resample' and freq is None:
+        raise ValueError('resample needs freq')
+    return {
+        'freq': freq if op != 'climatology' else None,
+        'how': how,
+        'by': by if op == 'climatology' else None,
+        'bbox': [round(bbox[k], 4) for k in ('north', 'west', 'south', 'east')] if bbox else None,
+        'level': float(level) if level is not None else None
+    }
+
+def _run_aggregate(read, times, lats, lons, levels, window, grid_shape, op, params, how, mask, chunk_steps):
+    """
+    Aggregate a windowed (time, [level], lat, lon) reader; shared by stores
+    and catalog-backed virtual datasets
+    
+    Returns:
+        dict: data, lats/lons (None for area means) and group labels or times
+    """
+    if op != 'area_mean':
+        ids, labels = _time_groups(times, freq=params['freq'], by=params['by'])
+        data, _ = grouped_reduce(read, ids, len(labels), how, chunk_steps)
+        return {'data': data.astype(np.float32), 'lats': lats, 'lons': lons, 'groups': labels}
+    
+    weights = np.repeat(np.cos(np.deg2rad(lats))[:, None], len(lons), axis=1)
+    if mask is not None:
+        weights = weights * _window_mask(mask, window, grid_shape, weights.shape)
+    
+    # One pass: weighted sums over the window, skipping NaN cells
+    series = np.empty((len(times),) + ((len(levels),) if levels else ()))
+    for start in range(0, len(times), chunk_steps):
+        block = np.asarray(read(start, start + chunk_steps), dtype=np.float64)
+        valid = ~np.isnan(block)
+        total = np.where(valid, block, 0.0) * weights
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series[start:start + len(block)] = total.sum(axis=(-2, -1)) / (valid * weights).sum(axis=(-2, -1))
+    
+    if params['freq'] is None:
+        return {'data': series, 'lats': None, 'lons': None, 'times': [str(t) for t in times]}
+    
+    ids, labels = _time_groups(times, freq=params['freq'])
+    data, _ = grouped_reduce(lambda a, b: series[a:b], ids, len(labels), how, len(series) or 1)
+    return {'data': data, 'lats': None, 'lons': None, 'groups': labels}
+
+def aggregate_store(store_dir, variable, op, freq=None, how='mean', by='month', bbox=None,
+                    mask=None, level=None, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Aggregate a store variable over time and/or space
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        op (str): 'resample' (to freq), 'climatology' (multi-year, grouped by
+            'by') or 'area_mean' (cos-latitude weighted series over bbox/mask,
+            optionally resampled to freq)
+        freq (str): 'daily' or 'monthly'
+        how (str): 'mean', 'min', 'max' or 'sum'
+        by (str): Climatology grouping: 'month', 'dayofyear' or 'hour'
+        bbox (dict): Optional bounding box (see parse_bbox)
+        mask (array-like): Optional boolean (lat, lon) mask over the grid or the bbox window
+        level (float): Optional single pressure level
+        chunk_steps (int): Time steps read per block
+        
+    Returns:
+        dict: Result with data, lats/lons (None for area means), levels,
+            group labels or times, and whether it came from the memo cache
+    """
+    try:
+        store = load_store(store_dir)
+        params = _aggregate_params(op, freq, how, by, bbox, level)
+        cache_path = os.path.join(store_dir, AGGREGATE_DIR, aggregate_cache_key(store, variable, op, params, mask) + '.npz')
+        cached = _cached_aggregate(cache_path)
+        if cached is not None:
+            return cached
+        
+        read, lats, lons, levels, window = _store_window_reader(store_dir, store, variable, bbox, level)
+        times = np.array(store['times'], dtype='datetime64[s]')
+        var_info = store['variables'][variable]
+        result = {
+            'success': True,
+            'op': op,
+            'variable': variable,
+            'params': params,
+            'levels': levels,
+            'units': var_info['units'],
+            'description': var_info['description']
+        }
+        
+        grid_lats, grid_lons = load_store_coords(store_dir)
+        with span('reduce'):
+            result.update(_run_aggregate(
+                read, times, lats, lons, levels, window, (len(grid_lats), len(grid_lons)),
+                op, params, how, mask, chunk_steps
+            ))
+        
+        _save_aggregate(cache_path, result)
+        evict_aggregates(os.path.dirname(cache_path), keep=cache_path)
+        result['cached'] = False
+        return result
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+# Persistent climatology baselines: running sums/counts per group and grid cell
+GRIB_BASELINE_DIR = os.environ.get('GRIB_BASELINE_DIR', '/tmp/grib_baselines')
+BASELINE_GROUPS = {'month': 12, 'dayofyear': 366}
+GRIB_BASELINE_GROUPS = tuple(os.environ.get('GRIB_BASELINE_GROUPS', 'dayofyear,month').split(','))
+BASELINE_METADATA = 'baseline.json'
+# Undo journal: original rows of the groups an update touches, and the steps it adds
+BASELINE_JOURNAL = 'journal.npz'
+
+def _grid_signature(lats, lons, levels=()):
+    """Short hash identifying a lat/lon grid and level set"""
+    grid = hashlib.sha256()
+    for coord in (lats, lons):
+        grid.update(np.asarray(coord, dtype=np.float64).tobytes())
+    grid.update(json.dumps([float(v) for v in levels]).encode())
+    return grid.hexdigest()[:16]
+
+def baseline_dir_for(store_dir, variable, by):
+    """
+    Baseline directory for a store variable; baselines are shared by every
+    store on the same grid and levels
+    """
+    if by not in BASELINE_GROUPS:
+        raise ValueError(f"by must be one of: {', '.join(BASELINE_GROUPS)}")
+    store = load_store(store_dir)
+    lats, lons = load_store_coords(store_dir)
+    var_info = store['variables'].get(variable)
+    if var_info is None:
+        raise ValueError(f'Unknown variable: {variable}')
+    
+    grid = _grid_signature(lats, lons, store['levels'] if 'level' in (var_info['roles'] or {}) else [])
+    return os.path.join(GRIB_BASELINE_DIR, f"{_array_filename(variable)[:-len('.npy')]}.{by}.{grid}")
+
+def _recover_baseline(base_dir):
+    """
+    Finish an update that was interrupted (call with the baseline lock held)
+    
+    times.npy is the commit point: if it lists the journaled steps the update
+    completed and only the journal is left over; otherwise the touched rows
+    may be partly updated and are restored from the journal.
+    """
+    journal_path = os.path.join(base_dir, BASELINE_JOURNAL)
+    if not os.path.exists(journal_path):
+        return
+    with np.load(journal_path) as journal:
+        seen = np.load(os.path.join(base_dir, 'times.npy'))
+        if not np.isin(journal['pending'], seen).all():
+            sums = np.load(os.path.join(base_dir, 'sums.npy'), mmap_mode='r+')
+            counts = np.load(os.path.join(base_dir, 'counts.npy'), mmap_mode='r+')
+            sums[journal['groups']] = journal['sums']
+            counts[journal['groups']] = journal['counts']
+            sums.flush()
+            counts.flush()
+            del sums, counts
+    os.remove(journal_path)
+
+def update_baseline(store_dir, variable, by='dayofyear', chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Add a store's time steps to the climatology baseline of a variable
+    
+    Only time steps the baseline hasn't seen are read, and only the groups
+    they fall in are touched, so appending a day costs one day of data.
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        by (str): 'dayofyear' or 'month'
+        chunk_steps (int): Time steps read per block
+        
+    Returns:
+        dict: Result with the number of steps added and the baseline's total
+    """
+    try:
+        store = load_store(store_dir)
+        var_info = store['variables'].get(variable)
+        if var_info is None:
+            return {'success': False, 'error': f'Unknown variable: {variable}'}
+        if 'time' not in (var_info['roles'] or {}):
+            return {'success': False, 'error': f'{variable} has no time dimension'}
+        
+        base_dir = baseline_dir_for(store_dir, variable, by)
+        os.makedirs(base_dir, exist_ok=True)
+        array = open_store_array(store_dir, variable, 'time')
+        times = np.array(store['times'], dtype='datetime64[s]')
+        
+        with _file_lock(os.path.join(base_dir, '.lock')):
+            sums_path = os.path.join(base_dir, 'sums.npy')
+            shape = (BASELINE_GROUPS[by],) + tuple(array.shape[1:])
+            if not os.path.exists(sums_path):
+                lats, lons = load_store_coords(store_dir)
+                np.save(os.path.join(base_dir, 'lats.npy'), lats)
+                np.save(os.path.join(base_dir, 'lons.npy'), lons)
+                np.save(os.path.join(base_dir, 'times.npy'), np.array([], dtype='datetime64[s]'))
+                np.lib.format.open_memmap(os.path.join(base_dir, 'counts.npy'), mode='w+', dtype=np.int32, shape=shape).flush()
+                np.lib.format.open_memmap(sums_path, mode='w+', dtype=np.float64, shape=shape).flush()
+                with open(os.path.join(base_dir, BASELINE_METADATA), 'w') as f:
+                    json.dump({
+                        'variable': variable,
+                        'by': by,
+                        'dims': ['group'] + var_info['dims'][1:],
+                        'levels': store['levels'] if 'level' in var_info['roles'] else [],
+                        'units': var_info['units'],
+                        'description': var_info['description']
+                    }, f, indent=2)
+            
+            _recover_baseline(base_dir)
+            # Skip steps already counted (re-ingested or overlapping downloads)
+            seen = np.load(os.path.join(base_dir, 'times.npy'))
+            new_steps = np.flatnonzero(~np.isin(times, seen))
+            if len(new_steps):
+                sums = np.load(sums_path, mmap_mode='r+')
+                counts = np.load(os.path.join(base_dir, 'counts.npy'), mmap_mode='r+')
+                ids, _ = _time_groups(times[new_steps], by=by)
+                
+                # Journal the rows about to change, so a crash mid-update is rolled back
+                touched = np.unique(ids)
+                journal_path = os.path.join(base_dir, BASELINE_JOURNAL)
+                tmp_path = os.path.join(base_dir, f'journal.{os.getpid()}.tmp.npz')
+                np.savez(tmp_path, groups=touched, sums=sums[touched], counts=counts[touched], pending=times[new_steps])
+                os.replace(tmp_path, journal_path)
+                
+                for start in range(0, len(new_steps), chunk_steps):
+                    block = np.asarray(array[new_steps[start:start + chunk_steps]], dtype=np.float64)
+                    block, groups, starts = _sort_block_by_group(block, ids[start:start + len(block)])
+                    valid = ~np.isnan(block)
+                    sums[groups] += np.add.reduceat(np.where(valid, block, 0.0), starts, axis=0)
+                    counts[groups] += np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+                
+                sums.flush()
+                counts.flush()
+                del sums, counts
+                
+                # Commit point: once the steps are recorded the journal is no longer needed
+                all_times = np.union1d(seen, times[new_steps])
+                tmp_path = os.path.join(base_dir, f'times.{os.getpid()}.tmp.npy')
+                np.save(tmp_path, all_times)
+                os.replace(tmp_path, os.path.join(base_dir, 'times.npy'))
+                os.remove(journal_path)
+            else:
+                all_times = seen
+        
+        return {
+            'success': True,
+            'baseline': os.path.basename(base_dir),
+            'added': int(len(new_steps)),
+            'totalSteps': int(len(all_times))
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def compute_anomaly(store_dir, variable, by='dayofyear', time_step=None, start=None, end=None,
+                    level=None, bbox=None, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Subtract the climatology baseline from a store variable on the fly
+    
+    With time_step, returns one anomaly field (bbox window). Otherwise returns
+    the cos-latitude weighted area-mean anomaly over bbox for every time step
+    between start and end. Only the baseline groups needed are read.
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        by (str): Baseline grouping, 'dayofyear' or 'month'
+        time_step (int): Time step index for a field
+        start (str): ISO start of the series (inclusive)
+        end (str): ISO end of the series (inclusive)
+        level (float): Pressure level (if applicable)
+        bbox (dict): Optional bounding box
+        chunk_steps (int): Time steps read per block
+        
+    Returns:
+        dict: Field result (data/lats/lons) or series result (times/data)
+    """
+    try:
+        store = load_store(store_dir)
+        base_dir = baseline_dir_for(store_dir, variable, by)
+        if not os.path.exists(os.path.join(base_dir, 'sums.npy')):
+            return {'success': False, 'error': f'No {by} baseline for {variable} on this grid'}
+        
+        read, lats, lons, levels, (lat_slice, lon_slices) = _store_window_reader(store_dir, store, variable, bbox, level)
+        if os.path.exists(os.path.join(base_dir, BASELINE_JOURNAL)):
+            with _file_lock(os.path.join(base_dir, '.lock')):
+                _recover_baseline(base_dir)
+        sums = np.load(os.path.join(base_dir, 'sums.npy'), mmap_mode='r')
+        counts = np.load(os.path.join(base_dir, 'counts.npy'), mmap_mode='r')
+        level_index = ()
+        if levels:
+            index = _nearest_level_index(store['levels'], level) if level is not None else None
+            level_index = (slice(index, index + 1) if index is not None else slice(None),)
+        
+        def baseline_mean(groups):
+            index = (groups,) + level_index + (lat_slice,)
+            parts = [(sums[index + (sl,)], counts[index + (sl,)]) for sl in lon_slices]
+            total = np.concatenate([p[0] for p in parts], axis=-1)
+            count = np.concatenate([p[1] for p in parts], axis=-1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / count
+        
+        times = np.array(store['times'], dtype='datetime64[s]')
+        ids, _ = _time_groups(times, by=by)
+        var_info = store['variables'][variable]
+        result = {
+            'success': True,
+            'variable': variable,
+            'by': by,
+            'levels': levels,
+            'units': var_info['units'],
+            'description': f"{var_info['description']} anomaly"
+        }
+        
+        if time_step is not None:
+            time_step = int(time_step)
+            field = read(time_step, time_step + 1)[0] - baseline_mean(ids[time_step:time_step + 1])[0]
+            if field.ndim == 3 and field.shape[0] == 1:
+                field = field[0]
+            result.update({
+                'data': field.astype(np.float32),
+                'lats': lats,
+                'lons': lons,
+                'time': store['times'][time_step]
+            })
+            return result
+        
+        mask = np.ones(len(times), dtype=bool)
+        if start:
+            mask &= times >= np.datetime64(start)
+        if end:
+            mask &= times <= np.datetime64(end)
+        steps = np.flatnonzero(mask)
+        
+        weights = np.repeat(np.cos(np.deg2rad(lats))[:, None], len(lons), axis=1)
+        series = np.empty((len(steps),) + ((len(levels),) if levels else ()))
+        for i in range(0, len(steps), chunk_steps):
+            block_steps = steps[i:i + chunk_steps]
+            block = np.asarray(read(block_steps[0], block_steps[-1] + 1), dtype=np.float64)[block_steps - block_steps[0]]
+            anomaly = block - baseline_mean(ids[block_steps])
+            valid = ~np.isnan(anomaly)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                series[i:i + len(block_steps)] = (
+                    (np.where(valid, anomaly, 0.0) * weights).sum(axis=(-2, -1)) / (valid * weights).sum(axis=(-2, -1))
+                )
+        
+        result.update({
+            'times': [store['times'][i] for i in steps],
+            'data': series
+        })
+        return result
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+# Regridding between regular lat/lon grids: sparse remapping weights built once
+# per (source grid, target grid, method) and cached in memory and on disk
+GRIB_REGRID_DIR = os.environ.get('GRIB_REGRID_DIR', '/tmp/grib_regrid')
+GRIB_REGRID_CACHE_SIZE = int(os.environ.get('GRIB_REGRID_CACHE_SIZE', 16))
+REGRID_METHODS = ('bilinear', 'conservative')
+_regrid_cache = OrderedDict()
+_regrid_lock = threading.Lock()
+
+def regular_grid(bbox, resolution):
+    """
+    Cell centres of a regular grid, latitudes north to south as in ERA5
+    
+    Args:
+        bbox (dict): Extent (see parse_bbox); both edges are grid points
+        resolution (float): Grid spacing in degrees
+        
+    Returns:
+        tuple: (lats, lons)
+    """
+    resolution = float(resolution)
+    if resolution <= 0:
+        raise ValueError('resolution must be positive')
+    
+    n_lat = int(round((bbox['north'] - bbox['south']) / resolution)) + 1
+    lats = bbox['north'] - resolution * np.arange(n_lat)
+    lon_span = (bbox['east'] - bbox['west']) % 360 or 360.0
+    n_lon = int(round(lon_span / resolution))
+    # A full circle would repeat the first longitude
+    if abs(n_lon * resolution - 360.0) > resolution / 2:
+        n_lon += 1
+    lons = bbox['west'] + resolution * np.arange(n_lon)
+    return lats, lons
+
+def common_grid(grids, resolution=None):
+    """
+    Regular grid covering the extent every grid shares, at the coarsest spacing
+    
+    Args:
+        grids (list): (lats, lons) pairs
+        resolution (float): Spacing to use instead of the coarsest one
+        
+    Returns:
+        tuple: (lats, lons)
+    """
+    spacing = max(
+        max(abs(float(lats[1] - lats[0])) if len(lats) > 1 else 0.0,
+            abs(float(lons[1] - lons[0])) if len(lons) > 1 else 0.0)
+        for lats, lons in grids
+    )
+    resolution = float(resolution or spacing)
+    if not resolution:
+        raise ValueError('Grids need at least two points per axis')
+    
+    south = max(float(np.min(lats)) for lats, _ in grids)
+    north = min(float(np.max(lats)) for lats, _ in grids)
+    # Longitudes are compared in the first grid's convention
+    reference = grids[0][1]
+    west = max(float(np.min(_normalize_lons(reference, lons))) for _, lons in grids)
+    east = min(float(np.max(_normalize_lons(reference, lons))) for _, lons in grids)
+    if south > north or west > east:
+        raise ValueError('Grids do not overlap')
+    
+    # Snap inwards to whole multiples of the spacing so grids line up across calls
+    south, west = [math.ceil(round(v / resolution, 6)) * resolution for v in (south, west)]
+    north, east = [math.floor(round(v / resolution, 6)) * resolution for v in (north, east)]
+    if all(_is_global_lon(lons) for _, lons in grids):
+        west, east = float(np.min(reference)), float(np.min(reference)) + 360.0
+    return regular_grid({'north': north, 'south': south, 'west': west, 'east': east}, resolution)
+
+def _cell_edges(coord):
+    """Cell edges midway between centres, extended by half a step at both ends"""
+    coord = np.asarray(coord, dtype=np.float64)
+    if len(coord) < 2:
+        raise ValueError('Conservative regridding needs at least two points per axis')
+    mid = (coord[:-1] + coord[1:]) / 2
+    return np.concatenate([[2 * coord[0] - mid[0]], mid, [2 * coord[-1] - mid[-1]]])
+
+def _linear_weights(src, dst, periodic=False):
+    """Sparse (len(dst), len(src)) linear interpolation along one axis; empty rows outside src"""
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    n = len(src)
+    if periodic:
+        # Shift targets into [src[0], src[0] + 360) so the ring closes after the last point
+        positions = _fractional_index(src, src[0] + np.mod(dst - src[0], 360.0), wrap=True)
+        valid = np.ones(len(dst), dtype=bool)
+    else:
+        tolerance = 1e-9 * max(1.0, float(np.max(np.abs(src))))
+        valid = (dst >= np.min(src) - tolerance) & (dst <= np.max(src) + tolerance)
+        positions = _fractional_index(src, dst)
+    
+    lower = np.floor(positions).astype(np.int64)
+    frac = positions - lower
+    upper = (lower + 1) % n if periodic else np.minimum(lower + 1, n - 1)
+    lower = lower % n
+    rows = np.flatnonzero(valid)
+    return scipy.sparse.csr_matrix(
+        (np.concatenate([1 - frac[rows], frac[rows]]),
+         (np.concatenate([rows, rows]), np.concatenate([lower[rows], upper[rows]]))),
+        shape=(len(dst), n)
+    )
+
+def _overlap_weights(src_edges, dst_edges, shifts=(0.0,)):
+    """
+    Sparse (n_dst, n_src) overlap lengths between cells along one axis
+    
+    Each source cell overlaps a contiguous run of target cells, found by
+    binary search; shifts add copies of the source cells (longitude wrap).
+    """
+    n_src = len(src_edges) - 1
+    src_lo = np.concatenate([np.minimum(src_edges[:-1], src_edges[1:]) + s for s in shifts])
+    src_hi = np.concatenate([np.maximum(src_edges[:-1], src_edges[1:]) + s for s in shifts])
+    src_index = np.tile(np.arange(n_src), len(shifts))
+    order = np.argsort(src_lo)
+    src_lo, src_hi, src_index = src_lo[order], src_hi[order], src_index[order]
+    
+    dst_lo = np.minimum(dst_edges[:-1], dst_edges[1:])
+    dst_hi = np.maximum(dst_edges[:-1], dst_edges[1:])
+    # Sorted source cells don't overlap, so their upper edges are sorted too
+    start = np.searchsorted(src_hi, dst_lo, side='right')
+    stop = np.searchsorted(src_lo, dst_hi, side='left')
+    counts = np.maximum(stop - start, 0)
+    
+    rows = np.repeat(np.arange(len(dst_lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = np.repeat(start, counts) + offsets
+    overlap = np.minimum(src_hi[cols], dst_hi[rows]) - np.maximum(src_lo[cols], dst_lo[rows])
+    keep = overlap > 0
+    return scipy.sparse.csr_matrix(
+        (overlap[keep], (rows[keep], src_index[cols[keep]])),
+        shape=(len(dst_lo), n_src)
+    )
+
+def _build_regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method):
+    """Combine per-axis operators into the 2D matrix (regular grids are separable)"""
+    periodic = _is_global_lon(src_lons)
+    if method == 'bilinear':
+        lat_weights = _linear_weights(src_lats, dst_lats)
+        if periodic:
+            lon_weights = _linear_weights(src_lons, dst_lons, periodic=True)
+        else:
+            lon_weights = _linear_weights(src_lons, _normalize_lons(src_lons, dst_lons))
+    else:
+        # Latitude bands weighted by area (difference of sin(lat)), longitudes by length
+        def sin_edges(lats):
+            return np.sin(np.deg2rad(np.clip(_cell_edges(lats), -90.0, 90.0)))
+        lat_weights = _overlap_weights(sin_edges(src_lats), sin_edges(dst_lats))
+        lon_weights = _overlap_weights(_cell_edges(src_lons), _cell_edges(dst_lons), shifts=(-360.0, 0.0, 360.0))
+    
+    weights = scipy.sparse.kron(lat_weights, lon_weights, format='csr')
+    if method == 'conservative':
+        # Average over the part of each target cell the source covers
+        totals = np.asarray(weights.sum(axis=1)).ravel()
+        weights = scipy.sparse.diags(np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)) @ weights
+    weights.eliminate_zeros()
+    return weights.tocsr()
+
+def regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method='bilinear'):
+    """
+    Sparse remapping matrix between two lat/lon grids, built once per grid pair
+    
+    Rows are target cells and columns source cells, each flattened in
+    (lat, lon) order. Rows for targets the source doesn't cover are empty.
+    
+    Args:
+        src_lats, src_lons (array-like): Source grid coordinates
+        dst_lats, dst_lons (array-like): Target grid coordinates
+        method (str): 'bilinear' or 'conservative' (area-weighted, first order)
+        
+    Returns:
+        scipy.sparse.csr_matrix: Shape (n_target, n_source)
+    """
+    if scipy is None:
+        raise RuntimeError('scipy is required for regridding')
+    if method not in REGRID_METHODS:
+        raise ValueError(f"method must be one of: {', '.join(REGRID_METHODS)}")
+    
+    key = f"{method}-{_grid_signature(src_lats, src_lons)}-{_grid_signature(dst_lats, dst_lons)}"
+    with _regrid_lock:
+        weights = _regrid_cache.get(key)
+        if weights is not None:
+            _regrid_cache.move_to_end(key)
+            count_cache('regrid_weights', True)
+            return weights
+    
+    path = os.path.join(GRIB_REGRID_DIR, key + '.npz')
+    try:
+        weights = scipy.sparse.load_npz(path).tocsr()
+    except (OSError, ValueError):
+        weights = None
+    count_cache('regrid_weights', weights is not None)
+    
+    if weights is None:
+        with span('regrid_weights'):
+            weights = _build_regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method)
+        os.makedirs(GRIB_REGRID_DIR, exist_ok=True)
+        # save_npz appends .npz to names without it
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        scipy.sparse.save_npz(tmp_path, weights)
+        os.replace(tmp_path, path)
+    
+    with _regrid_lock:
+        _regrid_cache[key] = weights
+        while len(_regrid_cache) > GRIB_REGRID_CACHE_SIZE:
+            _regrid_cache.popitem(last=False)
+    return weights
+
+def apply_regrid(weights, data, dst_shape):
+    """
+    Remap a stack of fields with one sparse-dense product
+    
+    NaN source cells are left out and the remaining weights renormalized
+    (a second product over the validity mask, only when NaNs are present).
+    
+    Args:
+        weights: Matrix from regrid_weights
+        data (array-like): Fields with (lat, lon) as the last two axes
+        dst_shape (tuple): Target (lat, lon) shape
+        
+    Returns:
+        numpy.ndarray: float32 fields on the target grid; NaN where nothing maps
+    """
+    data = np.asarray(data)
+    lead = data.shape[:-2]
+    columns = data.reshape(-1, data.shape[-2] * data.shape[-1]).T
+    
+    with span('regrid'):
+        missing = np.isnan(columns) if np.issubdtype(columns.dtype, np.floating) else None
+        if missing is not None and missing.any():
+            totals = weights @ np.where(missing, 0.0, columns)
+            coverage = weights @ (~missing).astype(np.float64)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = totals / coverage
+            result[coverage <= 0] = np.nan
+        else:
+            result = np.asarray(weights @ columns, dtype=np.float64)
+            result[np.diff(weights.indptr) == 0] = np.nan
+    
+    return result.T.reshape(lead + tuple(dst_shape)).astype(np.float32)
+
+def regrid_field(data, src_lats, src_lons, dst_lats, dst_lons, method='bilinear'):
+    """Remap fields with (lat, lon) as the last two axes onto another grid"""
+    weights = regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method)
+    return apply_regrid(weights, data, (len(dst_lats), len(dst_lons)))
+
+def regrid_store(store_dir, variable, dst_lats, dst_lons, method='bilinear', time_steps=None, level=None,
+                 chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Remap a store variable onto another grid
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        dst_lats, dst_lons (array-like): Target grid
+        method (str): 'bilinear' or 'conservative'
+        time_steps (list): Time step indices (None for all)
+        level (float): Optional single pressure level
+        chunk_steps (int): Time steps remapped per product (None for all at once)
+        
+    Returns:
+        dict: Result with data (time, [level], lat, lon), target lats/lons, times and levels
+    """
+    try:
+        store = load_store(store_dir)
+        var_info = store['variables'].get(variable)
+        if var_info is None:
+            raise ValueError(f'Unknown variable: {variable}')
+        roles = var_info['roles'] or {}
+        if 'lat' not in roles or 'lon' not in roles:
+            raise ValueError(f'{variable} is not on a lat/lon grid')
+        
+        lats, lons = load_store_coords(store_dir)
+        times = store['times']
+        steps = list(range(len(times))) if time_steps is None else [int(t) for t in time_steps]
+        for step in steps:
+            if not -len(times) <= step < len(times):
+                raise ValueError(f'Time step {step} out of range')
+        levels = store['levels'] if 'level' in roles else []
+        level_index = ()
+        if levels and level is not None:
+            index = _nearest_level_index(levels, level)
+            level_index = (slice(index, index + 1),)
+            levels = [levels[index]]
+        
+        dst_lats = np.asarray(dst_lats, dtype=np.float64)
+        dst_lons = np.asarray(dst_lons, dtype=np.float64)
+        weights = regrid_weights(lats, lons, dst_lats, dst_lons, method)
+        # Angles can't be averaged: remap the wind components and derive the direction again
+        sources = var_info['derivedFrom'] if var_info.get('circular') else [variable]
+        arrays = [open_store_array(store_dir, name, 'time') for name in sources]
+        
+        blocks = []
+        for start in range(0, len(steps), chunk_steps or len(steps) or 1):
+            block_steps = steps[start:start + (chunk_steps or len(steps))]
+            fields = [
+                apply_regrid(weights, np.asarray(array[(block_steps,) + level_index]), (len(dst_lats), len(dst_lons)))
+                for array in arrays
+            ]
+            blocks.append(wind_speed_direction(*fields)[1] if var_info.get('circular') else fields[0])
+        
+        return {
+            'success': True,
+            'variable': variable,
+            'method': method,
+            'data': np.concatenate(blocks) if blocks else np.empty((0, len(dst_lats), len(dst_lons)), dtype=np.float32),
+            'lats': dst_lats,
+            'lons': dst_lons,
+            'times': [times[step] for step in steps],
+            'levels': levels,
+            'units': var_info['units'],
+            'description': var_info['description']
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+# Catalog of completed data files and lazily concatenated virtual datasets over it
+GRIB_CATALOG_DIR = os.environ.get('GRIB_CATALOG_DIR', '/tmp/grib_catalog')
+_catalog = None
+_catalog_lock = threading.Lock()
+
+class FileCatalog:
+    """
+    SQLite catalog of data files: variables, time range, extent and grid
+    
+    Entries point at the source file and, when one exists, its array store.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                store_dir TEXT,
+                grid TEXT NOT NULL,
+                time_start TEXT,
+                time_end TEXT,
+                north REAL, south REAL, west REAL, east REAL,
+                levels TEXT NOT NULL,
+                times TEXT NOT NULL,
+                added_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_time ON files (time_start, time_end);
+            CREATE TABLE IF NOT EXISTS file_variables (
+                variable TEXT NOT NULL,
+                path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+                PRIMARY KEY (variable, path)
+            );
+        """)
+    
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def add(self, filepath, store_dir=None):
+        """
+        Record a file, reading its description from the store when given
+        (cheap) or from the file itself through the dataset pool
+        
+        Returns:
+            dict: The catalog entry
+        """
+        filepath = os.path.abspath(filepath)
+        if store_dir is not None:
+            store = load_store(store_dir)
+            lats, lons = load_store_coords(store_dir)
+            times = store['times']
+            levels = store['levels']
+            variables = [v for v, info in store['variables'].items() if 'time' in (info['roles'] or {})]
+        else:
+            with dataset_pool.dataset(filepath) as ds:
+                lats = _find_coord(ds, LAT_NAMES).values
+                lons = _find_coord(ds, LON_NAMES).values
+                time_coord = _find_coord(ds, TIME_DIMS)
+                times = [str(t) for t in np.datetime_as_string(np.atleast_1d(time_coord.values), unit='s')]
+                level_coord = _find_coord(ds, LEVEL_DIMS)
+                levels = [float(v) for v in np.atleast_1d(level_coord.values)] if level_coord is not None else []
+                variables = [v for v, data in ds.data_vars.items() if (_dim_roles(data) or {}).get('time')]
+        
+        entry = {
+            'path': filepath,
+            'storeDir': store_dir,
+            'grid': _grid_signature(lats, lons, levels),
+            'timeStart': times[0] if times else None,
+            'timeEnd': times[-1] if times else None,
+            'north': float(np.max(lats)),
+            'south': float(np.min(lats)),
+            'west': float(np.min(lons)),
+            'east': float(np.max(lons)),
+            'levels': levels,
+            'variables': variables,
+            'times': times,
+            'addedAt': datetime.utcnow().isoformat()
+        }
+        
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM files WHERE path = ?', (filepath,))
+            conn.execute(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (filepath, store_dir, entry['grid'], entry['timeStart'], entry['timeEnd'],
+                 entry['north'], entry['south'], entry['west'], entry['east'],
+                 json.dumps(levels), json.dumps(times), entry['addedAt'])
+            )
+            conn.executemany(
+                'INSERT INTO file_variables (variable, path) VALUES (?, ?)',
+                [(variable, filepath) for variable in variables]
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return entry
+    
+    def remove(self, filepath):
+        self._conn().execute('DELETE FROM files WHERE path = ?', (os.path.abspath(filepath),))
+    
+    def find(self, variable=None, start=None, end=None, bbox=None, with_times=True):
+        """
+        Files overlapping a time range (ISO strings) and bbox latitudes, oldest first
+        
+        Returns:
+            list: Catalog entries
+        """
+        clauses, params = [], []
+        if variable:
+            clauses.append('f.path IN (SELECT path FROM file_variables WHERE variable = ?)')
+            params.append(variable)
+        if start:
+            clauses.append('time_end >= ?')
+            params.append(str(np.datetime64(start, 's')))
+        if end:
+            clauses.append('time_start <= ?')
+            params.append(str(np.datetime64(end, 's')))
+        if bbox:
+            clauses.append('north >= ? AND south <= ?')
+            params.extend([bbox['south'], bbox['north']])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        conn = self._conn()
+        # Variables come back with their file in one query, as a JSON array per row
+        rows = conn.execute(
+            f'SELECT f.path, store_dir, grid, time_start, time_end, north, south, west, east, levels, '
+            f'{"times" if with_times else "NULL"}, added_at, json_group_array(v.variable) '
+            f'FROM files f LEFT JOIN file_variables v ON v.path = f.path {where} '
+            f'GROUP BY f.path ORDER BY time_start, added_at',
+            params
+        ).fetchall()
+        
+        entries = []
+        for row in rows:
+            entries.append({
+                'path': row[0],
+                'storeDir': row[1],
+                'grid': row[2],
+                'timeStart': row[3],
+                'timeEnd': row[4],
+                'north': row[5], 'south': row[6], 'west': row[7], 'east': row[8],
+                'levels': json.loads(row[9]),
+                'variables': [v for v in json.loads(row[12]) if v is not None],
+                'times': json.loads(row[10]) if with_times else None,
+                'addedAt': row[11]
+            })
+        return entries
+
+def get_catalog():
+    """Shared catalog, created on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = FileCatalog(os.path.join(GRIB_CATALOG_DIR, 'catalog.db'))
+        return _catalog
+
+class VirtualDataset:
+    """
+    One variable across every cataloged file, concatenated along time
+    
+    Nothing is read up front: queries map global time steps to (file, step)
+    and read only the files they overlap, from the file's array store when
+    it has one or through the shared, bounded dataset pool otherwise. Files
+    on a different grid than the newest match are left out, or remapped onto
+    its grid when regrid names a method; where files overlap in time, the
+    earlier file wins.
+    """
+    
+    def __init__(self, variable, start=None, end=None, bbox=None, clip=True, catalog=None, pool=None, regrid=None):
+        """
+        Args:
+            variable (str): Variable name
+            start (str): ISO start of the time range
+            end (str): ISO end of the time range
+            bbox (dict): Only files whose latitudes overlap this box are used
+            clip (bool): Drop steps outside [start, end] (False keeps whole files)
+            catalog (FileCatalog): Catalog to query (default: shared catalog)
+            pool (DatasetPool): Pool for files without a store (default: shared pool)
+            regrid (str): 'bilinear' or 'conservative' to remap files on other
+                grids (same levels) instead of leaving them out
+        """
+        if regrid is not None and regrid not in REGRID_METHODS:
+            raise ValueError(f"regrid must be one of: {', '.join(REGRID_METHODS)}")
+        self.variable = variable
+        self.pool = pool or dataset_pool
+        self.regrid = regrid
+        self._grids = {}
+        entries = (catalog or get_catalog()).find(variable, start, end, bbox)
+        entries = [e for e in entries if os.path.exists(e['path']) or (e['storeDir'] and os.path.exists(e['storeDir']))]
+        if not entries:
+            raise ValueError(f'No cataloged files hold {variable} for that range')
+        
+        reference = max(entries, key=lambda e: e['addedAt'])
+        self.grid = reference['grid']
+        if regrid:
+            self.entries = [e for e in entries if e['levels'] == reference['levels']]
+        else:
+            self.entries = [e for e in entries if e['grid'] == self.grid]
+        
+        # Global timeline: each file adds the steps after everything before it
+        times, file_index, local_index = [], [], []
+        last = None
+        for i, entry in enumerate(self.entries):
+            file_times = np.array(entry['times'], dtype='datetime64[s]')
+            keep = np.ones(len(file_times), dtype=bool)
+            if last is not None:
+                keep &= file_times > last
+            if clip and start:
+                keep &= file_times >= np.datetime64(start)
+            if clip and end:
+                keep &= file_times <= np.datetime64(end)
+            steps = np.flatnonzero(keep)
+            times.append(file_times[steps])
+            file_index.append(np.full(len(steps), i))
+            local_index.append(steps)
+            if len(file_times):
+                last = file_times[-1] if last is None else max(last, file_times[-1])
+        
+        self.times = np.concatenate(times)
+        self.file_index = np.concatenate(file_index)
+        self.local_index = np.concatenate(local_index)
+        self.levels = reference['levels']
+        self.lats, self.lons, self.units, self.description = self._describe(reference)
+    
+    def _describe(self, entry):
+        if self._has_store(entry):
+            lats, lons = load_store_coords(entry['storeDir'])
+            var_info = load_store(entry['storeDir'])['variables'][self.variable]
+            return lats, lons, var_info['units'], var_info['description']
+        with self.pool.dataset(entry['path']) as ds:
+            attrs = ds[self.variable].attrs
+            return (_find_coord(ds, LAT_NAMES).values, _find_coord(ds, LON_NAMES).values,
+                    attrs.get('units', ''), attrs.get('long_name', self.variable))
+    
+    def _has_store(self, entry):
+        return bool(entry['storeDir']) and os.path.exists(os.path.join(entry['storeDir'], STORE_METADATA))
+    
+    def _runs(self, start, stop):
+        """Split global steps [start, stop) into per-file runs of contiguous local steps"""
+        stop = min(stop, len(self.times))
+        position = start
+        while position < stop:
+            ids = self.file_index[position:stop]
+            changes = np.flatnonzero(ids != ids[0])
+            run_end = position + (int(changes[0]) if len(changes) else len(ids))
+            local = self.local_index[position:run_end]
+            yield self.entries[ids[0]], int(local[0]), int(local[-1]) + 1
+            position = run_end
+    
+    def _read_file(self, entry, t0, t1, index):
+        """
+        Read steps [t0, t1) of a file; index ends with (lat, lon) on the dataset's
+        grid, and lists of rows and columns select orthogonally
+        """
+        if entry['grid'] == self.grid:
+            return self._read_native(entry, t0, t1, index)
+        # Off-grid files are remapped whole (weights are cached per grid pair), then windowed
+        lats, lons = self._source_grid(entry)
+        data = self._read_native(entry, t0, t1, index[:-2] + (slice(None), slice(None)))
+        data = regrid_field(data, lats, lons, self.lats, self.lons, self.regrid)
+        return data[..., index[-2], :][..., index[-1]]
+    
+    def _source_grid(self, entry):
+        if entry['path'] not in self._grids:
+            self._grids[entry['path']] = self._describe(entry)[:2]
+        return self._grids[entry['path']]
+    
+    def _read_native(self, entry, t0, t1, index):
+        if self._has_store(entry):
+            array = open_store_array(entry['storeDir'], self.variable, 'time')[(slice(t0, t1),) + index[:-2]]
+            # Latitude then longitude, so row and column lists select orthogonally as in xarray
+            return np.asarray(array[..., index[-2], :][..., index[-1]])
+        with self.pool.dataset(entry['path']) as ds:
+            var_data = ds[self.variable]
+            roles = _dim_roles(var_data)
+            var_data = var_data.transpose(*[roles[r] for r in ('time', 'level', 'lat', 'lon') if r in roles])
+            return np.asarray(var_data[(slice(t0, t1),) + index].values)
+    
+    def window_reader(self, bbox=None, level=None):
+        """
+        Block reader over the concatenated time axis, like _store_window_reader
+        
+        Returns:
+            tuple: (read(start, stop), window lats, window lons, levels, window slices)
+        """
+        lat_slice, lon_slices, sub_lats, sub_lons = _bbox_window(self.lats, self.lons, bbox)
+        levels = self.levels
+        level_index = ()
+        if levels:
+            index = _nearest_level_index(levels, level) if level is not None else None
+            level_index = (slice(index, index + 1) if index is not None else slice(None),)
+            if index is not None:
+                levels = [levels[index]]
+        
+        def read(start, stop):
+            blocks = []
+            for entry, t0, t1 in self._runs(start, stop):
+                parts = [self._read_file(entry, t0, t1, level_index + (lat_slice, sl)) for sl in lon_slices]
+                blocks.append(parts[0] if len(parts) == 1 else np.concatenate(parts, axis=-1))
+            return np.concatenate(blocks, axis=0)
+        
+        return read, sub_lats, sub_lons, levels, (lat_slice, lon_slices)
+    
+    def extract(self, time, level=None, bbox=None, stride=None, target_shape=None):
+        """Extract the field at the time step nearest to an ISO time"""
+        step = int(np.argmin(np.abs(self.times - np.datetime64(time, 's'))))
+        entry = self.entries[self.file_index[step]]
+        local = int(self.local_index[step])
+        
+        if entry['grid'] != self.grid:
+            level_index = ()
+            if self.levels:
+                level_index = (slice(None) if level is None else _nearest_level_index(self.levels, level),)
+            data, lats, lons = subset_field(
+                lambda ys, xs: self._read_file(entry, local, local + 1, level_index + (ys, xs))[0],
+                self.lats, self.lons, bbox, stride, target_shape
+            )
+            result = {
+                'success': True,
+                'data': data,
+                'lats': lats,
+                'lons': lons,
+                'units': self.units,
+                'description': self.description,
+                'regridded': self.regrid
+            }
+        elif self._has_store(entry):
+            result = extract_from_store(entry['storeDir'], self.variable, local, level, bbox, stride, target_shape)
+        else:
+            with self.pool.dataset(entry['path']) as ds:
+                result = extract_data_for_visualization(ds, self.variable, local, level, bbox, stride, target_shape)
+        if result['success']:
+            result.update({'time': str(self.times[step]), 'file': os.path.basename(entry['path'])})
+        return result
+    
+    def timeseries(self, points, method='nearest', level=None):
+        """
+        Point time series across every overlapping file
+        
+        Store-backed files use extract_point_timeseries; other files are
+        sampled at the nearest grid point through the dataset pool.
+        """
+        times, series = [], [[] for _ in points]
+        result = None
+        for entry, t0, t1 in self._runs(0, len(self.times)):
+            if self._has_store(entry) and entry['grid'] == self.grid:
+                store_times = np.array(load_store(entry['storeDir'])['times'], dtype='datetime64[s]')
+                part = extract_point_timeseries(
+                    entry['storeDir'], self.variable, points, method, level,
+                    start=store_times[t0], end=store_times[t1 - 1]
+                )
+                if not part['success']:
+                    return part
+            else:
+                if method != 'nearest':
+                    raise ValueError('Bilinear time series need array stores for every file on the grid')
+                iy = [int(np.argmin(np.abs(self.lats - float(p['lat'])))) for p in points]
+                point_lons = _normalize_lons(self.lons, [float(p['lon']) for p in points])
+                ix = [int(np.argmin(np.abs(self.lons - lon))) for lon in point_lons]
+                outside = _outside_grid(self.lats, self.lons, [float(p['lat']) for p in points], point_lons)
+                level_index = ()
+                if self.levels:
+                    level_index = (0 if level is None else _nearest_level_index(self.levels, level),)
+                # One read per run for every point: the rows and columns they use
+                rows, cols = sorted(set(iy)), sorted(set(ix))
+                block = self._read_file(entry, t0, t1, level_index + (rows, cols)).astype(np.float64)
+                values = [
+                    np.full(t1 - t0, np.nan) if off else block[:, rows.index(y), cols.index(x)]
+                    for y, x, off in zip(iy, ix, outside)
+                ]
+                part = {
+                    'success': True,
+                    'variable': self.variable,
+                    'units': self.units,
+                    'description': self.description,
+                    'method': method,
+                    'times': entry['times'][t0:t1],
+                    'points': [
+                        {'lat': float(p['lat']), 'lon': float(p['lon']),
+                         'gridLat': None if off else float(self.lats[y]),
+                         'gridLon': None if off else float(self.lons[x]),
+                         'outside': bool(off), 'values': _nan_to_none(v)}
+                        for p, y, x, v, off in zip(points, iy, ix, values, outside)
+                    ]
+                }
+            
+            result = result or part
+            times.extend(part['times'])
+            for acc, point in zip(series, part['points']):
+                acc.extend(point['values'])
+        
+        if result is None:
+            return {'success': False, 'error': 'No time steps in range'}
+        result = dict(result, times=times)
+        result['points'] = [dict(point, values=values) for point, values in zip(result['points'], series)]
+        result['files'] = [os.path.basename(e['path']) for e in self.entries]
+        return result
+    
+    def aggregate(self, op, freq=None, how='mean', by='month', bbox=None, mask=None, level=None,
+                  chunk_steps=DEFAULT_CHUNK_STEPS):
+        """Aggregate across files (see aggregate_store), memoized under the catalog directory"""
+        params = _aggregate_params(op, freq, how, by, bbox, level)
+        identity = {
+            'files': [[e['path'], e['timeStart'], e['timeEnd'], e['addedAt']] for e in self.entries],
+            'times': [str(self.times[0]), str(self.times[-1]), len(self.times)] if len(self.times) else None
+        }
+        if self.regrid:
+            identity['regrid'] = [self.regrid, self.grid]
+        key = aggregate_cache_key({'source': json.dumps(identity, sort_keys=True)}, self.variable, op, params, mask)
+        cache_path = os.path.join(GRIB_CATALOG_DIR, AGGREGATE_DIR, key + '.npz')
+        cached = _cached_aggregate(cache_path)
+        if cached is not None:
+            return cached
+        
+        read, lats, lons, levels, window = self.window_reader(bbox, level)
+        result = {
+            'success': True,
+            'op': op,
+            'variable': self.variable,
+            'params': params,
+            'levels': levels,
+            'units': self.units,
+            'description': self.description,
+            'files': [os.path.basename(e['path']) for e in self.entries]
+        }
+        with span('reduce'):
+            result.update(_run_aggregate(
+                read, self.times, lats, lons, levels, window, (len(self.lats), len(self.lons)),
+                op, params, how, mask, chunk_steps
+            ))
+        _save_aggregate(cache_path, result)
+        evict_aggregates(os.path.dirname(cache_path), keep=cache_path)
+        result['cached'] = False
+        return result
+
+# XYZ raster tiles rendered from per-variable multi-resolution pyramids
+TILE_SIZE = 256
+TILE_MAX_ZOOM = 18
+TILE_CACHE_SECONDS = int(os.environ.get('GRIB_TILE_CACHE_SECONDS', 86400))
+MERCATOR_MAX_LAT = 85.0511287798
+
+def build_store_pyramid(store_dir, variable, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+    Precompute 2x-coarsened block-mean levels of a variable for every time step/level
+    
+    Level 0 is the store's time layout; level k halves the resolution of
+    level k-1 until the grid fits in a single tile.
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        chunk_steps (int): Time steps processed per chunk
+        
+    Returns:
+        int: Number of pyramid levels (including level 0), or 0 if unsupported
+    """
+    # Built at ingest, so most calls (every tile miss) are a lookup that needs no lock
+    var_info = load_store(store_dir)['variables'].get(variable)
+    if var_info is not None and 'pyramid' in var_info:
+        return len(var_info['pyramid']) + 1
+    with _store_write_lock(store_dir):
+        return _build_store_pyramid(store_dir, variable, chunk_steps)
+
+def _build_store_pyramid(store_dir, variable, chunk_steps):
+    # Copy so the cached metadata isn't mutated before the new files exist
+    metadata = json.loads(json.dumps(load_store(store_dir)))
+    var_info = metadata['variables'].get(variable)
+    if var_info is None or not var_info['roles'] or 'time' not in var_info['files']:
+        return 0
+    if 'pyramid' in var_info:
+        return len(var_info['pyramid']) + 1
+    
+    os.makedirs(os.path.join(store_dir, 'pyramid'), exist_ok=True)
+    base = _array_filename(variable)[:-len('.npy')]
+    source = open_store_array(store_dir, variable, 'time')
+    levels = []
+    while max(source.shape[-2:]) > TILE_SIZE:
+        filename = os.path.join('pyramid', f"{base}.z{len(levels) + 1}.npy")
+        shape = source.shape[:-2] + tuple(-(-n // 2) for n in source.shape[-2:])
+        tmp_path = os.path.join(store_dir, filename + f".{os.getpid()}.tmp")
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+        if var_info.get('circular'):
+            # Angles can't be averaged, so take every other sample instead
+            coarsen = lambda block: block[..., ::2, ::2]
+        else:
+            coarsen = lambda block: block_mean(block, 2, 2)
+        if source.ndim > 2:
+            for start in range(0, source.shape[0], chunk_steps):
+                out[start:start + chunk_steps] = coarsen(source[start:start + chunk_steps])
+        else:
+            out[...] = coarsen(source)
+        out.flush()
+        del out
+        os.replace(tmp_path, os.path.join(store_dir, filename))
+        levels.append(filename)
+        source = np.load(os.path.join(store_dir, filename), mmap_mode='r')
+    
+    var_info['pyramid'] = levels
+    _write_store_metadata(store_dir, metadata)
+    return len(levels) + 1
+
+_colormap_luts = {}
+
+def colormap_lut(name):
+    """
+    Return a (256, 4) uint8 RGBA lookup table for a matplotlib colormap name
+    (sampled once; no figures are created)
+    """
+    if name not in _colormap_luts:
+        cmap = plt.get_cmap(name)
+        _colormap_luts[name] = cmap(np.linspace(0.0, 1.0, 256), bytes=True).astype(np.uint8)
+    return _colormap_luts[name]
+
+def apply_colormap(data, vmin, vmax, colormap='viridis'):
+    """Map a 2D field to RGBA pixels with a vectorized LUT lookup (NaN -> transparent)"""
+    lut = colormap_lut(colormap)
+    value_range = (vmax - vmin) or 1.0
+    with np.errstate(invalid='ignore'):
+        scaled = np.clip((data - vmin) / value_range * 255.0, 0, 255)
+    valid = np.isfinite(scaled)
+    rgba = lut[np.where(valid, scaled, 0).astype(np.uint8)]
+    rgba[~valid] = 0
+    return rgba
+
+def encode_png(rgba):
+    """
+    Encode an (h, w, 4) uint8 array as a PNG without PIL or matplotlib
+    
+    Returns:
+        bytes: PNG file contents
+    """
+    height, width, _ = rgba.shape
+    # Filter type 0 (None) byte at the start of every scanline
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    
+    def chunk(tag, body):
+        return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body) & 0xffffffff)
+    
+    return (
+        b'\x89PNG\r\n\x1a\n' +
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+        chunk(b'IEND', b'')
+    )
+
+def _tile_pixel_coords(z, x, y):
+    """Latitudes (rows) and longitudes (columns) of Web Mercator tile pixel centres"""
+    world = TILE_SIZE * 2 ** z
+    pixels = np.arange(TILE_SIZE) + 0.5
+    lons = (x * TILE_SIZE + pixels) / world * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y * TILE_SIZE + pixels) / world))))
+    return lats, lons
+
+def _grid_lookup(coord, values, wrap=False):
+    """Nearest grid indices for values plus a mask of values inside the grid"""
+    coord = np.asarray(coord, dtype=np.float64)
+    step = abs(coord[1] - coord[0]) if len(coord) > 1 else 1.0
+    index = np.rint(_fractional_index(coord, values, wrap=wrap)).astype(int)
+    if wrap:
+        return np.mod(index, len(coord)), np.ones(len(values), dtype=bool)
+    inside = (values >= coord.min() - step / 2) & (values <= coord.max() + step / 2)
+    return np.clip(index, 0, len(coord) - 1), inside
+
+def render_tile(store_dir, variable, t, z, x, y, level=None, colormap='viridis', vmin=None, vmax=None):
+    """
+    Render one 256x256 Web Mercator XYZ tile of a store variable as PNG
+    
+    Args:
+        store_dir (str): Store directory
+        variable (str): Variable name
+        t (int): Time step index
+        z, x, y (int): Tile coordinates
+        level (float): Pressure level (if applicable, default: first level)
+        colormap (str): Matplotlib colormap name
+        vmin, vmax (float): Colour range (default: variable min/max)
+        
+    Returns:
+        bytes: PNG image
+    """
+    n_levels = build_store_pyramid(store_dir, variable)
+    if n_levels == 0:
+        raise ValueError(f'No map data available for {variable}')
+    
+    store = load_store(store_dir)
+    var_info = store['variables'][variable]
+    lats, lons = load_store_coords(store_dir)
+    
+    # Pick the coarsest pyramid level that is still at least as fine as a tile pixel
+    degrees_per_pixel = 360.0 / (TILE_SIZE * 2 ** z)
+    grid_step = abs(float(lons[1] - lons[0])) if len(lons) > 1 else degrees_per_pixel
+    k = 0
+    while k + 1 < n_levels and grid_step * 2 ** (k + 1) <= degrees_per_pixel:
+        k += 1
+    
+    if k == 0:
+        array = open_store_array(store_dir, variable, 'time')
+    else:
+        array = np.load(os.path.join(store_dir, var_info['pyramid'][k - 1]), mmap_mode='r')
+        factor = 2 ** k
+        lats = block_mean(np.asarray(lats, dtype=np.float64)[None, :], 1, factor)[0]
+        lons = block_mean(np.asarray(lons, dtype=np.float64)[None, :], 1, factor)[0]
+    
+    index = []
+    roles = var_info['roles']
+    if 'time' in roles:
+        index.append(t)
+    if 'level' in roles:
+        index.append(0 if level is None else _nearest_level_index(store['levels'], level))
+    field = array[tuple(index)]
+    
+    # Vectorized nearest-neighbour lookup of every pixel (rows x columns)
+    pixel_lats, pixel_lons = _tile_pixel_coords(z, x, y)
+    wrap = _is_global_lon(lons)
+    iy, lat_inside = _grid_lookup(lats, pixel_lats)
+    ix, lon_inside = _grid_lookup(lons, _normalize_lons(lons, pixel_lons), wrap=wrap)
+    values = np.asarray(field[iy[:, None], ix[None, :]], dtype=np.float64)
+    values[~(lat_inside[:, None] & lon_inside[None, :])] = np.nan
+    
+    stats = var_info['stats']
+    vmin = stats['min'] if vmin is None else vmin
+    vmax = stats['max'] if vmax is None else vmax
+    return encode_png(apply_colormap(values, vmin, vmax, colormap))
+
+def tile_cache_key(store_id, store, variable, t, z, x, y, level=None, colormap='viridis', vmin=None, vmax=None):
+    """Stable ETag/cache key for a rendered tile"""
+    params = [store_id, store.get('createdAt'), variable, t, z, x, y, level, colormap, vmin, vmax]
+    return hashlib.sha1(json.dumps(params).encode()).hexdigest()
+
+def get_tile(store_id, variable, t, z, x, y, level=None, colormap='viridis', vmin=None, vmax=None):
+    """
+    Return a tile from the on-disk tile cache, rendering it on a miss
+    
+    Returns:
+        tuple: (PNG bytes, ETag)
+    """
+    store_dir = resolve_store_dir(store_id)
+    if store_dir is None:
+        raise FileNotFoundError('Store not found')
+    
+    store = load_store(store_dir)
+    if variable not in store['variables']:
+        raise ValueError(f'Unknown variable: {variable}')
+    
+    etag = tile_cache_key(store_id, store, variable, t, z, x, y, level, colormap, vmin, vmax)
+    path = os.path.join(store_dir, 'tiles', _array_filename(variable)[:-len('.npy')], etag[:2], etag + '.png')
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        count_cache('tile', True)
+        return png, etag
+    except OSError:
+        count_cache('tile', False)
+    
+    with span('render_tile'):
+        png = render_tile(store_dir, variable, t, z, x, y, level, colormap, vmin, vmax)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+    return png, etag
+
+WIND_TEXTURE_SHAPE = (180, 360)
+
+def encode_wind_texture(u, v, lats):
+    """
+    Quantize a u/v field pair into the red/green bytes of an RGBA image
+    
+    Each component is scaled linearly onto 0-255 over its own range; alpha
+    is 0 where either component is missing. Rows are flipped north-up.
+    
+    Returns:
+        tuple: (rgba uint8 array, {'uMin', 'uMax', 'vMin', 'vMax'})
+    """
+    u = np.asarray(u, dtype=np.float32)
+    v = np.asarray(v, dtype=np.float32)
+    valid = ~(np.isnan(u) | np.isnan(v))
+    rgba = np.zeros(u.shape + (4,), dtype=np.uint8)
+    scale = {}
+    for channel, (name, component) in enumerate((('u', u), ('v', v))):
+        lo = float(component[valid].min()) if valid.any() else 0.0
+        hi = float(component[valid].max()) if valid.any() else 0.0
+        value_range = hi - lo or 1.0
+        quantized = np.rint((np.where(valid, component, lo) - lo) * (255.0 / value_range))
+        rgba[..., channel] = np.clip(quantized, 0, 255)
+        scale[f'{name}Min'] = lo
+        scale[f'{name}Max'] = hi
+    rgba[..., 3] = valid * 255
+    
+    if lats is not None and len(lats) > 1 and lats[0] < lats[-1]:
+        rgba = rgba[::-1]
+    return rgba, scale
+
+def _derived_cache_dir(filepath):
+    """Derived-product directory next to a source file (or in the cache if read-only)"""
+    filepath = os.path.abspath(filepath)
+    if os.access(os.path.dirname(filepath), os.W_OK):
+        return filepath + '.' + DERIVED_DIR
+    path_hash = hashlib.sha256(filepath.encode()).hexdigest()
+    return os.path.join(GRIB_CACHE_DIR, DERIVED_DIR, path_hash)
+
+def build_wind_texture(extract, variables, pair=None, time_step=0, level=None, bbox=None, target_shape=None):
+    """
+    Build a downsampled, quantized u/v texture for client-side particle animation
+    
+    Args:
+        extract (callable): extract(name, target_shape) -> extract result
+        variables: Names available in the source
+        pair (str): u component name (default: first available wind pair)
+        time_step (int): Time step index
+        level (float): Pressure level (if applicable)
+        bbox (dict): Optional bounding box
+        target_shape (tuple): Upper bound on (height, width) (default WIND_TEXTURE_SHAPE)
+        
+    Returns:
+        dict: Result with 'png' bytes and 'metadata' describing how to decode it
+    """
+    pairs = wind_pairs(variables)
+    if pair is not None:
+        pairs = [p for p in pairs if pair in p[:2]]
+    if not pairs:
+        return {'success': False, 'error': f'No u/v wind pair available{f" for {pair}" if pair else ""}'}
+    
+    u_name, v_name = pairs[0][:2]
+    target_shape = tuple(target_shape or WIND_TEXTURE_SHAPE)
+    u = extract(u_name, target_shape)
+    if not u['success']:
+        return u
+    v = extract(v_name, target_shape)
+    if not v['success']:
+        return v
+    if np.ndim(u['data']) != 2:
+        return {'success': False, 'error': 'Select a single level for the wind texture'}
+    
+    rgba, scale = encode_wind_texture(u['data'], v['data'], u['lats'])
+    lats = np.asarray(u['lats'], dtype=np.float64)
+    lons = np.asarray(u['lons'], dtype=np.float64)
+    height, width = rgba.shape[:2]
+    return {
+        'success': True,
+        'png': encode_png(rgba),
+        'metadata': {
+            'components': [u_name, v_name],
+            'units': u['units'],
+            'width': width,
+            'height': height,
+            **scale,
+            'north': float(lats.max()),
+            'south': float(lats.min()),
+            'west': float(lons.min()),
+            'east': float(lons.max()),
+            'dx': abs(float(lons[1] - lons[0])) if width > 1 else None,
+            'dy': abs(float(lats[1] - lats[0])) if height > 1 else None,
+            'timeStep': time_step,
+            'level': level
+        }
+    }
+
+def get_wind_texture(store_dir=None, filepath=None, pair=None, time_step=0, level=None, bbox=None, target_shape=None):
+    """
+    Return a wind texture from the derived cache next to its source, building it on a miss
+    
+    Args:
+        store_dir (str): Array store to read (preferred)
+        filepath (str): GRIB/NetCDF file to read when there is no store
+        (other arguments as in build_wind_texture)
+        
+    Returns:
+        dict: build_wind_texture result plus its cache 'key'
+    """
+    if store_dir is not None:
+        store = load_store(store_dir)
+        identity = [store_dir, store.get('createdAt')]
+        cache_dir = os.path.join(store_dir, DERIVED_DIR)
+    else:
+        stat = os.stat(filepath)
+        identity = [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]
+        cache_dir = _derived_cache_dir(filepath)
+    
+    params = identity + [pair, time_step, level, bbox, list(target_shape or WIND_TEXTURE_SHAPE)]
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, 'wind', key)
+    try:
+        with open(path + '.json') as f:
+            metadata = json.load(f)
+        with open(path + '.png', 'rb') as f:
+            png = f.read()
+        count_cache('wind_texture', True)
+        return {'success': True, 'png': png, 'metadata': metadata, 'key': key}
+    except (OSError, ValueError):
+        count_cache('wind_texture', False)
+    
+    if store_dir is not None:
+        result = build_wind_texture(
+            lambda name, shape: extract_from_store(store_dir, name, time_step, level, bbox, target_shape=shape),
+            store['variables'], pair, time_step, level, bbox, target_shape
+        )
+    else:
+        with dataset_pool.dataset(filepath) as ds:
+            result = build_wind_texture(
+                lambda name, shape: extract_data_for_visualization(ds, name, time_step, level, bbox, target_shape=shape),
+                ds.data_vars, pair, time_step, level, bbox, target_shape
+            )
+    if not result['success']:
+        return result
+    
+    # PNG first, metadata last: a readable .json implies a complete texture
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    for ext, body, mode in (('.png', result['png'], 'wb'), ('.json', json.dumps(result['metadata']), 'w')):
+        with open(path + ext + suffix, mode) as f:
+            f.write(body)
+        os.replace(path + ext + suffix, path + ext)
+    result['key'] = key
+    return result
+
+# Contour lines: vectorized marching squares, cached next to the source data
+CONTOUR_DEFAULT_COUNT = 10
+CONTOUR_MAX_LEVELS = 100
+CONTOUR_SIMPLIFY_PIXELS = 1.0
+
+# Edge pairs crossed per marching-squares case. Corner bits: 1 = (i, j),
+# 2 = (i, j+1), 4 = (i+1, j+1), 8 = (i+1, j); edges: 0 = row i, 1 = column j+1,
+# 2 = row i+1, 3 = column j. Cases 16/17 are saddles 5/10 with a high centre.
+_CONTOUR_CASES = np.array([
+    [[-1, -1], [-1, -1]], [[3, 0], [-1, -1]], [[0, 1], [-1, -1]], [[3, 1], [-1, -1]],
+    [[1, 2], [-1, -1]], [[3, 0], [1, 2]], [[0, 2], [-1, -1]], [[3, 2], [-1, -1]],
+    [[2, 3], [-1, -1]], [[0, 2], [-1, -1]], [[0, 1], [2, 3]], [[1, 2], [-1, -1]],
+    [[3, 1], [-1, -1]], [[0, 1], [-1, -1]], [[3, 0], [-1, -1]], [[-1, -1], [-1, -1]],
+    [[0, 1], [2, 3]], [[3, 0], [1, 2]]
+])
+
+def _contour_segments(field, level):
+    """
+    Marching-squares segments of one level over a whole grid at once
+    
+    Returns:
+        numpy.ndarray: (n, 2) grid edge ids joined by each segment; row-edge
+            (i, j) is i * (nx - 1) + j, column-edge (i, j) is ny * (nx - 1) + i * nx + j
+    """
+    ny, nx = field.shape
+    above = field > level
+    corners = (above[:-1, :-1], above[:-1, 1:], above[1:, 1:], above[1:, :-1])
+    cases = corners[0] | (corners[1] << 1) | (corners[2] << 2) | (corners[3] << 3)
+    cases = cases.astype(np.int8)
+    
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(field[:-1, :-1] + field[:-1, 1:] + field[1:, 1:] + field[1:, :-1])
+    rows, cols = np.nonzero(valid & (cases != 0) & (cases != 15))
+    cases = cases[rows, cols].astype(np.intp)
+    
+    # Resolve saddles by the mean of the four corners
+    saddle = (cases == 5) | (cases == 10)
+    if saddle.any():
+        r, c = rows[saddle], cols[saddle]
+        centre = (field[r, c] + field[r, c + 1] + field[r + 1, c + 1] + field[r + 1, c]) / 4 > level
+        cases[np.flatnonzero(saddle)[centre]] = np.where(cases[saddle][centre] == 5, 16, 17)
+    
+    n_row_edges = ny * (nx - 1)
+    edge_ids = np.stack([
+        rows * (nx - 1) + cols,
+        n_row_edges + rows * nx + cols + 1,
+        (rows + 1) * (nx - 1) + cols,
+        n_row_edges + rows * nx + cols
+    ], axis=1)
+    
+    segments = []
+    for k in range(2):
+        pairs = _CONTOUR_CASES[cases, k]
+        used = pairs[:, 0] >= 0
+        segments.append(np.take_along_axis(edge_ids[used], pairs[used], axis=1))
+    return np.concatenate(segments)
+
+def _edge_points(field, lats, lons, edge_ids, level):
+    """Linearly interpolated (lon, lat) crossing point on each grid edge"""
+    ny, nx = field.shape
+    n_row_edges = ny * (nx - 1)
+    points = np.empty((len(edge_ids), 2))
+    
+    on_row = edge_ids < n_row_edges
+    r, c = np.divmod(edge_ids[on_row], nx - 1)
+    t = (level - field[r, c]) / (field[r, c + 1] - field[r, c])
+    points[on_row, 0] = lons[c] + t * (lons[c + 1] - lons[c])
+    points[on_row, 1] = lats[r]
+    
+    r, c = np.divmod(edge_ids[~on_row] - n_row_edges, nx)
+    t = (level - field[r, c]) / (field[r + 1, c] - field[r, c])
+    points[~on_row, 0] = lons[c]
+    points[~on_row, 1] = lats[r] + t * (lats[r + 1] - lats[r])
+    return points
+
+def _join_segments(segments):
+    """
+    Chain segments that share an edge point into polylines
+    
+    Returns:
+        list: Point-index lists; closed rings repeat their first point
+    """
+    n = len(segments)
+    ends = segments.ravel()
+    order = np.argsort(ends, kind='stable')
+    # Every edge point is shared by at most two segments
+    same = ends[order[1:]] == ends[order[:-1]]
+    partner = np.full(2 * n, -1, dtype=np.int64)
+    partner[order[:-1][same]] = order[1:][same]
+    partner[order[1:][same]] = order[:-1][same]
+    
+    ends, partner = ends.tolist(), partner.tolist()
+    visited = bytearray(n)
+    lines = []
+    
+    def walk(slot):
+        line = [ends[slot]]
+        while True:
+            segment = slot >> 1
+            visited[segment] = 1
+            out = slot ^ 1
+            line.append(ends[out])
+            slot = partner[out]
+            if slot < 0 or visited[slot >> 1]:
+                return line
+    
+    # Open lines start at an unshared end; whatever is left is a closed ring
+    for slot in np.flatnonzero(np.asarray(partner) < 0).tolist():
+        if not visited[slot >> 1]:
+            lines.append(walk(slot))
+    for segment in range(n):
+        if not visited[segment]:
+            lines.append(walk(2 * segment))
+    return lines
+
+def simplify_line(points, tolerance):
+    """
+    Douglas-Peucker simplification of an (n, 2) polyline
+    
+    Args:
+        points (numpy.ndarray): Vertices
+        tolerance (float): Maximum distance of a dropped vertex from the result
+        
+    Returns:
+        numpy.ndarray: Kept vertices (end points are always kept)
+    """
+    if not tolerance or len(points) < 3:
+        return points
+    
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = points[first + 1:last] - points[first]
+        dx, dy = points[last] - points[first]
+        norm = math.hypot(dx, dy)
+        if norm == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / norm
+        k = int(np.argmax(distance))
+        if distance[k] > tolerance:
+            split = first + 1 + k
+            keep[split] = True
+            stack.extend(((first, split), (split, last)))
+    return points[keep]
+
+def contour_lines(field, lats, lons, level, tolerance=None):
+    """
+    Isolines of one level of a 2D field
+    
+    Args:
+        field (numpy.ndarray): (lat, lon) field; NaN cells are skipped
+        lats (numpy.ndarray): Grid latitudes
+        lons (numpy.ndarray): Grid longitudes
+        level (float): Contour value
+        tolerance (float): Optional simplification tolerance in degrees
+        
+    Returns:
+        list: (n, 2) arrays of (lon, lat) vertices
+    """
+    field = np.asarray(field, dtype=np.float64)
+    if field.ndim != 2 or min(field.shape) < 2:
+        return []
+    segments = _contour_segments(field, level)
+    if len(segments) == 0:
+        return []
+    
+    edge_ids, inverse = np.unique(segments, return_inverse=True)
+    points = _edge_points(field, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), edge_ids, level)
+    lines = []
+    for line in _join_segments(inverse.reshape(segments.shape)):
+        line = simplify_line(points[line], tolerance)
+        if len(line) >= 2:
+            lines.append(line)
+    return lines
+
+def contour_levels(vmin, vmax, levels=None, count=None, interval=None):
+    """
+    Resolve contour thresholds: explicit levels, a fixed interval, or a count
+    of evenly spaced levels strictly inside [vmin, vmax]
+    """
+    if levels is not None:
+        resolved = sorted(float(v) for v in levels)
+    elif vmin is None or vmax is None or not np.isfinite([vmin, vmax]).all():
+        resolved = []
+    elif interval is not None:
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        first = math.floor(vmin / interval) * interval + interval
+        resolved = [float(v) for v in np.arange(first, vmax, interval)[:CONTOUR_MAX_LEVELS + 1]]
+    else:
+        count = int(count or CONTOUR_DEFAULT_COUNT)
+        resolved = [float(v) for v in np.linspace(vmin, vmax, count + 2)[1:-1]]
+    if len(resolved) > CONTOUR_MAX_LEVELS:
+        raise ValueError(f'At most {CONTOUR_MAX_LEVELS} contour levels are supported')
+    return resolved
+
+def contour_tolerance(zoom):
+    """Simplification tolerance in degrees for a Web Mercator zoom (None: exact)"""
+    if zoom is None:
+        return None
+    return CONTOUR_SIMPLIFY_PIXELS * 360.0 / (TILE_SIZE * 2 ** int(zoom))
+
+def encode_contours_geojson(contours, variable, units, decimals=5):
+    """GeoJSON FeatureCollection with one MultiLineString feature per level"""
+    return json.dumps({
+        'type': 'FeatureCollection',
+        'variable': variable,
+        'units': units,
+        'levels': [level for level, _ in contours],
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'MultiLineString',
+                    'coordinates': [np.round(line, decimals).tolist() for line in lines]
+                },
+                'properties': {'level': level, 'units': units}
+            }
+            for level, lines in contours
+        ]
+    }, separators=(',', ':')).encode()
+
+def encode_contours_binary(contours, variable, units):
+    """
+    Compact binary polylines
+    
+    Layout: uint32 little-endian header length, UTF-8 JSON header (levels
+    with their line counts), uint32 vertex count of every line, then all
+    vertices as little-endian float32 (lon, lat) pairs, level by level.
+    """
+    lines = [line for _, level_lines in contours for line in level_lines]
+    header = json.dumps({
+        'variable': variable,
+        'units': units,
+        'byteOrder': 'little',
+        'levels': [{'level': level, 'lines': len(level_lines)} for level, level_lines in contours],
+        'lineCount': len(lines),
+        'vertexCount': int(sum(len(line) for line in lines))
+    }, separators=(',', ':')).encode()
+    counts = np.array([len(line) for line in lines], dtype='<u4')
+    vertices = np.concatenate(lines).astype('<f4') if lines else np.empty((0, 2), dtype='<f4')
+    return struct.pack('<I', len(header)) + header + counts.tobytes() + vertices.tobytes()
+
+def get_contours(store_dir=None, filepath=None, variable=None, time_step=0, level=None, bbox=None,
+                 levels=None, count=None, interval=None, zoom=None, fmt='geojson'):
+    """
+    Contour one field, serving repeats from the derived cache next to its source
+    
+    The field is extracted at roughly one grid cell per pixel of the zoom
+    level, contoured at every threshold and simplified to a sub-pixel tolerance.
+    
+    Args:
+        store_dir (str): Array store to read (preferred)
+        filepath (str): GRIB/NetCDF file to read when there is no store
+        variable (str): Variable name
+        time_step (int): Time step index
+        level (float): Pressure level (if applicable)
+        bbox (dict): Optional bounding box
+        levels (list): Explicit thresholds
+        count (int): Number of evenly spaced thresholds (default CONTOUR_DEFAULT_COUNT)
+        interval (float): Threshold spacing
+        zoom (int): Web Mercator zoom driving resolution and simplification
+        fmt (str): 'geojson' or 'binary'
+        
+    Returns:
+        dict: Result with the encoded 'body', its 'key' and whether it was 'cached'
+    """
+    if fmt not in ('geojson', 'binary'):
+        raise ValueError("format must be 'geojson' or 'binary'")
+    if zoom is not None and not 0 <= int(zoom) <= TILE_MAX_ZOOM:
+        raise ValueError(f'zoom must be between 0 and {TILE_MAX_ZOOM}')
+    
+    if store_dir is not None:
+        store = load_store(store_dir)
+        identity = [store_dir, store.get('createdAt')]
+        cache_dir = os.path.join(store_dir, DERIVED_DIR)
+    else:
+        stat = os.stat(filepath)
+        identity = [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]
+        cache_dir = _derived_cache_dir(filepath)
+    
+    params = identity + [variable, time_step, level, bbox, levels, count, interval, zoom]
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, 'contours', f"{key}.{'geojson' if fmt == 'geojson' else 'bin'}")
+    try:
+        with open(path, 'rb') as f:
+            body = f.read()
+        count_cache('contours', True)
+        return {'success': True, 'body': body, 'key': key, 'cached': True}
+    except OSError:
+        count_cache('contours', False)
+    
+    # No point resolving the grid finer than the pixels it will be drawn on
+    target_shape = None
+    if zoom is not None:
+        lat_span = (bbox['north'] - bbox['south']) if bbox else 180.0
+        lon_span = ((bbox['east'] - bbox['west']) % 360 or 360.0) if bbox else 360.0
+        world = TILE_SIZE * 2 ** int(zoom)
+        target_shape = (max(2, math.ceil(world * lat_span / 360.0)), max(2, math.ceil(world * lon_span / 360.0)))
+    
+    if store_dir is not None:
+        result = extract_from_store(store_dir, variable, time_step, level, bbox, target_shape=target_shape)
+    else:
+        result = None
+        if is_grib_file(filepath):
+            result = extract_slice_from_index(filepath, variable, time_step, level, bbox, target_shape=target_shape)
+        if result is None:
+            with dataset_pool.dataset(filepath) as ds:
+                result = extract_data_for_visualization(ds, variable, time_step, level, bbox, target_shape=target_shape)
+    if not result['success']:
+        return result
+    
+    field = np.asarray(result['data'], dtype=np.float64)
+    if field.ndim != 2:
+        return {'success': False, 'error': 'Select a single level to contour'}
+    
+    finite = field[np.isfinite(field)]
+    thresholds = contour_levels(
+        float(finite.min()) if finite.size else None,
+        float(finite.max()) if finite.size else None,
+        levels, count, interval
+    )
+    tolerance = contour_tolerance(zoom)
+    with span('contour'):
+        contours = [
+            (threshold, contour_lines(field, result['lats'], result['lons'], threshold, tolerance))
+            for threshold in thresholds
+        ]
+    
+    if fmt == 'geojson':
+        # Round to about a tenth of the simplification tolerance
+        decimals = 5 if tolerance is None else min(6, max(1, math.ceil(-math.log10(tolerance)) + 1))
+        body = encode_contours_geojson(contours, variable, result['units'], decimals)
+    else:
+        body = encode_contours_binary(contours, variable, result['units'])
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return {'success': True, 'body': body, 'key': key, 'cached': False}
+
+class DatasetPool:
+    """
+    Bounded, thread-safe LRU pool of open xarray datasets
+    
+    Datasets are keyed by (path, mtime) so a rewritten file is reopened
+    instead of serving a stale cfgrib index. Evicted datasets are closed
+    once the last borrower releases them.
+    """
+    
+    def __init__(self, max_size=GRIB_POOL_SIZE, opener=None):
+        self.max_size = max_size
+        self._opener = opener or open_source_dataset
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @contextmanager
+    def dataset(self, filepath):
+        """
+        Borrow an open dataset for the duration of a with-block
+        
+        Args:
+            filepath (str): Path to the data file
+        """
+        entry = self._acquire(filepath)
+        try:
+            yield entry['ds']
+        finally:
+            self._release(entry)
+    
+    def _acquire(self, filepath):
+        path = os.path.realpath(filepath)
+        key = (path, os.stat(path).st_mtime_ns)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                entry['refs'] += 1
+                count_cache('dataset_pool', True)
+                return entry
+            self.misses += 1
+        count_cache('dataset_pool', False)
+        
+        # Open outside the lock so slow cfgrib indexing doesn't block other files
+        with span('open'):
+            ds = self._opener(path)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Another thread opened the same file meanwhile
+                ds.close()
+                entry['refs'] += 1
+                return entry
+            
+            # Drop handles for older versions of the same file
+            for stale_key in [k for k in self._entries if k[0] == path]:
+                self._evict(stale_key)
+            
+            entry = {'ds': ds, 'refs': 1, 'evicted': False}
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+            return entry
+    
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        entry['evicted'] = True
+        self.evictions += 1
+        if entry['refs'] == 0:
+            entry['ds'].close()
+    
+    def _release(self, entry):
+        with self._lock:
+            entry['refs'] -= 1
+            close = entry['evicted'] and entry['refs'] == 0
+        if close:
+            entry['ds'].close()
+    
+    def close_all(self):
+        """Evict and close every pooled dataset"""
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+    
+    def stats(self):
+        """Return pool size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared pool used by the extract endpoint
+dataset_pool = DatasetPool()
+
+if __name__ == "__main__":
+    # Example usage for your specific GRIB file (or a path given on the command line)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    grib_file = args[0] if args else "6b909394d57791d45411e9d872774061.grib"
+    
+    # Check if file exists in current directory
+    if os.path.exists(grib_file):
+        analyze_grib_file(grib_file, render_all_frames='--frames' in sys.argv)
+    else:
+        print(f"GRIB file not found: {grib_file}")
+        print("Please ensure the file is in the current directory or provide the full path.")
+        
+        # Example of how to use with a different path
+        print("\nExample usage:")
+        print(f"python {__file__} /path/to/your/grib/file.grib")
+        print(f"python {__file__} /path/to/your/grib/file.grib --frames  # render every time step in parallel")
+
+# Example API endpoint for Flask integration
+def create_grib_api_endpoint(app):
+    """
+    Register the GRIB file processing endpoints on a Flask app
+    (cds-api-service.py calls this with its app)
+    """
+    from flask import request, jsonify, Response
+    
+    install_request_metrics(app)
+    
+    def field_response(result, options):
+        """Return an extract result as JSON or, if requested, as a binary array"""
+        if not result['success']:
+            return jsonify(result), 400
+        
+        wants_binary = (
+            options.get('format') == 'binary' or
+            request.accept_mimetypes.best == 'application/octet-stream'
+        )
+        if not wants_binary:
+            with span('serialize'):
+                return jsonify(field_result_to_json(result))
+        
+        with span('serialize'):
+            body, encoding = build_binary_field_body(
+                result,
+                dtype=options.get('dtype', 'float32'),
+                compression=options.get('compression')
+            )
+        headers = {
+            'X-Array-Dtype': encoding['dtype'],
+            'X-Array-Shape': ','.join(str(n) for n in encoding['shape']),
+            'X-Header-Length': str(len(body[0]) - 4)
+        }
+        if encoding['scale'] is not None:
+            headers.update({
+                'X-Array-Scale': repr(encoding['scale']),
+                'X-Array-Offset': repr(encoding['offset']),
+                'X-Array-Nodata': str(encoding['nodata'])
+            })
+        if encoding['compression']:
+            headers['X-Array-Compression'] = encoding['compression']
+        return Response(body, mimetype='application/octet-stream', headers=headers)
+    
+    @app.route('/api/grib/parse', methods=['POST'])
+    def parse_grib_endpoint():
+        try:
+            # Get uploaded file
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file provided'}), 400
+            
+            file = request.files['file']
+            if file.filename == '' or not file.filename.endswith(('.grib', '.grib2')):
+                return jsonify({'error': 'Invalid GRIB file'}), 400
+            
+            # Stream into the content-addressed ingest store; repeat uploads are found by hash
+            record, created = ingest_upload(file.stream, file.filename)
+            for _ in range(2):
+                if record['status'] in ('queued', 'parsing'):
+                    # This endpoint stays synchronous: wait for the background parse
+                    record = queue_ingest(record['id']).result()
+                
+                if record['status'] != 'completed':
+                    return jsonify({
+                        'success': False,
+                        'error': record['error']
+                    }), 500
+                
+                metadata = get_cached_parse(record['id'])
+                if metadata is not None:
+                    break
+                # The parse cache evicted the result after the ingest completed: parse again
+                record = _resume_ingest(record)
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': 'Parse result was evicted before it could be read'
+                }), 500
+            
+            metadata['filename'] = file.filename
+            return jsonify({
+                'success': True,
+                'metadata': metadata,
+                'fileHash': record['id'],
+                'cached': not created
+            })
+            
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @app.route('/api/grib/ingest', methods=['POST'])
+    def grib_ingest():
+        """Stream an upload into the ingest store and queue parsing in the background"""
+        try:
+            # Raw bodies are read straight off the socket and checked as they arrive;
+            # multipart bodies are received and spooled in full by Werkzeug first
+            file = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+            if file is not None:
+                stream, filename = file.stream, file.filename
+            else:
+                stream = request.stream
+                filename = request.args.get('filename') or request.headers.get('X-Filename')
+            
+            record, created = ingest_upload(stream, filename)
+            status = 202 if record['status'] in ('queued', 'parsing') else 200
+            return jsonify({'success': True, **record, 'existing': not created}), status
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/ingest/<file_hash>', methods=['GET'])
+    def grib_ingest_status(file_hash):
+        """Status of an ingest, with the parsed metadata once it has completed"""
+        record = load_ingest(file_hash)
+        if record is None:
+            return jsonify({'success': False, 'error': 'Ingest not found'}), 404
+        
+        touch_ingest(file_hash)
+        record = _resume_ingest(record)
+        response = {'success': True, **record}
+        if record['status'] == 'completed':
+            response['metadata'] = get_cached_parse(file_hash)
+        return jsonify(response)
+    
+    @app.route('/api/grib/extract', methods=['POST'])
+    def extract_grib_data():
+        """Extract specific variable/time data from GRIB file"""
+        try:
+            data = request.json
+            filepath = data.get('filepath')
+            variable = data.get('variable')
+            time_step = data.get('timeStep', 0)
+            level = data.get('level')
+            subset = {
+                'bbox': parse_bbox(data.get('bbox')),
+                'stride': data.get('stride'),
+                'target_shape': data.get('targetShape')
+            }
+            
+            # Converted stores (ERA5 jobs, cached uploads) are read via memory maps
+            if data.get('storeId'):
+                store_dir = resolve_store_dir(data['storeId'])
+                if store_dir is None:
+                    return jsonify({'success': False, 'error': 'Store not found'}), 404
+                result = extract_from_store(store_dir, variable, time_step, level, **subset)
+            else:
+                # Decode just the one GRIB message holding the slice when possible
+                result = None
+                if is_grib_file(filepath):
+                    result = extract_slice_from_index(filepath, variable, time_step, level, **subset)
+                
+                if result is None:
+                    # Borrow a pooled dataset so repeated requests reuse one decoded index
+                    with dataset_pool.dataset(filepath) as ds:
+                        # Extract data
+                        result = extract_data_for_visualization(ds, variable, time_step, level, **subset)
+            
+            return field_response(result, data)
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/pool', methods=['GET'])
+    def grib_pool_stats():
+        """Report dataset handle pool usage"""
+        return jsonify(dataset_pool.stats())
+    
+    @app.route('/api/grib/store/<store_id>', methods=['GET'])
+    def grib_store_metadata(store_id):
+        """Describe a converted array store, including per-variable statistics"""
+        store_dir = resolve_store_dir(store_id)
+        if store_dir is None:
+            return jsonify({'error': 'Store not found'}), 404
+        return jsonify(load_store(store_dir))
+    
+    @app.route('/api/grib/tiles/<store_id>/<variable>/<int:t>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+    def grib_tile(store_id, variable, t, z, x, y):
+        """Serve a colormapped Web Mercator XYZ tile of one time step"""
+        try:
+            if not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                return jsonify({'error': 'Tile out of range'}), 400
+            
+            level = request.args.get('level', type=float)
+            vmin = request.args.get('vmin', type=float)
+            vmax = request.args.get('vmax', type=float)
+            colormap = request.args.get('colormap', 'viridis')
+            if colormap not in plt.colormaps():
+                return jsonify({'error': f'Unknown colormap: {colormap}'}), 400
+            
+            png, etag = get_tile(store_id, variable, t, z, x, y, level, colormap, vmin, vmax)
+            headers = {'Cache-Control': f'public, max-age={TILE_CACHE_SECONDS}'}
+            if etag in request.if_none_match:
+                return Response(status=304, headers={**headers, 'ETag': f'"{etag}"'})
+            
+            response = Response(png, mimetype='image/png', headers=headers)
+            response.set_etag(etag)
+            return response
+            
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        except (ValueError, IndexError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @app.route('/api/grib/wind-texture', methods=['POST'])
+    def grib_wind_texture():
+        """Quantized u/v texture (PNG) and decode metadata for wind particle animation"""
+        try:
+            data = request.json
+            store_dir = None
+            if data.get('storeId'):
+                store_dir = resolve_store_dir(data['storeId'])
+                if store_dir is None:
+                    return jsonify({'success': False, 'error': 'Store not found'}), 404
+            elif not data.get('filepath') or not os.path.exists(data['filepath']):
+                return jsonify({'success': False, 'error': 'File not found'}), 404
+            
+            result = get_wind_texture(
+                store_dir=store_dir,
+                filepath=data.get('filepath'),
+                pair=data.get('pair'),
+                time_step=int(data.get('timeStep', 0)),
+                level=data.get('level'),
+                bbox=parse_bbox(data.get('bbox')),
+                target_shape=data.get('targetShape')
+            )
+            if not result['success']:
+                return jsonify(result), 400
+            
+            if data.get('format') == 'png':
+                response = Response(result['png'], mimetype='image/png', headers={
+                    'X-Texture-Metadata': json.dumps(result['metadata'])
+                })
+                response.set_etag(result['key'])
+                return response
+            
+            return jsonify({
+                'success': True,
+                **result['metadata'],
+                'texture': 'data:image/png;base64,' + base64.b64encode(result['png']).decode('ascii')
+            })
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/contours', methods=['POST'])
+    def grib_contours():
+        """Isolines of one field as GeoJSON or compact binary polylines"""
+        try:
+            data = request.json
+            store_dir = None
+            if data.get('storeId'):
+                store_dir = resolve_store_dir(data['storeId'])
+                if store_dir is None:
+                    return jsonify({'success': False, 'error': 'Store not found'}), 404
+            elif not data.get('filepath') or not os.path.exists(data['filepath']):
+                return jsonify({'success': False, 'error': 'File not found'}), 404
+            
+            fmt = data.get('format', 'geojson')
+            result = get_contours(
+                store_dir=store_dir,
+                filepath=data.get('filepath'),
+                variable=data.get('variable'),
+                time_step=int(data.get('timeStep', 0)),
+                level=data.get('level'),
+                bbox=parse_bbox(data.get('bbox')),
+                levels=data.get('levels'),
+                count=data.get('count'),
+                interval=data.get('interval'),
+                zoom=data.get('zoom'),
+                fmt=fmt
+            )
+            if not result['success']:
+                return jsonify(result), 400
+            
+            mimetype = 'application/geo+json' if fmt == 'geojson' else 'application/octet-stream'
+            response = Response(result['body'], mimetype=mimetype)
+            response.set_etag(result['key'])
+            return response
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/aggregate', methods=['POST'])
+    def grib_aggregate():
+        """Resample, climatology or area-mean aggregation of a store variable"""
+        try:
+            data = request.json
+            store_dir = resolve_store_dir(data.get('storeId'))
+            if store_dir is None:
+                return jsonify({'success': False, 'error': 'Store not found'}), 404
+            
+            result = aggregate_store(
+                store_dir,
+                data.get('variable'),
+                data.get('op'),
+                freq=data.get('freq'),
+                how=data.get('how', 'mean'),
+                by=data.get('by', 'month'),
+                bbox=parse_bbox(data.get('bbox')),
+                mask=data.get('mask'),
+                level=data.get('level')
+            )
+            if not result['success']:
+                return jsonify(result), 400
+            return jsonify(field_result_to_json(result))
+            
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/anomaly', methods=['POST'])
+    def grib_anomaly():
+        """Anomaly field (timeStep) or area-mean anomaly series against the climatology baseline"""
+        try:
+            data = request.json
+            store_dir = resolve_store_dir(data.get('storeId'))
+            if store_dir is None:
+                return jsonify({'success': False, 'error': 'Store not found'}), 404
+            
+            result = compute_anomaly(
+                store_dir,
+                data.get('variable'),
+                by=data.get('by', 'dayofyear'),
+                time_step=data.get('timeStep'),
+                start=data.get('start'),
+                end=data.get('end'),
+                level=data.get('level'),
+                bbox=parse_bbox(data.get('bbox'))
+            )
+            if not result['success']:
+                return jsonify(result), 400
+            if data.get('timeStep') is not None:
+                return field_response(result, data)
+            return jsonify(field_result_to_json(result))
+            
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/regrid', methods=['POST'])
+    def grib_regrid():
+        """Remap a store variable onto another store's grid or a regular grid"""
+        try:
+            data = request.json
+            store_dir = resolve_store_dir(data.get('storeId'))
+            if store_dir is None:
+                return jsonify({'success': False, 'error': 'Store not found'}), 404
+            
+            if data.get('targetStoreId'):
+                target_dir = resolve_store_dir(data['targetStoreId'])
+                if target_dir is None:
+                    return jsonify({'success': False, 'error': 'Target store not found'}), 404
+                dst_lats, dst_lons = load_store_coords(target_dir)
+            elif data.get('resolution'):
+                bbox = parse_bbox(data.get('bbox'))
+                if bbox is None:
+                    lats, lons = load_store_coords(store_dir)
+                    if _is_global_lon(lons):
+                        # Snap the full circle to the new spacing instead of trimming it
+                        dst_lats, dst_lons = common_grid([(lats, lons)], data['resolution'])
+                    else:
+                        bbox = {'north': float(np.max(lats)), 'south': float(np.min(lats)),
+                                'west': float(lons[0]), 'east': float(lons[-1])}
+                if bbox is not None:
+                    dst_lats, dst_lons = regular_grid(bbox, data['resolution'])
+            else:
+                return jsonify({'success': False, 'error': 'Provide targetStoreId or resolution'}), 400
+            
+            time_steps = data.get('timeSteps')
+            if time_steps is None:
+                time_steps = [data.get('timeStep', 0)]
+            result = regrid_store(
+                store_dir,
+                data.get('variable'),
+                dst_lats,
+                dst_lons,
+                method=data.get('method', 'bilinear'),
+                time_steps=time_steps,
+                level=data.get('level')
+            )
+            if result['success'] and 'timeSteps' not in data:
+                result['data'] = result['data'][0]
+                result['time'] = result.pop('times')[0]
+            return field_response(result, data)
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/catalog', methods=['GET'])
+    def grib_catalog():
+        """List cataloged files, optionally filtered by variable, time range and bbox"""
+        try:
+            bbox = request.args.get('bbox')
+            entries = get_catalog().find(
+                variable=request.args.get('variable'),
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                bbox=parse_bbox(bbox.split(',')) if bbox else None,
+                with_times=False
+            )
+            for entry in entries:
+                del entry['times']
+            return jsonify({'success': True, 'files': entries})
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/catalog/<query>', methods=['POST'])
+    def grib_catalog_query(query):
+        """Run extract, timeseries or aggregate over every cataloged file holding a variable"""
+        if query not in ('extract', 'timeseries', 'aggregate'):
+            return jsonify({'success': False, 'error': f'Unknown query: {query}'}), 404
+        
+        try:
+            data = request.json
+            bbox = parse_bbox(data.get('bbox'))
+            
+            if query == 'extract':
+                # Only the files around the requested time, unclipped so the nearest step can match
+                virtual = VirtualDataset(
+                    data.get('variable'), data.get('time'), data.get('time'), bbox, clip=False,
+                    regrid=data.get('regrid')
+                )
+            else:
+                virtual = VirtualDataset(
+                    data.get('variable'), data.get('start'), data.get('end'),
+                    bbox if query == 'aggregate' else None, regrid=data.get('regrid')
+                )
+            
+            if query == 'extract':
+                result = virtual.extract(
+                    data.get('time'),
+                    level=data.get('level'),
+                    bbox=bbox,
+                    stride=data.get('stride'),
+                    target_shape=data.get('targetShape')
+                )
+                return field_response(result, data)
+            
+            if query == 'timeseries':
+                points = data.get('points')
+                if points is None and 'lat' in data and 'lon' in data:
+                    points = [{'lat': data['lat'], 'lon': data['lon']}]
+                if not points:
+                    return jsonify({'success': False, 'error': 'No points provided'}), 400
+                result = virtual.timeseries(points, method=data.get('method', 'nearest'), level=data.get('level'))
+                return jsonify(result), 200 if result['success'] else 400
+            
+            result = virtual.aggregate(
+                data.get('op'),
+                freq=data.get('freq'),
+                how=data.get('how', 'mean'),
+                by=data.get('by', 'month'),
+                bbox=bbox,
+                mask=data.get('mask'),
+                level=data.get('level')
+            )
+            return jsonify(field_result_to_json(result))
+            
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/api/grib/timeseries', methods=['POST'])
+    def grib_timeseries():
+        """Sample a variable at one or more points across all time steps"""
+        try:
+            data = request.json
+            store_dir = resolve_store_dir(data.get('storeId'))
+            if store_dir is None:
+                return jsonify({'success': False, 'error': 'Store not found'}), 404
+            
+            points = data.get('points')
+            if points is None and 'lat' in data and 'lon' in data:
+                points = [{'lat': data['lat'], 'lon': data['lon']}]
+            if not points:
+                return jsonify({'success': False, 'error': 'No points provided'}), 400
+            
+            result = extract_point_timeseries(
+                store_dir,
+                data.get('variable'),
+                points,
+                method=data.get('method', 'nearest'),
+                level=data.get('level'),
+                start=data.get('start'),
+                end=data.get('end')
+            )
+            return jsonify(result), 200 if result['success'] else 400
             
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
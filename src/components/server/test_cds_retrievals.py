@@ -0,0 +1,271 @@
+"""
+Tests for CDS retrieval scheduling and transports
+
+Run with: python -m pytest src/components/server/test_cds_retrievals.py
+No CDS account or Redis is needed: jobs go to a temporary SQLite store and
+retrievals to FakeCDSTransport or a fake CDS HTTP server on localhost.
+"""
+
+import base64
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix='cds_tests_')
+os.environ.update({
+    'ERA5_CACHE_DIR': os.path.join(_workdir, 'era5_cache'),
+    'JOB_STORE_URL': f"sqlite:///{os.path.join(_workdir, 'jobs.db')}",
+    'JOB_EVENTS_URL': 'local',
+    'GRIB_CACHE_DIR': os.path.join(_workdir, 'grib_cache'),
+    'GRIB_CATALOG_DIR': os.path.join(_workdir, 'catalog'),
+    'METRICS_DIR': os.path.join(_workdir, 'metrics'),
+})
+
+_spec = importlib.util.spec_from_file_location(
+    'cds_api_service', os.path.join(os.path.dirname(__file__), 'cds-api-service.py')
+)
+cds = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(cds)
+
+AREA = {'north': 2, 'west': 0, 'south': 0, 'east': 3}
+
+def blocked_scheduler(**kwargs):
+    """A one-slot scheduler whose slot is held until the returned event is set"""
+    scheduler = cds.RetrievalScheduler(max_concurrency=1, **kwargs)
+    release = threading.Event()
+    started = threading.Event()
+    
+    def hold():
+        started.set()
+        release.wait(5)
+        return 'held'
+    
+    holder = scheduler.submit(hold, 'holder')
+    assert started.wait(5)
+    return scheduler, release, holder
+
+def test_free_slots_go_to_users_in_turn():
+    scheduler, release, holder = blocked_scheduler()
+    order = []
+    
+    def job(name):
+        return lambda: order.append(name) or name
+    
+    futures = [scheduler.submit(job(f"alice-{i}"), 'alice') for i in range(3)]
+    futures += [scheduler.submit(job(f"bob-{i}"), 'bob') for i in range(2)]
+    release.set()
+    
+    assert holder.result(5) == 'held'
+    assert [f.result(5) for f in futures] == ['alice-0', 'alice-1', 'alice-2', 'bob-0', 'bob-1']
+    assert order == ['alice-0', 'bob-0', 'alice-1', 'bob-1', 'alice-2']
+
+def test_failed_attempts_back_off_exponentially():
+    scheduler = cds.RetrievalScheduler(max_concurrency=1, retries=3, retry_delay=0.1)
+    attempts, reported = [], []
+    
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise RuntimeError('temporary failure')
+        return 'done'
+    
+    assert scheduler.submit(flaky, 'alice', reported.append).result(5) == 'done'
+    assert reported == [1, 2, 3]
+    gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+    assert gaps[0] >= 0.1
+    assert gaps[1] >= 0.2
+
+def test_last_error_is_raised_once_retries_run_out():
+    scheduler = cds.RetrievalScheduler(max_concurrency=1, retries=2, retry_delay=0.01)
+    calls = []
+    
+    def failing():
+        calls.append(1)
+        raise RuntimeError(f"failure {len(calls)}")
+    
+    with pytest.raises(RuntimeError, match='failure 2'):
+        scheduler.submit(failing).result(5)
+    assert len(calls) == 2
+
+def test_progress_callback_errors_do_not_fail_the_retrieval():
+    scheduler = cds.RetrievalScheduler(max_concurrency=1, retries=1)
+    
+    def broken_progress(attempt):
+        raise ValueError('task_id must not be empty')
+    
+    assert scheduler.submit(lambda: 'done', 'alice', broken_progress).result(5) == 'done'
+
+def test_cancelled_retrievals_never_run():
+    scheduler, release, holder = blocked_scheduler()
+    ran = []
+    
+    cancelled = scheduler.submit(lambda: ran.append('cancelled'), 'alice')
+    kept = scheduler.submit(lambda: ran.append('kept') or 'kept', 'alice')
+    assert cancelled.cancel()
+    release.set()
+    
+    assert kept.result(5) == 'kept'
+    with pytest.raises(CancelledError):
+        cancelled.result(5)
+    assert ran == ['kept']
+
+def test_concurrency_is_bounded():
+    scheduler = cds.RetrievalScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+    
+    def work():
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.02)
+        with lock:
+            state['active'] -= 1
+    
+    futures = [scheduler.submit(work, f"user-{i % 3}") for i in range(9)]
+    for future in futures:
+        future.result(5)
+    assert state['peak'] == 2
+
+@pytest.fixture
+def fake_transport(monkeypatch):
+    monkeypatch.setattr(cds, '_cds_transport', None)
+    monkeypatch.setattr(cds, 'retrieval_scheduler', cds.RetrievalScheduler(max_concurrency=2, retries=2, retry_delay=0.01))
+    transport = cds.FakeCDSTransport(latency=0.01, failures=1)
+    cds.set_cds_transport(transport)
+    return transport
+
+def test_download_through_fake_transport(fake_transport, monkeypatch):
+    # A real result backend, so progress reported from scheduler threads needs the task id
+    monkeypatch.setattr(cds.celery.conf, 'result_backend', 'cache+memory://')
+    monkeypatch.setattr(cds.convert_era5_to_store, 'delay', lambda *args: None)
+    request_data = {
+        'dataset': 'reanalysis-era5-single-levels',
+        'productType': 'reanalysis',
+        'variables': ['2m_temperature', 'total_precipitation'],
+        'dateStart': '2024-01-30',
+        'dateEnd': '2024-02-02',
+        'timeRange': ['00:00', '12:00'],
+        'area': AREA,
+        'format': 'netcdf',
+        'userId': 'alice',
+    }
+    job_id = str(uuid.uuid4())
+    cds.job_store.create({
+        'id': job_id, 'status': 'queued', 'userId': 'alice', 'request': request_data,
+        'createdAt': datetime.utcnow().isoformat()
+    })
+    
+    result = cds.download_era5_data.apply((job_id, request_data), task_id=str(uuid.uuid4()))
+    assert result.successful(), result.result
+    
+    job = cds.job_store.get(job_id)
+    assert job['status'] == 'completed'
+    assert [c['attempts'] for c in job['chunks']] == [2, 2, 2, 2]
+    # Two months by two variables, each failing once before succeeding
+    assert len(fake_transport.calls) == 8
+    assert fake_transport.max_active <= 2
+    
+    ds = cds.grib_parser.xr.open_dataset(job['filepath'])
+    try:
+        assert ds.sizes['valid_time'] == 8
+        assert set(ds.data_vars) == {'2m_temperature', 'total_precipitation'}
+    finally:
+        ds.close()
+
+class FakeCDSHandler(BaseHTTPRequestHandler):
+    """Just enough of the legacy CDS API for cdsapi: submit, poll, download and status"""
+    protocol_version = 'HTTP/1.1'
+    payload = b'GRIB' + b'\0' * 1024
+    
+    def log_message(self, *args):
+        pass
+    
+    def reply(self, code, body, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path.endswith('/status.json'):
+            return self.reply(200, {'info': []})
+        if '/tasks/' in self.path:
+            request_id = self.path.rsplit('/', 1)[1]
+            return self.reply(200, {
+                'state': 'completed',
+                'request_id': request_id,
+                'location': f"/download/{request_id}",
+                'content_length': len(self.payload),
+                'content_type': 'application/x-grib'
+            })
+        if self.path.startswith('/download/'):
+            return self.reply(200, self.payload, 'application/octet-stream')
+        self.reply(404, {'message': 'Not found'})
+    
+    def do_DELETE(self):
+        self.reply(200, {})
+    
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        self.rfile.read(int(self.headers['Content-Length']))
+        credentials = base64.b64decode(self.headers['Authorization'].split()[1]).decode()
+        if credentials.endswith(':bad'):
+            return self.reply(401, {'message': 'Authentication failed'})
+        self.reply(200, {'state': 'queued', 'request_id': uuid.uuid4().hex})
+
+@pytest.fixture
+def fake_cds_server(monkeypatch):
+    monkeypatch.setattr(cds, '_cds_transport', None)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCDSHandler)
+    server.daemon_threads = True
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    cds.reset_cds_status()
+
+def test_cdsapi_transport_against_fake_server(fake_cds_server, tmp_path):
+    url = f"http://127.0.0.1:{fake_cds_server.server_port}/api/v2"
+    transport = cds.CdsapiTransport(url=url, key='123:secret', pool_size=2)
+    cds.set_cds_transport(transport)
+    
+    status = cds.check_cds_connection()
+    assert status['connected'] and status['api_key_status'] == 'unverified'
+    assert cds.check_cds_connection()['cached']
+    
+    request = cds.build_cds_request({
+        'productType': 'reanalysis', 'variables': ['2m_temperature'], 'dateStart': '2024-01-01',
+        'dateEnd': '2024-01-31', 'area': AREA, 'format': 'grib'
+    })
+    for i in range(5):
+        target = tmp_path / f"chunk-{i}.grib"
+        transport.retrieve('reanalysis-era5-single-levels', request, str(target))
+        assert target.read_bytes() == FakeCDSHandler.payload
+    # Pooled clients share one session, so connections are reused across retrievals
+    assert len(fake_cds_server.connections) < 5
+
+def test_cdsapi_transport_rejected_key(fake_cds_server, tmp_path):
+    url = f"http://127.0.0.1:{fake_cds_server.server_port}/api/v2"
+    transport = cds.CdsapiTransport(url=url, key='123:bad')
+    request = cds.build_cds_request({
+        'productType': 'reanalysis', 'variables': ['2m_temperature'], 'dateStart': '2024-01-01',
+        'dateEnd': '2024-01-01', 'area': AREA, 'format': 'grib'
+    })
+    with pytest.raises(Exception, match='Authentication failed'):
+        transport.retrieve('reanalysis-era5-single-levels', request, str(tmp_path / 'rejected.grib'))